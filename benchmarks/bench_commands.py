@@ -0,0 +1,109 @@
+"""Measure the throughput of the cvs_* commands against a local mock server.
+
+Example:
+    python benchmarks/bench_commands.py --num_images 1000 --latency 0.05 --throttle_rate 0.01
+"""
+import argparse
+import contextlib
+import functools
+import importlib
+import json
+import multiprocessing
+import os
+import pathlib
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from mock_server import IC_DOMAIN_ID, OD_DOMAIN_ID, MockCustomVisionServer  # noqa: E402
+from synthetic import generate_dataset  # noqa: E402
+
+
+def _run_command(name, kwargs, queue):
+    """Runs a command in a child process so that the peak RSS is measured per command."""
+    from cvsutils.common import Environment
+
+    # Import only the command to measure so that the RSS doesn't include modules for other commands.
+    command = getattr(importlib.import_module(f'cvsutils.commands.{name}'), name)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        start = time.perf_counter()
+        command(Environment(), **kwargs)
+        elapsed = time.perf_counter() - start
+    queue.put({'elapsed': elapsed, 'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024})
+
+
+def run_command(server, name, num_images, **kwargs):
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    num_requests = server.num_requests
+    process = context.Process(target=_run_command, args=(name, kwargs, queue))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f"{name} failed. exitcode={process.exitcode}")
+
+    result = queue.get()
+    result['requests'] = server.num_requests - num_requests
+    result['images_per_second'] = num_images / result['elapsed']
+    result['requests_per_second'] = result['requests'] / result['elapsed']
+    return result
+
+
+def run_benchmarks(task, num_images, batch_size, latency, throttle_rate, failure_rate, work_dir):
+    results = {}
+    with MockCustomVisionServer(latency=latency, throttle_rate=throttle_rate, failure_rate=failure_rate) as server:
+        os.environ.update({'CVS_ENDPOINT': server.endpoint, 'CVS_TRAINING_KEY': 'training_key', 'CVS_PREDICTION_KEY': 'prediction_key',
+                           'CVS_PREDICTION_RESOURCE_ID': 'resource_id', 'CVS_CACHE': 'none'})
+
+        dataset_filepath = pathlib.Path(generate_dataset(work_dir / 'input', task, num_images))
+        domain_id = OD_DOMAIN_ID if task == 'object_detection' else IC_DOMAIN_ID
+
+        existing_projects = set(server.projects)
+        results['create_project'] = run_command(server, 'create_project', num_images, dataset_filepath=dataset_filepath, project_name='benchmark',
+                                                domain_id=domain_id, batch_size=batch_size, ignore_error=False)
+        project_id, = set(server.projects) - existing_projects
+        iteration_id = server.add_iteration(project_id)
+
+        results['download_project'] = run_command(server, 'download_project', num_images, project_id=project_id, output_directory=work_dir / 'downloaded',
+                                                  ignore_error=False, filter_tag=None)
+
+        thresholds = defaultdict(functools.partial(float, 0.1))  # Must be picklable to pass to the child process.
+        results['predict_dataset'] = run_command(server, 'predict_dataset', num_images, project_id=project_id, iteration_id=iteration_id,
+                                                 input_dataset_filepath=dataset_filepath, output_dataset_filepath=work_dir / 'predicted' / 'images.txt',
+                                                 prob_thresholds_per_label=thresholds)
+
+        results['evaluate_project'] = run_command(server, 'evaluate_project', num_images, project_id=project_id, iteration_id=iteration_id,
+                                                  dataset_filename=dataset_filepath)
+        print(f"Injected errors: {server.num_injected_errors}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark commands with a local mock Custom Vision server")
+    parser.add_argument('--task', choices=['image_classification', 'object_detection'], default='object_detection')
+    parser.add_argument('--num_images', type=int, default=500)
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds to wait before each response")
+    parser.add_argument('--throttle_rate', type=float, default=0.0, help="Probability of 429 responses")
+    parser.add_argument('--failure_rate', type=float, default=0.0, help="Probability of 500 responses")
+    parser.add_argument('--output', type=pathlib.Path, help="Write the results in JSON format")
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = run_benchmarks(args.task, args.num_images, args.batch_size, args.latency, args.throttle_rate, args.failure_rate, pathlib.Path(work_dir))
+
+    print(f"{'Command':<20s} {'Time(s)':>10s} {'Images/s':>10s} {'Requests':>10s} {'Requests/s':>10s} {'PeakRSS(MB)':>12s}")
+    for name, r in results.items():
+        print(f"{name:<20s} {r['elapsed']:>10.2f} {r['images_per_second']:>10.1f} {r['requests']:>10d} {r['requests_per_second']:>10.1f} {r['peak_rss_mb']:>12.1f}")
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
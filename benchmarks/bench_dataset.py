@@ -0,0 +1,133 @@
+"""Microbenchmarks for dataset parsing, writing, validation and the evaluators.
+
+Example:
+    python benchmarks/bench_dataset.py --sizes 10000 100000 --save_baseline baseline.json
+    python benchmarks/bench_dataset.py --sizes 10000 100000 --baseline baseline.json
+"""
+import argparse
+import json
+import pathlib
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from synthetic import generate_images, generate_labels, write_dataset  # noqa: E402
+from cvsutils.dataset import DatasetReader, DatasetWriter  # noqa: E402
+from cvsutils.evaluator import ObjectDetectionEvaluator  # noqa: E402
+
+IMAGE_SIZE = (64, 48)
+
+
+def measure(func, repeat):
+    """Returns the minimum elapsed time of the function and its last return value."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def make_predictions(targets, num_labels, seed=0):
+    """Make noisy predictions from the ground truths. [[label, probability, x, y, x2, y2], ...] for each image."""
+    rng = random.Random(seed)
+    predictions = []
+    for target in targets:
+        boxes = []
+        for label, x, y, x2, y2 in target:
+            d = rng.randint(-4, 4)
+            boxes.append([label if rng.random() > 0.1 else rng.randrange(num_labels), rng.random(), x + d, y + d, x2 + d, y2 + d])
+        boxes.extend([rng.randrange(num_labels), rng.random() * 0.5, 0, 0, IMAGE_SIZE[0] // 2, IMAGE_SIZE[1] // 2] for _ in range(2))
+        predictions.append(boxes)
+    return predictions
+
+
+def run_benchmarks(sizes, layouts, boxes_per_image_list, num_labels, repeat, work_dir):
+    results = {}
+    images = generate_images(16, IMAGE_SIZE)
+    for size in sizes:
+        for boxes_per_image in boxes_per_image_list:
+            labels = generate_labels('object_detection', size, num_labels, boxes_per_image, IMAGE_SIZE)
+            for layout in layouts:
+                name = f'od_{size}_{layout}_{boxes_per_image}boxes'
+                print(f"Running {name}...", flush=True)
+                directory = work_dir / name
+                if layout == 'npz':
+                    source_filepath = write_dataset(directory / 'source', 'object_detection', images, labels, num_labels, 'zip')
+                    dataset_filepath = directory / 'input' / 'dataset.npz'
+                    dataset_filepath.parent.mkdir(parents=True)
+                    DatasetWriter.write(DatasetReader.open(source_filepath), dataset_filepath, shuffle=False)
+                else:
+                    dataset_filepath = write_dataset(directory / 'input', 'object_detection', images, labels, num_labels, layout)
+
+                result = {}
+                result['parse'], dataset = measure(lambda: DatasetReader.open(dataset_filepath), repeat)
+                result['validate'], _ = measure(dataset.validate, repeat)
+
+                output_filepath = directory / 'output' / ('dataset.npz' if layout == 'npz' else 'images.txt')
+                output_filepath.parent.mkdir(parents=True)
+                result['write'], _ = measure(lambda: DatasetWriter.write(dataset, str(output_filepath)), repeat)
+
+                if layout == layouts[0]:
+                    # The evaluation doesn't depend on the layout.
+                    predictions = make_predictions(labels, num_labels)
+
+                    def evaluate():
+                        evaluator = ObjectDetectionEvaluator()
+                        evaluator.add_predictions(predictions, labels)
+                        return evaluator.get_report()
+                    result['evaluate'], _ = measure(evaluate, repeat)
+
+                results[name] = result
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print the ratio to the baseline. Returns False if any of the results is slower than the tolerance."""
+    passed = True
+    for name, result in results.items():
+        for key, elapsed in result.items():
+            if name not in baseline or key not in baseline[name]:
+                continue
+            ratio = elapsed / baseline[name][key]
+            regressed = ratio > 1 + tolerance
+            passed = passed and not regressed
+            print(f"{name:<40s} {key:<10s} {ratio:>6.2f}x {'REGRESSION' if regressed else ''}")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dataset parsing, writing, validation and evaluation")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000], help="The numbers of images. Try 1000000 for a full run.")
+    parser.add_argument('--layouts', nargs='+', choices=['zip', 'files', 'npz'], default=['zip', 'files', 'npz'])
+    parser.add_argument('--boxes_per_image', type=int, nargs='+', default=[1, 10], help="Average numbers of boxes per image")
+    parser.add_argument('--num_labels', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=1, help="Report the minimum time of the repeats")
+    parser.add_argument('--baseline', type=pathlib.Path, help="Compare the results with the baseline file")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown ratio against the baseline (default=0.2)")
+    parser.add_argument('--save_baseline', type=pathlib.Path, help="Save the results as a baseline file")
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = run_benchmarks(args.sizes, args.layouts, args.boxes_per_image, args.num_labels, args.repeat, pathlib.Path(work_dir))
+
+    print(f"{'Benchmark':<40s} {'Parse(s)':>10s} {'Validate(s)':>12s} {'Write(s)':>10s} {'Evaluate(s)':>12s}")
+    for name, r in results.items():
+        evaluate = f"{r['evaluate']:>12.3f}" if 'evaluate' in r else f"{'-':>12s}"
+        print(f"{name:<40s} {r['parse']:>10.3f} {r['validate']:>12.3f} {r['write']:>10.3f} {evaluate}")
+
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(results, indent=2))
+        print(f"Saved the baseline to {args.save_baseline}")
+
+    if args.baseline:
+        if not compare(results, json.loads(args.baseline.read_text()), args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
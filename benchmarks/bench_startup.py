@@ -0,0 +1,82 @@
+"""Measure the cold-start time of the commands.
+
+Each command is run with "-h" in a new interpreter so that the time is dominated by the imports.
+
+Example:
+    python benchmarks/bench_startup.py --save_baseline startup.json
+    python benchmarks/bench_startup.py --baseline startup.json
+"""
+import argparse
+import json
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from cvsutils.cli import COMMANDS  # noqa: E402
+
+
+def measure(args, repeat):
+    """Returns the list of elapsed times to run the command."""
+    env = {**os.environ, 'PYTHONPATH': str(REPO_ROOT), 'PYTHONDONTWRITEBYTECODE': '1'}
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, env=env, check=True, stdout=subprocess.DEVNULL)
+        elapsed.append(time.perf_counter() - start)
+    return elapsed
+
+
+def run_benchmarks(commands, repeat):
+    results = {'python': measure(['-c', 'pass'], repeat), 'cvs': measure(['-m', 'cvsutils', '-h'], repeat)}
+    for name in commands:
+        print(f"Running {name}...", flush=True)
+        results[name] = measure(['-m', 'cvsutils', name, '-h'], repeat)
+    return {name: {'min': min(e), 'median': statistics.median(e)} for name, e in results.items()}
+
+
+def compare(results, baseline, tolerance):
+    """Print the ratio to the baseline. Returns False if any of the results is slower than the tolerance."""
+    passed = True
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['min'] / baseline[name]['min']
+        regressed = ratio > 1 + tolerance
+        passed = passed and not regressed
+        print(f"{name:<20s} {ratio:>6.2f}x {'REGRESSION' if regressed else ''}")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cold-start time of the commands")
+    parser.add_argument('--commands', nargs='+', choices=COMMANDS.keys(), default=list(COMMANDS.keys()))
+    parser.add_argument('--repeat', type=int, default=5, help="Report the minimum and median time of the repeats")
+    parser.add_argument('--baseline', type=pathlib.Path, help="Compare the results with the baseline file")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown ratio against the baseline (default=0.2)")
+    parser.add_argument('--save_baseline', type=pathlib.Path, help="Save the results as a baseline file")
+
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.commands, args.repeat)
+
+    print(f"{'Command':<20s} {'Min(ms)':>10s} {'Median(ms)':>12s}")
+    for name, r in results.items():
+        print(f"{name:<20s} {r['min'] * 1000:>10.1f} {r['median'] * 1000:>12.1f}")
+
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(results, indent=2))
+        print(f"Saved the baseline to {args.save_baseline}")
+
+    if args.baseline:
+        if not compare(results, json.loads(args.baseline.read_text()), args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
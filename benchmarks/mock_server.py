@@ -0,0 +1,336 @@
+"""A local mock of Custom Vision Service for benchmarks.
+
+Only the routes used by TrainingApi, PredictionApi and ImageDownloader are implemented. All data is kept in memory.
+"""
+import http.server
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+
+IC_DOMAIN_ID = 'ee85a74c-405e-4adc-bb47-ffa8ca0c9f31'
+OD_DOMAIN_ID = 'da2e3a8a-40a5-4171-82f4-58522f70fbc1'
+DOMAINS = {IC_DOMAIN_ID: ('General', 'Classification'), OD_DOMAIN_ID: ('General', 'ObjectDetection')}
+
+ID = r'([0-9a-f\-]{36})'
+TRAINING = '/customvision/v3.3/training'
+ROUTES = [
+    ('GET', TRAINING + '/projects', 'get_projects'),
+    ('POST', TRAINING + '/projects', 'create_project'),
+    ('GET', TRAINING + f'/projects/{ID}', 'get_project'),
+    ('PATCH', TRAINING + f'/projects/{ID}', 'update_project'),
+    ('GET', TRAINING + f'/projects/{ID}/tags', 'get_tags'),
+    ('POST', TRAINING + f'/projects/{ID}/tags', 'create_tag'),
+    ('POST', TRAINING + f'/projects/{ID}/images', 'create_images'),
+    ('GET', TRAINING + f'/projects/{ID}/images/count', 'get_images_count'),
+    ('GET', TRAINING + f'/projects/{ID}/images/tagged/count', 'get_tagged_images_count'),
+    ('GET', TRAINING + f'/projects/{ID}/images/untagged/count', 'get_untagged_images_count'),
+    ('GET', TRAINING + f'/projects/{ID}/images/tagged', 'get_tagged_images'),
+    ('GET', TRAINING + f'/projects/{ID}/images/untagged', 'get_untagged_images'),
+    ('POST', TRAINING + f'/projects/{ID}/images/tags', 'create_image_tags'),
+    ('POST', TRAINING + f'/projects/{ID}/images/regions', 'create_image_regions'),
+    ('POST', TRAINING + f'/projects/{ID}/train', 'train'),
+    ('GET', TRAINING + f'/projects/{ID}/iterations', 'get_iterations'),
+    ('GET', TRAINING + f'/projects/{ID}/iterations/{ID}', 'get_iteration'),
+    ('DELETE', TRAINING + f'/projects/{ID}/iterations/{ID}', 'remove_iteration'),
+    ('GET', TRAINING + f'/projects/{ID}/iterations/{ID}/performance', 'get_iteration_performance'),
+    ('POST', TRAINING + f'/projects/{ID}/iterations/{ID}/publish', 'publish_iteration'),
+    ('DELETE', TRAINING + f'/projects/{ID}/iterations/{ID}/publish', 'unpublish_iteration'),
+    ('GET', TRAINING + '/domains', 'get_domains'),
+    ('GET', f'/customvision/v3.2/training/domains/{ID}', 'get_domain'),
+    ('POST', f'/customvision/v3.0/prediction/{ID}/(classify|detect)/iterations/([^/]+)/image/nostore', 'predict'),
+    ('GET', f'/images/{ID}', 'download_image'),
+]
+
+
+class HttpError(Exception):
+    def __init__(self, status, message=''):
+        super().__init__(message)
+        self.status = status
+
+
+class MockCustomVisionServer:
+    """Mock server with configurable latency, throttling and failure injection.
+
+    Args:
+        latency: Seconds to wait before each response.
+        throttle_rate: Probability to respond 429 to a request.
+        failure_rate: Probability to respond 500 to a request.
+        training_seconds: Seconds until a new iteration becomes Completed.
+    """
+    def __init__(self, latency=0.0, throttle_rate=0.0, failure_rate=0.0, training_seconds=0.0, port=0):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.failure_rate = failure_rate
+        self.training_seconds = training_seconds
+
+        self.projects = {}
+        self.images = {}  # image_id => binary
+        self.num_requests = 0
+        self.num_injected_errors = 0
+        self._lock = threading.Lock()
+        self._routes = [(method, re.compile(pattern + '$'), getattr(self, '_' + name)) for method, pattern, name in ROUTES]
+
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True  # Otherwise small responses are delayed by the delayed ACK of the client.
+
+            def do_GET(self):
+                server._handle(self, 'GET')
+
+            def do_POST(self):
+                server._handle(self, 'POST')
+
+            def do_PATCH(self):
+                server._handle(self, 'PATCH')
+
+            def do_DELETE(self):
+                server._handle(self, 'DELETE')
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = http.server.ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def add_iteration(self, project_id, status='Completed'):
+        """Add an iteration to the project directly. Returns the iteration id."""
+        project = self.projects[project_id]
+        iteration_id = str(uuid.uuid4())
+        with self._lock:
+            project['iterations'][iteration_id] = {'id': iteration_id, 'name': f"Iteration {len(project['iterations']) + 1}", 'status': status,
+                                                   'publishName': None, 'domainId': project['domain_id'], 'created': _now(),
+                                                   'finish_time': time.time() + self.training_seconds}
+        return iteration_id
+
+    def _handle(self, handler, method):
+        with self._lock:
+            self.num_requests += 1
+
+        length = int(handler.headers.get('Content-Length') or 0)
+        body = handler.rfile.read(length) if length else b''
+        parsed = urllib.parse.urlparse(handler.path)
+        params = {k: v[0] for k, v in urllib.parse.parse_qs(parsed.query).items()}
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        injected = random.random()
+        if injected < self.throttle_rate + self.failure_rate:
+            with self._lock:
+                self.num_injected_errors += 1
+            if injected < self.throttle_rate:
+                return self._respond(handler, 429, {'error': {'code': 'TooManyRequests'}}, headers={'Retry-After': '1'})
+            return self._respond(handler, 500, {'error': {'code': 'InternalServerError'}})
+
+        for route_method, pattern, func in self._routes:
+            match = pattern.match(parsed.path)
+            if route_method == method and match:
+                try:
+                    result = func(*match.groups(), params=params, body=body, headers=handler.headers)
+                except HttpError as e:
+                    return self._respond(handler, e.status, {'error': {'message': str(e)}})
+                except KeyError as e:
+                    return self._respond(handler, 404, {'error': {'message': f"Not found: {e}"}})
+                return self._respond(handler, 200, result)
+
+        self._respond(handler, 404, {'error': {'message': f"Unknown route: {method} {parsed.path}"}})
+
+    @staticmethod
+    def _respond(handler, status, result, headers=None):
+        if isinstance(result, bytes):
+            body, content_type = result, 'application/octet-stream'
+        elif result is None:
+            body, content_type = b'', 'application/json'
+        else:
+            body, content_type = json.dumps(result).encode('utf-8'), 'application/json'
+
+        handler.send_response(status)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    # Training API
+    def _get_projects(self, **kwargs):
+        return [self._project_response(p) for p in self.projects.values()]
+
+    def _create_project(self, params, **kwargs):
+        project_id = str(uuid.uuid4())
+        domain_id = params.get('domainId', IC_DOMAIN_ID)
+        if domain_id not in DOMAINS:
+            raise HttpError(400, f"Unknown domain: {domain_id}")
+        with self._lock:
+            self.projects[project_id] = {'id': project_id, 'name': params['name'], 'domain_id': domain_id, 'created': _now(),
+                                         'classification_type': 'Multiclass', 'tags': {}, 'images': {}, 'iterations': {}}
+        return {'id': project_id}
+
+    def _get_project(self, project_id, **kwargs):
+        return self._project_response(self.projects[project_id])
+
+    def _update_project(self, project_id, body, **kwargs):
+        project = self.projects[project_id]
+        settings = json.loads(body)['settings']
+        project['domain_id'] = settings['domainId']
+        project['classification_type'] = settings['classificationType']
+        return self._project_response(project)
+
+    def _get_tags(self, project_id, **kwargs):
+        return [{'id': tag_id, 'name': name} for tag_id, name in self.projects[project_id]['tags'].items()]
+
+    def _create_tag(self, project_id, params, **kwargs):
+        tag_id = str(uuid.uuid4())
+        self.projects[project_id]['tags'][tag_id] = params['name']
+        return {'id': tag_id, 'name': params['name']}
+
+    def _create_images(self, project_id, body, headers, **kwargs):
+        project = self.projects[project_id]
+        results = []
+        for name, content in _parse_multipart(body, headers['Content-Type']):
+            image_id = str(uuid.uuid4())
+            with self._lock:
+                self.images[image_id] = content
+                project['images'][image_id] = {'id': image_id, 'tags': [], 'regions': []}
+            results.append({'sourceUrl': f'"{name}"', 'status': 'OK', 'image': {'id': image_id}})
+        return {'isBatchSuccessful': True, 'images': results}
+
+    def _get_images_count(self, project_id, **kwargs):
+        return len(self.projects[project_id]['images'])
+
+    def _get_tagged_images_count(self, project_id, **kwargs):
+        return len(self._get_images(project_id, tagged=True))
+
+    def _get_untagged_images_count(self, project_id, **kwargs):
+        return len(self._get_images(project_id, tagged=False))
+
+    def _get_tagged_images(self, project_id, params, **kwargs):
+        is_od = DOMAINS[self.projects[project_id]['domain_id']][1] == 'ObjectDetection'
+        images = self._get_images(project_id, tagged=True)[int(params['skip']):int(params['skip']) + int(params['take'])]
+        key = 'regions' if is_od else 'tags'
+        return [{'id': image['id'], 'originalImageUri': self._get_image_url(image['id']), key: image[key]} for image in images]
+
+    def _get_untagged_images(self, project_id, params, **kwargs):
+        images = self._get_images(project_id, tagged=False)[int(params['skip']):int(params['skip']) + int(params['take'])]
+        return [{'id': image['id'], 'originalImageUri': self._get_image_url(image['id'])} for image in images]
+
+    def _create_image_tags(self, project_id, body, **kwargs):
+        images = self.projects[project_id]['images']
+        tags = json.loads(body)['tags']
+        for tag in tags:
+            images[tag['imageId']]['tags'].append({'tagId': tag['tagId']})
+        return {'created': tags}
+
+    def _create_image_regions(self, project_id, body, **kwargs):
+        images = self.projects[project_id]['images']
+        regions = json.loads(body)['regions']
+        for region in regions:
+            images[region['imageId']]['regions'].append({k: region[k] for k in ('tagId', 'left', 'top', 'width', 'height')})
+        return {'created': regions}
+
+    def _train(self, project_id, **kwargs):
+        iteration_id = self.add_iteration(project_id, status='Training')
+        return {'id': iteration_id}
+
+    def _get_iterations(self, project_id, **kwargs):
+        return [self._iteration_response(project_id, i) for i in self.projects[project_id]['iterations'].values()]
+
+    def _get_iteration(self, project_id, iteration_id, **kwargs):
+        return self._iteration_response(project_id, self.projects[project_id]['iterations'][iteration_id])
+
+    def _remove_iteration(self, project_id, iteration_id, **kwargs):
+        del self.projects[project_id]['iterations'][iteration_id]
+
+    def _get_iteration_performance(self, project_id, iteration_id, **kwargs):
+        return {'precision': random.random(), 'recall': random.random(), 'averagePrecision': random.random()}
+
+    def _publish_iteration(self, project_id, iteration_id, params, **kwargs):
+        self.projects[project_id]['iterations'][iteration_id]['publishName'] = params['publishName']
+
+    def _unpublish_iteration(self, project_id, iteration_id, **kwargs):
+        self.projects[project_id]['iterations'][iteration_id]['publishName'] = None
+
+    def _get_domains(self, **kwargs):
+        return [{'id': domain_id, 'name': name, 'type': domain_type} for domain_id, (name, domain_type) in DOMAINS.items()]
+
+    def _get_domain(self, domain_id, **kwargs):
+        name, domain_type = DOMAINS[domain_id]
+        return {'id': domain_id, 'name': name, 'type': domain_type}
+
+    # Prediction API
+    def _predict(self, project_id, task, publish_name, **kwargs):
+        project = self.projects[project_id]
+        if not any(i['publishName'] == publish_name for i in project['iterations'].values()):
+            raise HttpError(404, f"Not published: {publish_name}")
+
+        predictions = []
+        for tag_id, tag_name in project['tags'].items():
+            prediction = {'tagId': tag_id, 'tagName': tag_name, 'probability': random.random()}
+            if task == 'detect':
+                left, top = random.random() * 0.8, random.random() * 0.8
+                prediction['boundingBox'] = {'left': left, 'top': top, 'width': random.uniform(0.05, 1 - left), 'height': random.uniform(0.05, 1 - top)}
+            predictions.append(prediction)
+        return {'id': str(uuid.uuid4()), 'project': project_id, 'created': _now(), 'predictions': predictions}
+
+    def _download_image(self, image_id, **kwargs):
+        return self.images[image_id]
+
+    def _get_images(self, project_id, tagged):
+        return [i for i in self.projects[project_id]['images'].values() if bool(i['tags'] or i['regions']) == tagged]
+
+    def _get_image_url(self, image_id):
+        return urllib.parse.urljoin(self.endpoint, f'images/{image_id}')
+
+    @staticmethod
+    def _project_response(project):
+        return {'id': project['id'], 'name': project['name'], 'description': '', 'created': project['created'], 'lastModified': project['created'],
+                'settings': {'domainId': project['domain_id'], 'classificationType': project['classification_type'], 'targetExportPlatforms': []}}
+
+    def _iteration_response(self, project_id, iteration):
+        if iteration['status'] == 'Training' and iteration['finish_time'] <= time.time():
+            iteration['status'] = 'Completed'
+        classification_type = None if DOMAINS[iteration['domainId']][1] == 'ObjectDetection' else self.projects[project_id]['classification_type']
+        return {'id': iteration['id'], 'name': iteration['name'], 'status': iteration['status'], 'created': iteration['created'],
+                'publishName': iteration['publishName'], 'domainId': iteration['domainId'], 'classificationType': classification_type}
+
+
+def _parse_multipart(body, content_type):
+    """Returns a list of (name, content) in a multipart/form-data body."""
+    boundary = re.search(r'boundary=("?)([^";]+)\1', content_type).group(2).encode('utf-8')
+    parts = []
+    for part in body.split(b'--' + boundary)[1:-1]:
+        header, content = part[2:-2].split(b'\r\n\r\n', 1)
+        name = re.search(rb'name="([^"]*)"', header).group(1).decode('utf-8')
+        parts.append((name, content))
+    return parts
+
+
+def _now():
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
@@ -0,0 +1,108 @@
+"""Generators of synthetic datasets in the SIMPLE dataset format."""
+import io
+import os
+import random
+import zipfile
+
+
+def generate_images(num_images, image_size=(640, 480), image_format='JPEG', seed=0):
+    """Returns a list of encoded random images. Benchmarks reuse them since generating unique images is slow."""
+    import PIL.Image
+    rng = random.Random(seed)
+    images = []
+    for _ in range(num_images):
+        image = PIL.Image.frombytes('RGB', image_size, _random_bytes(rng, image_size[0] * image_size[1] * 3))
+        output = io.BytesIO()
+        image.save(output, format=image_format)
+        images.append(output.getvalue())
+    return images
+
+
+def _random_bytes(rng, size):
+    return rng.getrandbits(size * 8).to_bytes(size, 'little')
+
+
+def generate_labels(task, num_images, num_labels, boxes_per_image, image_size=(640, 480), seed=0):
+    """Returns a list of labels for each image.
+
+    For image_classification, each entry is a list of label ids. For object_detection, each entry is [[label_id, x, y, x2, y2], ...].
+    boxes_per_image is the average number of boxes. The actual number varies from 0 to 2 * boxes_per_image.
+    """
+    assert task in ('image_classification', 'object_detection')
+    rng = random.Random(seed)
+    width, height = image_size
+    all_labels = []
+    for _ in range(num_images):
+        if task == 'image_classification':
+            all_labels.append([rng.randrange(num_labels)])
+        else:
+            labels = []
+            for _ in range(rng.randint(0, boxes_per_image * 2)):
+                x, y = rng.randrange(width - 1), rng.randrange(height - 1)
+                labels.append([rng.randrange(num_labels), x, y, rng.randint(x + 1, width), rng.randint(y + 1, height)])
+            all_labels.append(labels)
+    return all_labels
+
+
+def write_dataset(directory, task, images, labels, num_labels, layout='zip'):
+    """Write a dataset. images are reused cyclically if there are fewer images than labels.
+
+    Args:
+        layout: 'zip' to store images and labels in images.zip and labels.zip. 'files' to store them as loose files.
+    Returns:
+        The path of the images.txt.
+    """
+    assert layout in ('zip', 'files')
+    os.makedirs(directory, exist_ok=True)
+
+    if layout == 'zip':
+        images_zip = zipfile.ZipFile(os.path.join(directory, 'images.zip'), 'w', compression=zipfile.ZIP_STORED)
+        labels_zip = zipfile.ZipFile(os.path.join(directory, 'labels.zip'), 'w', compression=zipfile.ZIP_STORED) if task == 'object_detection' else None
+    else:
+        os.makedirs(os.path.join(directory, 'images'), exist_ok=True)
+        if task == 'object_detection':
+            os.makedirs(os.path.join(directory, 'labels'), exist_ok=True)
+
+    dataset_filepath = os.path.join(directory, 'images.txt')
+    with open(dataset_filepath, 'w') as f:
+        for i, image_labels in enumerate(labels):
+            image = images[i % len(images)]
+            if layout == 'zip':
+                images_zip.writestr(f'{i}.jpg', image)
+                image_path = f'images.zip@{i}.jpg'
+            else:
+                with open(os.path.join(directory, 'images', f'{i}.jpg'), 'wb') as image_file:
+                    image_file.write(image)
+                image_path = f'images/{i}.jpg'
+
+            if task == 'image_classification':
+                labels_field = ','.join(str(label) for label in image_labels)
+            else:
+                labels_text = ''.join(' '.join(str(v) for v in box) + '\n' for box in image_labels)
+                if layout == 'zip':
+                    labels_zip.writestr(f'{i}.txt', labels_text)
+                    labels_field = f'labels.zip@{i}.txt'
+                else:
+                    with open(os.path.join(directory, 'labels', f'{i}.txt'), 'w') as labels_file:
+                        labels_file.write(labels_text)
+                    labels_field = f'labels/{i}.txt'
+
+            f.write(f'{image_path} {labels_field}\n')
+
+    if layout == 'zip':
+        images_zip.close()
+        if labels_zip:
+            labels_zip.close()
+
+    with open(os.path.join(directory, 'labels.txt'), 'w') as f:
+        for i in range(num_labels):
+            f.write(f'label_{i}\n')
+
+    return dataset_filepath
+
+
+def generate_dataset(directory, task, num_images, num_labels=10, boxes_per_image=4, image_size=(640, 480), num_unique_images=16, layout='zip', seed=0):
+    """Generate a synthetic dataset and returns the path of its images.txt."""
+    images = generate_images(min(num_images, num_unique_images), image_size, seed=seed)
+    labels = generate_labels(task, num_images, num_labels, boxes_per_image, image_size, seed=seed)
+    return write_dataset(directory, task, images, labels, num_labels, layout)
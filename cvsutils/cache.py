@@ -0,0 +1,112 @@
+import copy
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+_default_memory_cache = None
+
+
+def get_default_cache_dir():
+    return os.getenv('CVS_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'cvsutils'))
+
+
+def get_default_cache(cache_type):
+    """Returns a cache instance for the given type. The memory cache is shared in the process."""
+    global _default_memory_cache
+    if cache_type == 'memory':
+        if not _default_memory_cache:
+            _default_memory_cache = MemoryCache()
+        return _default_memory_cache
+    elif cache_type == 'disk':
+        return DiskCache()
+    elif cache_type == 'none':
+        return NullCache()
+    else:
+        raise RuntimeError(f"Unknown cache type: {cache_type}")
+
+
+class NullCache:
+    """Cache that doesn't store anything."""
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+    def delete(self, key):
+        pass
+
+
+class MemoryCache:
+    """Stores values in the process memory. Each entry expires after its own TTL."""
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached value, or None if the entry is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            expire_at, value = entry
+            if expire_at < time.time():
+                del self._entries[key]
+                return None
+        # Callers may modify the returned object. Don't let them modify the cached one.
+        return copy.deepcopy(value)
+
+    def set(self, key, value, ttl):
+        if ttl <= 0:
+            return
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class DiskCache:
+    """Stores picklable values as files under a directory. Each entry expires after its own TTL."""
+    def __init__(self, directory=None):
+        self.directory = directory or get_default_cache_dir()
+
+    def get(self, key):
+        """Returns the cached value, or None if the entry is missing or expired."""
+        filepath = self._get_filepath(key)
+        try:
+            with open(filepath, 'rb') as f:
+                expire_at, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        if expire_at < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, ttl):
+        if ttl <= 0:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        filepath = self._get_filepath(key)
+        # Write to a temporary file first so that a concurrent reader never sees a partial entry.
+        temp_filepath = f'{filepath}.{os.getpid()}.tmp'
+        with open(temp_filepath, 'wb') as f:
+            pickle.dump((time.time() + ttl, value), f)
+        os.replace(temp_filepath, filepath)
+
+    def delete(self, key):
+        try:
+            os.remove(self._get_filepath(key))
+        except OSError:
+            pass
+
+    def _get_filepath(self, key):
+        # Keys may contain API keys or endpoints. Only their hashes are written to the disk.
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest())
@@ -0,0 +1,98 @@
+"""The cvs command. Usage: cvs <command> [<args>]
+
+Each subcommand is the same as the corresponding cvs_<command> script. Only the module of the given subcommand is imported.
+If CVS_DAEMON_SOCKET is set and cvs_daemon is listening on it, the command is forwarded to the daemon and runs there.
+"""
+import importlib
+import os
+import sys
+
+# Subcommand name => module name in cvsutils.commands
+COMMANDS = {
+    'add_images': 'add_images',
+    'convert_dataset': 'convert_dataset',
+    'create_project': 'create_project',
+    'daemon': 'daemon',
+    'download_project': 'download_project',
+    'evaluate_project': 'evaluate_project',
+    'export_model': 'export_model',
+    'get_domains': 'get_domains',
+    'list_projects': 'list_projects',
+    'merge_datasets': 'merge_datasets',
+    'predict_dataset': 'predict_dataset',
+    'predict_image': 'predict_image',
+    'remove_iteration': 'remove_iteration',
+    'show_project': 'show_project',
+    'train_project': 'train_project',
+    'validate_dataset': 'validate_dataset_file'
+}
+
+
+def print_usage(file=sys.stdout):
+    print("usage: cvs <command> [<args>]\n\nAvailable commands:", file=file)
+    for name in COMMANDS:
+        print(f"  {name}", file=file)
+    print("\nRun 'cvs <command> -h' to see the help of each command.", file=file)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print_usage()
+        return
+
+    name = argv[0].replace('-', '_')
+    if name not in COMMANDS:
+        print(f"cvs: unknown command '{argv[0]}'\n", file=sys.stderr)
+        print_usage(sys.stderr)
+        sys.exit(2)
+
+    socket_path = os.getenv('CVS_DAEMON_SOCKET')
+    if socket_path and name != 'daemon':
+        exit_code = run_in_daemon(socket_path, [name] + argv[1:])
+        if exit_code is not None:
+            sys.exit(exit_code)
+
+    run_command(name, argv[1:])
+
+
+def run_command(name, args):
+    # argparse in the subcommand reads sys.argv.
+    sys.argv = [f'cvs {name}'] + args
+    importlib.import_module(f'cvsutils.commands.{COMMANDS[name]}').main()
+
+
+def run_in_daemon(socket_path, argv):
+    """Run the command in the daemon and print its outputs. Returns the exit code, or None if the daemon is not running.
+
+    The request is a JSON line {"argv": [...], "cwd": ..., "env": {...}}. The daemon replies with JSON lines {"stream": "stdout" or "stderr", "data": ...}
+    and finally {"exit_code": ...}.
+    """
+    import json
+    import socket
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+
+    with sock, sock.makefile('rwb') as f:
+        env = {key: value for key, value in os.environ.items() if key.startswith('CVS_')}
+        f.write(json.dumps({'argv': argv, 'cwd': os.getcwd(), 'env': env}).encode('utf-8') + b'\n')
+        f.flush()
+        for line in f:
+            message = json.loads(line)
+            if 'exit_code' in message:
+                return message['exit_code']
+            stream = sys.stdout if message['stream'] == 'stdout' else sys.stderr
+            stream.write(message['data'])
+            stream.flush()
+
+    print("cvs: the daemon closed the connection unexpectedly.", file=sys.stderr)
+    return 1
+
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,29 @@
 import argparse
-import io
 import pathlib
 import uuid
-import PIL.Image
-import tqdm
-from ..common import Environment
+from ..common import Environment, get_image_size
 from ..dataset import DatasetReader
 from ..training_api import TrainingApi
+from ..profiler import add_profile_arguments, profile_command
 
 
-def _get_image_size(image):
-    with PIL.Image.open(io.BytesIO(image)) as f:
-        return f.size
-
-
-def add_images(env, project_id, dataset_filepath):
+def add_images(env, project_id, dataset_filepath, shard_index=0, num_shards=1, yes=False, create_tags_only=False):
+    """Upload the images in the shard. If num_shards > 1, all tags must exist in the project. Run with create_tags_only first to create them."""
+    import tqdm
     training_api = TrainingApi(env)
-    dataset = DatasetReader.open(dataset_filepath)
+    dataset = DatasetReader.open(dataset_filepath, shard_index, num_shards)
 
     existing_tags = training_api.get_tags(project_id)
     existing_tag_ids = {x[0]: x[1] for x in existing_tags}  # Name => ID
     tags_to_be_added = [x for x in dataset.labels if x not in existing_tag_ids]
+    if tags_to_be_added and num_shards > 1:
+        # Concurrent shards would create the same tags and get duplicates or different IDs.
+        raise RuntimeError(f"Tags are missing in the project: {tags_to_be_added}. Create them before running the shards with --create_tags_only and without --num_shards.")
     print(f"New tags will be added: {tags_to_be_added}")
-    response = input("Continue? [y/N]")
-    if response.lower() != 'y':
-        return
+    if tags_to_be_added and not yes:
+        response = input("Continue? [y/N]")
+        if response.lower() != 'y':
+            return
 
     tag_ids = []
     for new_tag_name in dataset.labels:
@@ -34,15 +33,19 @@ def add_images(env, project_id, dataset_filepath):
             tag_id = training_api.create_tag(project_id, new_tag_name)
         tag_ids.append(tag_id)
 
+    if create_tags_only:
+        print(f"Created {len(tags_to_be_added)} tags.")
+        return
+
     for i in tqdm.tqdm(range(len(dataset)), "Uploading images"):
-        image, labels = dataset.get(i)
+        image, labels = dataset.get(i, view=True)
         image_id = training_api.create_image(project_id, image)
 
         if dataset.dataset_type == 'image_classification':
             labels = [(image_id, tag_ids[label]) for label in labels]
-            training_api.set_image_classification_tags(labels)
+            training_api.set_image_classification_tags(project_id, labels)
         elif dataset.dataset_type == 'object_detection':
-            image_size = _get_image_size(image)
+            image_size = get_image_size(image)
             labels = [(image_id, [tag_ids[label[0]], label[1] / image_size[0], label[2] / image_size[1], label[3] / image_size[0], label[4] / image_size[1]]) for label in labels]
             training_api.set_object_detection_tags(project_id, labels)
 
@@ -53,10 +56,19 @@ def main():
     parser = argparse.ArgumentParser(description="Add images to an existing project.")
     parser.add_argument('project_id', type=uuid.UUID)
     parser.add_argument('dataset_filepath', type=pathlib.Path)
+    parser.add_argument('--shard_index', type=int, default=0, help="Upload only the images i where i %% num_shards == shard_index")
+    parser.add_argument('--num_shards', type=int, default=1)
+    parser.add_argument('--yes', '-y', action='store_true', help="Create new tags without confirmation")
+    parser.add_argument('--create_tags_only', action='store_true', help="Create the tags in the dataset and don't upload images. Run this before the shards.")
+    add_profile_arguments(parser)
 
     args = parser.parse_args()
 
-    add_images(Environment(), args.project_id, args.dataset_filepath)
+    if not (0 <= args.shard_index < args.num_shards):
+        parser.error(f"shard_index must be in range [0, {args.num_shards}).")
+
+    with profile_command(args):
+        add_images(Environment(), args.project_id, args.dataset_filepath, args.shard_index, args.num_shards, args.yes, args.create_tags_only)
 
 
 if __name__ == '__main__':
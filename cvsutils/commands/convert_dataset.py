@@ -0,0 +1,36 @@
+import argparse
+import pathlib
+from ..dataset import DatasetReader, DatasetWriter
+from ..profiler import add_profile_arguments, profile_command
+
+
+def convert_dataset(input_dataset_filepath, output_dataset_filepath):
+    dataset = DatasetReader.open(input_dataset_filepath)
+    output_dataset_filepath.parent.mkdir(parents=True, exist_ok=True)
+    DatasetWriter.write(dataset, output_dataset_filepath, shuffle=False)
+    print(f"Converted {len(dataset)} images to {output_dataset_filepath}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a dataset between the SIMPLE format (images.txt) and the packed format (*.npz). The format is decided by the file extension.")
+    parser.add_argument('input_dataset_filepath', type=pathlib.Path)
+    parser.add_argument('output_dataset_filepath', type=pathlib.Path, help="*.npz for the packed format, images.txt for the SIMPLE format")
+    add_profile_arguments(parser)
+
+    args = parser.parse_args()
+
+    if not args.input_dataset_filepath.is_file():
+        parser.error(f"{args.input_dataset_filepath} is not found.")
+
+    if args.output_dataset_filepath.exists():
+        parser.error(f"{args.output_dataset_filepath} already exists.")
+
+    if args.output_dataset_filepath.suffix != '.npz' and args.output_dataset_filepath.parent.exists() and any(args.output_dataset_filepath.parent.iterdir()):
+        parser.error(f"{args.output_dataset_filepath.parent} must be empty for the SIMPLE format.")
+
+    with profile_command(args):
+        convert_dataset(args.input_dataset_filepath, args.output_dataset_filepath)
+
+
+if __name__ == '__main__':
+    main()
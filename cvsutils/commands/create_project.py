@@ -1,18 +1,19 @@
 import argparse
-import io
+import concurrent.futures
 import pathlib
 import uuid
-import PIL
-from tqdm import tqdm
-from ..common import Environment
+from ..common import Environment, get_image_size
 from ..dataset import DatasetReader
+from ..preprocessing import ImagePreprocessor
 from ..training_api import TrainingApi
+from ..profiler import add_profile_arguments, profile_command
 
 DEFAULT_IC_DOMAIN_ID = 'ee85a74c-405e-4adc-bb47-ffa8ca0c9f31'
 DEFAULT_OD_DOMAIN_ID = 'da2e3a8a-40a5-4171-82f4-58522f70fbc1'
 
 
-def create_project(env, dataset_filepath, project_name, domain_id, batch_size, ignore_error):
+def create_project(env, dataset_filepath, project_name, domain_id, batch_size, ignore_error, max_side=None, jpeg_quality=90, num_workers=None):
+    from tqdm import tqdm
     training_api = TrainingApi(env)
     dataset = DatasetReader.open(dataset_filepath)
 
@@ -39,33 +40,43 @@ def create_project(env, dataset_filepath, project_name, domain_id, batch_size, i
         tag_ids.append(training_api.create_tag(project_id, tag_name))
     print(f"Created {len(tag_ids)} tags.")
 
+    # Optionally downscale and re-encode images on a process pool before uploading them.
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) if max_side else None
+    preprocessor = ImagePreprocessor(dataset.dataset_type, max_side, jpeg_quality) if max_side else None
+
+    def upload_batch(batch_images, batch_labels, batch_indices):
+        if executor:
+            batch_images, batch_labels = zip(*executor.map(preprocessor, zip(batch_images, batch_labels)))
+            batch_images, batch_labels = list(batch_images), list(batch_labels)
+        _upload_batch(training_api, dataset.dataset_type, project_id, tag_ids, batch_images, batch_labels, batch_indices, ignore_error)
+
     # Upload images
     batch_images = []
     batch_labels = []
     batch_indices = []
-    for i in tqdm(range(len(dataset)), "Uploading images"):
-        image, labels = dataset.get(i)
-        batch_images.append(image)
-        batch_labels.append(labels)
-        batch_indices.append(i)
-
-        if len(batch_images) >= batch_size:
-            _upload_batch(training_api, dataset.dataset_type, project_id, tag_ids, batch_images, batch_labels, batch_indices, ignore_error)
-            batch_images = []
-            batch_labels = []
-            batch_indices = []
-
-    if batch_images:
-        _upload_batch(training_api, dataset.dataset_type, project_id, tag_ids, batch_images, batch_labels, batch_indices, ignore_error)
+    try:
+        for i in tqdm(range(len(dataset)), "Uploading images"):
+            # Unless they are preprocessed, the images are streamed from the memory-mapped dataset files without being read into memory.
+            image, labels = dataset.get(i, view=not executor)
+            batch_images.append(image)
+            batch_labels.append(labels)
+            batch_indices.append(i)
+
+            if len(batch_images) >= batch_size:
+                upload_batch(batch_images, batch_labels, batch_indices)
+                batch_images = []
+                batch_labels = []
+                batch_indices = []
+
+        if batch_images:
+            upload_batch(batch_images, batch_labels, batch_indices)
+    finally:
+        if executor:
+            executor.shutdown()
 
     print(f"Uploaded {len(dataset)} images")
 
 
-def _get_image_size(image):
-    with PIL.Image.open(io.BytesIO(image)) as f:
-        return f.size
-
-
 def _upload_batch(training_api, dataset_type, project_id, tag_ids, batch_images, batch_labels, batch_indices, ignore_error):
     assert dataset_type in ['image_classification', 'object_detection']
     try:
@@ -81,7 +92,7 @@ def _upload_batch(training_api, dataset_type, project_id, tag_ids, batch_images,
             labels = [(image_ids[image_index], tag_ids[label]) for image_index, labels in enumerate(batch_labels) for label in labels]
             training_api.set_image_classification_tags(project_id, labels)
         elif dataset_type == 'object_detection':
-            image_sizes = [_get_image_size(i) for i in batch_images]
+            image_sizes = [get_image_size(i) for i in batch_images]
             labels = [(image_ids[image_index], [tag_ids[label[0]],
                                                 label[1] / image_sizes[image_index][0],
                                                 label[2] / image_sizes[image_index][1],
@@ -103,13 +114,22 @@ def main():
     parser.add_argument('--domain_id', type=uuid.UUID, help="Domain id")
     parser.add_argument('--batch_size', type=int, default=32)
     parser.add_argument('--ignore_error', action='store_true')
+    parser.add_argument('--max_side', type=int, help="Downscale images so that the longer side is at most this size. EXIF orientation is applied and EXIF is removed.")
+    parser.add_argument('--jpeg_quality', type=int, default=90, help="JPEG quality for the downscaled images (default=90)")
+    parser.add_argument('--num_workers', type=int, help="The number of processes to downscale images")
+    add_profile_arguments(parser)
 
     args = parser.parse_args()
 
     if args.batch_size < 1:
         parser.error("Batch size must be a positive number.")
 
-    create_project(Environment(), args.dataset_filename, args.project_name, args.domain_id, args.batch_size, args.ignore_error)
+    if args.max_side is not None and args.max_side < 1:
+        parser.error("max_side must be a positive number.")
+
+    with profile_command(args):
+        create_project(Environment(), args.dataset_filename, args.project_name, args.domain_id, args.batch_size, args.ignore_error,
+                       args.max_side, args.jpeg_quality, args.num_workers)
 
 
 if __name__ == '__main__':
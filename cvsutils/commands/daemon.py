@@ -0,0 +1,186 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import pathlib
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+from ..cache import get_default_cache_dir
+from ..cli import COMMANDS, run_command
+from ..metrics import disable_dump_at_exit, metrics
+from ..profiler import profiler
+
+
+class _StreamWriter(io.TextIOBase):
+    """Sends the written text to the client as {"stream": name, "data": text} messages."""
+    def __init__(self, connection, name):
+        self.connection = connection
+        self.name = name
+
+    def write(self, text):
+        if text:
+            self.connection.send({'stream': self.name, 'data': text})
+        return len(text)
+
+    def isatty(self):
+        return False
+
+
+class _Connection:
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.disconnected = False
+        self._lock = threading.Lock()  # Commands may write from worker threads.
+
+    def send(self, message):
+        with self._lock:
+            if self.disconnected:
+                return
+            try:
+                self.wfile.write(json.dumps(message).encode('utf-8') + b'\n')
+                self.wfile.flush()
+            except OSError:
+                # The client is gone. Let the command finish without output.
+                self.disconnected = True
+
+
+class CommandHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        connection = _Connection(self.wfile)
+        try:
+            request = json.loads(self.rfile.readline())
+            exit_code = self.server.run_command(request['argv'], request['cwd'], request['env'], connection)
+        except Exception:
+            connection.send({'stream': 'stderr', 'data': traceback.format_exc()})
+            exit_code = 1
+        connection.send({'exit_code': exit_code})
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Runs commands in this process so that the imported modules, the HTTP sessions and the metadata cache are reused between commands.
+
+    Commands use the process-wide working directory, environment variables and stdout, so they run one at a time.
+    The metrics and the profiler are reset for each command. If the client sets CVS_METRICS_FILE, the metrics are written when the command ends.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path):
+        self._command_lock = threading.Lock()
+        disable_dump_at_exit()
+        super().__init__(socket_path, CommandHandler)
+
+    def run_command(self, argv, cwd, env, connection):
+        """Returns the exit code of the command."""
+        name = argv[0] if argv else None
+        if name not in COMMANDS or name == 'daemon':
+            connection.send({'stream': 'stderr', 'data': f"cvs_daemon: unsupported command: {name}\n"})
+            return 2
+
+        with self._command_lock:
+            saved_cwd = os.getcwd()
+            saved_argv = sys.argv
+            saved_env = {key: value for key, value in os.environ.items() if key.startswith('CVS_')}
+            stdout, stderr = _StreamWriter(connection, 'stdout'), _StreamWriter(connection, 'stderr')
+            try:
+                os.chdir(cwd)
+                self._replace_env(env)
+                metrics.reset()
+                profiler.reset()
+                with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr), _replace_stdin(io.StringIO()):
+                    try:
+                        run_command(name, argv[1:])
+                        return 0
+                    except SystemExit as e:
+                        if e.code is None or isinstance(e.code, int):
+                            return e.code or 0
+                        print(e.code, file=sys.stderr)
+                        return 1
+                    except Exception:
+                        traceback.print_exc()
+                        return 1
+                    finally:
+                        self._dump_metrics()
+            finally:
+                os.chdir(saved_cwd)
+                sys.argv = saved_argv
+                self._replace_env(saved_env)
+
+    @staticmethod
+    def _dump_metrics():
+        # Relative paths are resolved in the client's working directory. '-' goes to the client's stderr.
+        metrics_filepath = os.getenv('CVS_METRICS_FILE')
+        if metrics_filepath:
+            try:
+                metrics.dump(metrics_filepath)
+            except OSError as e:
+                print(f"Failed to write the metrics to {metrics_filepath}: {e}", file=sys.stderr)
+
+    @staticmethod
+    def _replace_env(env):
+        for key in [key for key in os.environ if key.startswith('CVS_')]:
+            del os.environ[key]
+        os.environ.update({key: value for key, value in env.items() if key.startswith('CVS_')})
+
+
+@contextlib.contextmanager
+def _replace_stdin(stdin):
+    # There is no terminal in the daemon. Prompts read EOF.
+    saved_stdin = sys.stdin
+    sys.stdin = stdin
+    try:
+        yield
+    finally:
+        sys.stdin = saved_stdin
+
+
+def _is_listening(socket_path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(socket_path))
+            return True
+        except OSError:
+            return False
+
+
+def run_daemon(socket_path):
+    if socket_path.exists():
+        if _is_listening(socket_path):
+            raise RuntimeError(f"Another daemon is listening on {socket_path}")
+        socket_path.unlink()  # Left by a daemon that was killed.
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # The commands run with the credentials in the requests. Only the owner can connect to the socket.
+    umask = os.umask(0o177)
+    try:
+        server = DaemonServer(str(socket_path))
+    finally:
+        os.umask(umask)
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    print(f"Listening on {socket_path}. Set CVS_DAEMON_SOCKET={socket_path} to run cvs commands in this daemon.", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        socket_path.unlink()
+        print("Stopped the daemon")
+
+
+def main():
+    default_socket_path = os.getenv('CVS_DAEMON_SOCKET') or os.path.join(get_default_cache_dir(), 'daemon.sock')
+    parser = argparse.ArgumentParser(description="Run commands sent by the cvs command in a long-running process to reuse HTTP connections and the metadata cache.")
+    parser.add_argument('--socket', type=pathlib.Path, default=pathlib.Path(default_socket_path), help=f"Unix socket path (default={default_socket_path})")
+
+    args = parser.parse_args()
+    run_daemon(args.socket)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,10 +2,12 @@ import argparse
 import os
 import pathlib
 import uuid
-from tqdm import tqdm
-from ..common import Environment, ImageDownloader, get_image_size
+import numpy as np
+from ..common import Environment, ImageDownloader, get_domain_type, get_image_size
 from ..dataset import Dataset, DatasetWriter
+from ..labels import TagMapping, to_pixel_boxes
 from ..training_api import TrainingApi
+from ..profiler import add_profile_arguments, profile_command
 
 
 def _has_allowed_tag(domain_type, labels, allowed_tags_set):
@@ -20,10 +22,11 @@ def _has_allowed_tag(domain_type, labels, allowed_tags_set):
     raise RuntimeError
 
 
-def download_project(env, project_id, output_directory, ignore_error, filter_tag):
+def download_project(env, project_id, output_directory, ignore_error, filter_tag, shuffle=True):
+    from tqdm import tqdm
     training_api = TrainingApi(env)
     domain_id = training_api.get_project(project_id)['domain_id']
-    domain_type = training_api.get_domain(domain_id)['type']
+    domain_type = get_domain_type(training_api, domain_id)
     dataset = Dataset(domain_type, output_directory)
 
     tags = training_api.get_tags(project_id)
@@ -31,6 +34,7 @@ def download_project(env, project_id, output_directory, ignore_error, filter_tag
     tags = [x for x in tags if x[1] in allowed_tags_set]
     tag_names, tag_ids = zip(*tags)
     dataset.labels = tag_names
+    tag_mapping = TagMapping(tag_names, tag_ids)
 
     images = training_api.get_images(project_id)
     print(f"Found {len(images)} images")
@@ -49,14 +53,13 @@ def download_project(env, project_id, output_directory, ignore_error, filter_tag
                 raise
 
         if domain_type == 'image_classification':
-            labels = [tag_ids.index(t) for t in entry['labels'] if t in allowed_tags_set]
+            labels = [tag_mapping.get_index_by_id(t) for t in entry['labels'] if t in allowed_tags_set]
         elif domain_type == 'object_detection':
             image_size = get_image_size(image)
-            labels = [[tag_ids.index(t[0]),
-                       int(t[1] * image_size[0]),
-                       int(t[2] * image_size[1]),
-                       int(t[3] * image_size[0]),
-                       int(t[4] * image_size[1])] for t in entry['labels'] if t[0] in allowed_tags_set]
+            regions = [t for t in entry['labels'] if t[0] in allowed_tags_set]
+            label_ids = tag_mapping.get_indices_by_ids([t[0] for t in regions])
+            boxes = to_pixel_boxes([t[1:] for t in regions], *image_size)
+            labels = np.column_stack([label_ids, boxes.astype(np.int64)])
         else:
             raise RuntimeError
 
@@ -65,7 +68,7 @@ def download_project(env, project_id, output_directory, ignore_error, filter_tag
     print(f"Downloaded {len(dataset)} images")
 
     output_directory.mkdir(parents=True, exist_ok=True)
-    DatasetWriter.write(dataset, os.path.join(output_directory, 'images.txt'))
+    DatasetWriter.write(dataset, os.path.join(output_directory, 'images.txt'), shuffle)
     print(f"Saved the dataset to {output_directory}")
 
 
@@ -75,13 +78,16 @@ def main():
     parser.add_argument('output_directory', type=pathlib.Path, help="Directory name for the downloaded files")
     parser.add_argument('--ignore_error', action='store_true', help="Ignore download errors.")
     parser.add_argument('--filter_tag', type=uuid.UUID, nargs='+', help="Specify tags to download.")
+    parser.add_argument('--no-shuffle', dest='shuffle', action='store_false', help="Keep the order of the images in the project")
+    add_profile_arguments(parser)
 
     args = parser.parse_args()
 
     if args.output_directory.exists():
         parser.error(f"{args.output_directory} already exists.")
 
-    download_project(Environment(), args.project_id, args.output_directory, args.ignore_error, args.filter_tag)
+    with profile_command(args):
+        download_project(Environment(), args.project_id, args.output_directory, args.ignore_error, args.filter_tag, args.shuffle)
 
 
 if __name__ == '__main__':
@@ -1,43 +1,111 @@
 import argparse
+import concurrent.futures
+import contextlib
 import pathlib
 import uuid
-from tqdm import tqdm
-from ..common import Environment, with_published, compress_image_if_needed_for_prediction, get_image_size
+import numpy as np
+from ..common import Environment, compress_image_if_needed_for_prediction, get_image_size
 from ..dataset import DatasetReader
-from ..evaluator import MulticlassClassificationEvaluator, MultilabelClassificationEvaluator, ObjectDetectionEvaluator
+from ..evaluator import MulticlassClassificationEvaluator, MultilabelClassificationEvaluator, ObjectDetectionEvaluator, write_analysis
+from ..labels import TagMapping, to_pixel_boxes
+from ..profiler import add_profile_arguments, profile_command, profiler
 from ..training_api import TrainingApi
 from ..prediction_api import PredictionApi
+from ..postprocess import PostProcessor, add_postprocess_arguments, validate_postprocess_arguments
+from ..prediction_backend import open_prediction_backend
 
+BATCH_SIZE = 16  # The number of images to predict at once with a local model.
+
+
+def evaluate_project(env, project_id, iteration_id, dataset_filename, onnx_model=None, threshold=0.0, iou_threshold=None, max_detections=None, analysis_output=None,
+                     max_workers=8):
+    """Evaluate an iteration with the dataset. If iteration_id is a list, the iterations are evaluated in a single pass and compared side by side.
+
+    Each image is read and compressed once and sent to all iterations concurrently.
+    """
+    from tqdm import tqdm
+    iteration_ids = list(iteration_id) if isinstance(iteration_id, (list, tuple)) else [iteration_id]
+    if onnx_model and len(iteration_ids) > 1:
+        raise ValueError("onnx_model can be used with only one iteration.")
 
-def evaluate_project(env, project_id, iteration_id, dataset_filename):
     training_api = TrainingApi(env)
     prediction_api = PredictionApi(env)
     dataset = DatasetReader.open(dataset_filename)
 
-    iteration = training_api.get_iteration(project_id, iteration_id)
+    iterations = [training_api.get_iteration(project_id, i) for i in iteration_ids]
     cvs_labels = training_api.get_tags(project_id)
 
     label_names = sorted([label[0] for label in cvs_labels])
+    tag_mapping = TagMapping(label_names)
     if dataset.labels != label_names:
         print("WARNING: Label is different between dataset and cvs project.")
         print("dataset labels: " + str(dataset.labels))
         print("cvs project labels: " + str(label_names))
 
-    with with_published(training_api, iteration) as publish_name:
-        targets = []
-        predictions = []
-        for i in tqdm(range(len(dataset)), "Evaluating the project"):
-            image, labels = dataset.get(i)
-            image = compress_image_if_needed_for_prediction(image)
-            pred = prediction_api.predict(project_id, dataset.dataset_type, publish_name, image)
-            w, h = get_image_size(image)
-            predictions.append([[label_names.index(p['label_name']), p['probability'], p['left'] * w, p['top'] * h, p['right'] * w, p['bottom'] * h] for p in pred])
-            targets.append(labels)
+    postprocessor = PostProcessor(threshold, iou_threshold=iou_threshold, max_detections=max_detections)
+    evaluators = [_get_evaluator(iteration) for iteration in iterations]
+    with contextlib.ExitStack() as stack:
+        # All iterations are published here and unpublished when the evaluation finishes or fails.
+        backends = [stack.enter_context(open_prediction_backend(training_api, prediction_api, iteration, dataset.dataset_type, onnx_model, max_workers)) for iteration in iterations]
+        executor = stack.enter_context(concurrent.futures.ThreadPoolExecutor(max_workers=len(backends)))
+        progress = stack.enter_context(tqdm(total=len(dataset), desc="Evaluating the project"))
+        for start in range(0, len(dataset), BATCH_SIZE):
+            batch = [dataset.get(i) for i in range(start, min(start + BATCH_SIZE, len(dataset)))]
+            images = [compress_image_if_needed_for_prediction(image) for image, _ in batch]
+            image_sizes = [get_image_size(image) for image in images] if dataset.dataset_type == 'object_detection' else None
+            targets = [labels for _, labels in batch]
+            for iteration, evaluator, results in zip(iterations, evaluators, executor.map(lambda backend: backend.predict_batch(images), backends)):
+                predictions = [_to_prediction(postprocessor(pred), tag_mapping, image_sizes[i] if image_sizes else None) for i, pred in enumerate(results)]
+                with profiler.stage('evaluator'):
+                    evaluator.add_predictions(*_to_evaluator_inputs(iteration, predictions, targets, len(label_names)))
+            progress.update(len(batch))
+
+    with profiler.stage('evaluator'):
+        reports = [evaluator.get_report() for evaluator in evaluators]
+        analyses = [evaluator.get_analysis(len(label_names)) for evaluator in evaluators] if analysis_output else None
+
+    if len(iterations) == 1:
+        print(reports[0])
+    else:
+        _print_reports(iterations, reports)
+
+    if analysis_output:
+        for iteration, analysis in zip(iterations, analyses):
+            filepath = analysis_output if len(iterations) == 1 else analysis_output.with_name(f'{analysis_output.stem}_{iteration["id"]}{analysis_output.suffix}')
+            write_analysis(analysis, filepath, label_names)
+            print(f"Saved the per-class analysis to {filepath}")
+
+
+def _to_prediction(pred, tag_mapping, image_size):
+    """Convert the predictions of an image to the evaluator input. image_size is (width, height) for object detection and None for classification."""
+    pred = tag_mapping.filter_predictions(pred, by_name=True)
+    label_ids = tag_mapping.get_indices_by_names([p['label_name'] for p in pred])
+    probabilities = [p['probability'] for p in pred]
+    if image_size:
+        boxes = to_pixel_boxes([[p['left'], p['top'], p['right'], p['bottom']] for p in pred], *image_size)
+        return np.column_stack([label_ids, probabilities, boxes]).tolist()
+
+    scores = np.zeros(len(tag_mapping))
+    scores[label_ids] = probabilities
+    return scores
 
-    evaluator = _get_evaluator(iteration)
-    evaluator.add_predictions(predictions, targets)
-    report = evaluator.get_report()
-    print(report)
+
+def _print_reports(iterations, reports):
+    """Print the metrics of the iterations side by side."""
+    print(f"{'Metric':<20s}" + ''.join(f" {str(iteration['id']):>36s}" for iteration in iterations))
+    for name in reports[0]:
+        print(f"{name:<20s}" + ''.join(f" {report.get(name, float('nan')):>36.4f}" for report in reports))
+
+
+def _to_evaluator_inputs(iteration, predictions, targets, num_labels):
+    if iteration['task_type'] == 'multiclass_classification':
+        return np.array(predictions), np.array([labels[0] if len(labels) else -1 for labels in targets], dtype=np.int64)
+    elif iteration['task_type'] == 'multilabel_classification':
+        target_vectors = np.zeros((len(targets), num_labels), dtype=bool)
+        for i, labels in enumerate(targets):
+            target_vectors[i, labels] = True
+        return np.array(predictions), target_vectors
+    return predictions, targets
 
 
 def _get_evaluator(iteration):
@@ -52,11 +120,27 @@ def _get_evaluator(iteration):
 def main():
     parser = argparse.ArgumentParser("Evaluate a project with a validation dataset")
     parser.add_argument('--project_id', type=uuid.UUID, help="Project Id")
-    parser.add_argument('--iteration_id', type=uuid.UUID, help="Iteration Id")
+    parser.add_argument('--iteration_id', type=uuid.UUID, action='append', help="Iteration Id. Repeat the option to compare multiple iterations side by side.")
     parser.add_argument('dataset_filename', type=pathlib.Path, help="Dataset file path")
+    parser.add_argument('--onnx_model', type=pathlib.Path, help="Run the exported ONNX model (zip) locally instead of calling the prediction endpoint")
+    parser.add_argument('--threshold', type=float, default=0.0, help="Ignore predictions with lower probabilities (default=0)")
+    parser.add_argument('--analysis_output', type=pathlib.Path, help="Write per-class metrics, PR curves, the confusion matrix and the hardest examples to a .json or .npz file")
+    parser.add_argument('--max_workers', type=int, default=8, help="The number of concurrent prediction requests per iteration (default=8)")
+    add_postprocess_arguments(parser)
+    add_profile_arguments(parser)
 
     args = parser.parse_args()
-    evaluate_project(Environment(), args.project_id, args.iteration_id, args.dataset_filename)
+    if args.onnx_model and args.iteration_id and len(args.iteration_id) > 1:
+        parser.error("--onnx_model can be used with only one iteration.")
+
+    if args.max_workers < 1:
+        parser.error("max_workers must be a positive number.")
+
+    validate_postprocess_arguments(parser, args)
+
+    with profile_command(args):
+        evaluate_project(Environment(), args.project_id, args.iteration_id, args.dataset_filename, args.onnx_model, args.threshold, args.iou_threshold, args.max_detections,
+                         args.analysis_output, args.max_workers)
 
 
 if __name__ == '__main__':
@@ -1,10 +1,13 @@
 import argparse
+import os
 import pathlib
+import time
 import uuid
-import requests
-import tenacity
 from ..common import Environment
+from ..metrics import metrics
 from ..training_api import TrainingApi
+from ..profiler import add_profile_arguments, profile_command
+from ..transport import get_session
 
 EXPORT_TYPES = {
     'coreml': ('coreml', None),
@@ -23,18 +26,19 @@ EXPORT_TYPES = {
 }
 
 
-@tenacity.retry(retry=tenacity.retry_if_exception_type(tenacity.TryAgain), wait=tenacity.wait_fixed(3))
-def get_exported_url(training_api, project_id, iteration_id, platform, flavor):
-    response = training_api.get_exports(project_id, iteration_id, platform, flavor)
-    if not response or response['status'] == 'Failed':
-        raise RuntimeError(f"Failed to export. response={response}")
-    elif response['status'] == 'Done':
-        return response['url']
-    elif response['status'] == 'Exporting':
-        print('.', end='', flush=True)
-        raise tenacity.TryAgain
-    else:
-        raise RuntimeError(f"Unexpected response: {response}")
+def get_exported_url(training_api, project_id, iteration_id, platform, flavor, poll_interval=3):
+    """Wait until the export is done and returns the download url."""
+    while True:
+        response = training_api.get_exports(project_id, iteration_id, platform, flavor)
+        if not response or response['status'] == 'Failed':
+            raise RuntimeError(f"Failed to export. response={response}")
+        elif response['status'] == 'Done':
+            return response['url']
+        elif response['status'] == 'Exporting':
+            print('.', end='', flush=True)
+            time.sleep(poll_interval)
+        else:
+            raise RuntimeError(f"Unexpected response: {response}")
 
 
 def export_model(env, project_id, iteration_id, export_type, output_filename, force):
@@ -49,11 +53,22 @@ def export_model(env, project_id, iteration_id, export_type, output_filename, fo
     url = get_exported_url(training_api, project_id, iteration_id, platform, flavor)
 
     print(f"Downloading from {url}")
-    response = requests.get(url)
-    response.raise_for_status()
-    model = response.content
-
-    output_filename.write_bytes(model)
+    start = time.monotonic()
+    num_bytes = 0
+    # Stream to a temporary file so that large models are not kept in memory and a failed download doesn't leave a partial file.
+    temp_filepath = f'{output_filename}.{os.getpid()}.tmp'
+    try:
+        with get_session().get(url, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            with open(temp_filepath, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
+                    num_bytes += len(chunk)
+        os.replace(temp_filepath, output_filename)
+    finally:
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+    metrics.record_request('model_download', 'GET', url, response.status_code, time.monotonic() - start, response.elapsed.total_seconds(), bytes_received=num_bytes)
 
     print(f"Saved to {output_filename}")
 
@@ -65,6 +80,7 @@ def main():
     parser.add_argument('export_type', help="Export type", choices=EXPORT_TYPES.keys())
     parser.add_argument('--output', type=pathlib.Path, help="Output file path")
     parser.add_argument('--force', action='store_true', help="Requests new export even if the model is already exported.")
+    add_profile_arguments(parser)
 
     args = parser.parse_args()
     if not args.output:
@@ -73,7 +89,8 @@ def main():
     if args.output.exists():
         parser.error(f"{args.output} already exists")
 
-    export_model(Environment(), args.project_id, args.iteration_id, args.export_type.lower(), args.output, args.force)
+    with profile_command(args):
+        export_model(Environment(), args.project_id, args.iteration_id, args.export_type.lower(), args.output, args.force)
 
 
 if __name__ == '__main__':
@@ -1,5 +1,7 @@
+import argparse
 from ..common import Environment
 from ..training_api import TrainingApi
+from ..profiler import add_profile_arguments, profile_command
 
 
 def get_domains(env):
@@ -11,7 +13,12 @@ def get_domains(env):
 
 
 def main():
-    get_domains(Environment())
+    parser = argparse.ArgumentParser(description="Show a list of available domains")
+    add_profile_arguments(parser)
+
+    args = parser.parse_args()
+    with profile_command(args):
+        get_domains(Environment())
 
 
 if __name__ == '__main__':
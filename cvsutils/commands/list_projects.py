@@ -1,16 +1,44 @@
 import argparse
+import concurrent.futures
+import json
+from ..cache import DiskCache
 from ..common import Environment
 from ..training_api import TrainingApi
+from ..profiler import add_profile_arguments, profile_command
 
 
-def list_projects(env, verbose):
+def get_projects_metadata(env, verbose, max_workers):
     training_api = TrainingApi(env)
 
     projects = training_api.get_projects()
+    if verbose:
+        # Each project needs its own request. Fetch them concurrently since they are independent.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            all_iterations = executor.map(training_api.get_iterations, [project['id'] for project in projects])
+            for project, iterations in zip(projects, all_iterations):
+                project['iterations'] = iterations
+
+    return projects
+
+
+def list_projects(env, verbose, max_workers=8, cache_ttl=0, output_json=False):
+    cache = DiskCache() if cache_ttl > 0 else None
+    cache_key = f'list_projects|{env.training_endpoint}|{env.training_key}|{verbose}'
+
+    projects = cache.get(cache_key) if cache else None
+    if projects is None:
+        projects = get_projects_metadata(env, verbose, max_workers)
+        if cache:
+            cache.set(cache_key, projects, cache_ttl)
+
+    if output_json:
+        print(json.dumps(projects, indent=2, default=str))
+        return
+
     for project in projects:
         print(f"{project['id']}: {project['name']}. Created: {project['created_at']} Modified: {project['modified_at']}")
         if verbose:
-            iterations = training_api.get_iterations(project['id'])
+            iterations = project['iterations']
             if iterations:
                 print("Iterations:")
                 for iteration in iterations:
@@ -20,9 +48,18 @@ def list_projects(env, verbose):
 def main():
     parser = argparse.ArgumentParser(description="Show a list of projects")
     parser.add_argument('--verbose', '-v', action='store_true')
+    parser.add_argument('--max_workers', type=int, default=8, help="The number of concurrent requests (default=8)")
+    parser.add_argument('--cache_ttl', type=int, default=0, help="Cache the listing on the local disk for the given seconds. Set CVS_CACHE_DIR to change the location.")
+    parser.add_argument('--json', action='store_true', help="Print the result in JSON format")
+    add_profile_arguments(parser)
 
     args = parser.parse_args()
-    list_projects(Environment(), args.verbose)
+
+    if args.max_workers < 1:
+        parser.error("max_workers must be a positive number.")
+
+    with profile_command(args):
+        list_projects(Environment(), args.verbose, args.max_workers, args.cache_ttl, args.json)
 
 
 if __name__ == '__main__':
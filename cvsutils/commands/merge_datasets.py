@@ -0,0 +1,34 @@
+import argparse
+import pathlib
+from ..dataset import DatasetWriter
+from ..profiler import add_profile_arguments, profile_command
+
+
+def merge_datasets(input_dataset_filepaths, output_dataset_filepath, shuffle=True):
+    output_dataset_filepath.parent.mkdir(parents=True)
+    DatasetWriter.concatenate(input_dataset_filepaths, output_dataset_filepath, shuffle)
+    print(f"Merged {len(input_dataset_filepaths)} datasets into {output_dataset_filepath}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge datasets that have the same labels, e.g. the outputs of sharded cvs_predict_dataset.")
+    parser.add_argument('output_directory', type=pathlib.Path)
+    parser.add_argument('input_dataset_filepaths', type=pathlib.Path, nargs='+')
+    parser.add_argument('--no-shuffle', dest='shuffle', action='store_false', help="Keep the order of the input datasets")
+    add_profile_arguments(parser)
+
+    args = parser.parse_args()
+
+    if args.output_directory.exists():
+        parser.error(f"{args.output_directory} already exists.")
+
+    for filepath in args.input_dataset_filepaths:
+        if not filepath.is_file():
+            parser.error(f"{filepath} is not found.")
+
+    with profile_command(args):
+        merge_datasets(args.input_dataset_filepaths, args.output_directory / 'images.txt', args.shuffle)
+
+
+if __name__ == '__main__':
+    main()
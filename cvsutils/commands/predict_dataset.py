@@ -1,45 +1,71 @@
 import argparse
+import contextlib
 from collections import defaultdict
 import pathlib
 import uuid
-import tqdm
-from ..common import Environment, with_published, compress_image_if_needed_for_prediction, get_image_size
+import numpy as np
+from ..common import Environment, compress_image_if_needed_for_prediction, get_image_size, get_task_type
 from ..dataset import DatasetReader, DatasetWriter, Dataset
+from ..labels import TagMapping, to_pixel_boxes
 from ..prediction_api import PredictionApi
+from ..postprocess import PostProcessor, add_postprocess_arguments, validate_postprocess_arguments
+from ..prediction_backend import open_prediction_backend
+from ..tiling import TiledPredictionBackend, allow_large_images
 from ..training_api import TrainingApi
+from ..profiler import add_profile_arguments, profile_command
 
+BATCH_SIZE = 16  # The number of images to predict at once with a local model.
 
-def predict_dataset(env, project_id, iteration_id, input_dataset_filepath, output_dataset_filepath, prob_thresholds_per_label):
+
+def predict_dataset(env, project_id, iteration_id, input_dataset_filepath, output_dataset_filepath, prob_thresholds_per_label, shard_index=0, num_shards=1, shuffle=True, onnx_model=None,
+                    tile_size=None, tile_overlap=128, max_workers=8, iou_threshold=None, max_detections=None):
+    import tqdm
     training_api = TrainingApi(env)
     prediction_api = PredictionApi(env)
 
     iteration = training_api.get_iteration(project_id, iteration_id)
-    domain_type = 'object_detection' if iteration['task_type'] == 'object_detection' else 'image_classification'
+    domain_type = get_task_type(iteration)
     cvs_labels = training_api.get_tags(project_id, iteration_id)
+    if tile_size and domain_type != 'object_detection':
+        raise RuntimeError("Tiled prediction is supported only for object detection.")
 
-    dataset = DatasetReader.open(input_dataset_filepath)
+    dataset = DatasetReader.open(input_dataset_filepath, shard_index, num_shards)
     new_dataset = Dataset(domain_type, output_dataset_filepath.parent)
     tag_names, tag_ids = zip(*cvs_labels)
     new_dataset.labels = tag_names
-
-    with with_published(training_api, iteration) as publish_name:
-        for i in tqdm.tqdm(range(len(dataset)), "Predicting"):
-            original_image_binary, _ = dataset.get(i)
-            image_binary = compress_image_if_needed_for_prediction(original_image_binary)
-            width, height = get_image_size(image_binary)
-            pred = prediction_api.predict(project_id, dataset.dataset_type, publish_name, image_binary)
-            pred = [p for p in pred if p['probability'] > prob_thresholds_per_label[p['label_name']]]
-            if domain_type == 'image_classification':
-                labels = [tag_ids.index(p['label_id']) for p in pred]
-            elif domain_type == 'object_detection':
-                labels = [[tag_ids.index(p['label_id']), int(p['left'] * width), int(p['top'] * height), int(p['right'] * width), int(p['bottom'] * height)] for p in pred]
-            else:
-                raise RuntimeError
-
-            new_dataset.add_data(original_image_binary, labels)
+    tag_mapping = TagMapping(tag_names, tag_ids)
+    postprocessor = PostProcessor(thresholds_per_label=prob_thresholds_per_label, iou_threshold=iou_threshold, max_detections=max_detections)
+
+    # Shards may run at the same time on multiple machines. If each of them published the iteration, the first shard to finish would unpublish it for the others.
+    # So sharded runs require a published iteration.
+    publish = num_shards == 1
+    with open_prediction_backend(training_api, prediction_api, iteration, dataset.dataset_type, onnx_model, max_workers, publish) as backend:
+        with tqdm.tqdm(total=len(dataset), desc="Predicting") as progress:
+            if tile_size:
+                # The tiled backend compresses each tile instead of the whole image. The boxes are relative to the original image.
+                backend = TiledPredictionBackend(backend, tile_size, tile_overlap)
+            for start in range(0, len(dataset), BATCH_SIZE):
+                original_image_binaries = [dataset.get(i)[0] for i in range(start, min(start + BATCH_SIZE, len(dataset)))]
+                image_binaries = original_image_binaries if tile_size else [compress_image_if_needed_for_prediction(image_binary) for image_binary in original_image_binaries]
+                for original_image_binary, image_binary, pred in zip(original_image_binaries, image_binaries, backend.predict_batch(image_binaries)):
+                    # The original images are measured in tiled prediction. They can exceed PIL's default limit.
+                    with allow_large_images(backend.max_image_pixels) if tile_size else contextlib.nullcontext():
+                        width, height = get_image_size(image_binary)
+                    pred = tag_mapping.filter_predictions(postprocessor(pred))
+                    if domain_type == 'image_classification':
+                        labels = [tag_mapping.get_index_by_id(p['label_id']) for p in pred]
+                    elif domain_type == 'object_detection':
+                        label_ids = tag_mapping.get_indices_by_ids([p['label_id'] for p in pred])
+                        boxes = to_pixel_boxes([[p['left'], p['top'], p['right'], p['bottom']] for p in pred], width, height)
+                        labels = np.column_stack([label_ids, boxes.astype(np.int64)])
+                    else:
+                        raise RuntimeError
+
+                    new_dataset.add_data(original_image_binary, labels)
+                progress.update(len(image_binaries))
 
     output_dataset_filepath.parent.mkdir(parents=True)
-    DatasetWriter.write(new_dataset, output_dataset_filepath)
+    DatasetWriter.write(new_dataset, output_dataset_filepath, shuffle)
     print(f"Successfully saved the prediction results to {output_dataset_filepath}")
 
 
@@ -51,6 +77,15 @@ def main():
     parser.add_argument('output_directory', type=pathlib.Path)
     parser.add_argument('--threshold', type=float, default=0.1, help="Probability threshold (default=0.1)")
     parser.add_argument('--threshold_per_label', default=[], nargs=2, metavar=('LABEL_NAME', 'THRESHOLD'), action='append', help="Probability threshold per label")
+    parser.add_argument('--shard_index', type=int, default=0, help="Predict only the images i where i %% num_shards == shard_index")
+    parser.add_argument('--num_shards', type=int, default=1, help="The number of shards. Use cvs_merge_datasets to merge the outputs. The iteration must be published unless --onnx_model is given.")
+    parser.add_argument('--no-shuffle', dest='shuffle', action='store_false', help="Keep the order of the input images")
+    parser.add_argument('--onnx_model', type=pathlib.Path, help="Run the exported ONNX model (zip) locally instead of calling the prediction endpoint")
+    parser.add_argument('--tile_size', type=int, help="Split large images into tiles of this size in pixels and predict each tile. Object detection only.")
+    parser.add_argument('--tile_overlap', type=int, default=128, help="Overlap between the tiles in pixels (default=128)")
+    parser.add_argument('--max_workers', type=int, default=8, help="The number of concurrent prediction requests (default=8)")
+    add_postprocess_arguments(parser)
+    add_profile_arguments(parser)
 
     args = parser.parse_args()
 
@@ -66,12 +101,26 @@ def main():
     if not (0 <= args.threshold <= 1):
         parser.error(f"Threshold must be in range [0, 1]. threshold={args.threshold}")
 
+    if not (0 <= args.shard_index < args.num_shards):
+        parser.error(f"shard_index must be in range [0, {args.num_shards}).")
+
+    if args.tile_size is not None and not (0 <= args.tile_overlap < args.tile_size):
+        parser.error(f"tile_overlap must be in range [0, tile_size). tile_overlap={args.tile_overlap}")
+
+    if args.max_workers < 1:
+        parser.error("max_workers must be a positive number.")
+
+    validate_postprocess_arguments(parser, args)
+
     prob_thresholds_per_label = defaultdict(lambda: args.threshold)
     for label_name, threshold in args.threshold_per_label:
         prob_thresholds_per_label[label_name] = float(threshold)
 
     output_dataset_filepath = args.output_directory / 'images.txt'
-    predict_dataset(Environment(), args.project_id, args.iteration_id, args.input_dataset_filepath, output_dataset_filepath, prob_thresholds_per_label)
+    with profile_command(args):
+        predict_dataset(Environment(), args.project_id, args.iteration_id, args.input_dataset_filepath, output_dataset_filepath, prob_thresholds_per_label,
+                        args.shard_index, args.num_shards, args.shuffle, args.onnx_model, args.tile_size, args.tile_overlap, args.max_workers,
+                        args.iou_threshold, args.max_detections)
 
 
 if __name__ == '__main__':
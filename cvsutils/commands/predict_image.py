@@ -1,45 +1,182 @@
 import argparse
+import glob
+import json
 import pathlib
+import sys
+import time
 import uuid
-from ..common import Environment, get_task_type_by_domain_id, with_published
+from ..common import Environment, compress_image_if_needed_for_prediction, get_task_type
+from ..postprocess import PostProcessor, add_postprocess_arguments, validate_postprocess_arguments
 from ..prediction_api import PredictionApi
+from ..prediction_backend import open_prediction_backend
 from ..training_api import TrainingApi
+from ..profiler import add_profile_arguments, profile_command
 
+IMAGE_EXTENSIONS = {'.bmp', '.gif', '.jpeg', '.jpg', '.png', '.tif', '.tiff', '.webp'}
 
-def predict_image(env, project_id, iteration_id, image_filepath, threshold):
+
+def _is_glob(pattern):
+    return any(c in pattern for c in '*?[')
+
+
+def find_image_files(inputs):
+    """Expand the inputs into a list of image file paths.
+
+    Each input is an image file, a directory (searched recursively), a glob pattern or @<file> that has a path per line.
+    """
+    filepaths = []
+    for input_path in inputs:
+        if input_path.startswith('@'):
+            with open(input_path[1:]) as f:
+                filepaths.extend(pathlib.Path(line.strip()) for line in f if line.strip())
+        elif _is_glob(input_path):
+            filepaths.extend(pathlib.Path(p) for p in sorted(glob.glob(input_path, recursive=True)) if pathlib.Path(p).suffix.lower() in IMAGE_EXTENSIONS)
+        elif pathlib.Path(input_path).is_dir():
+            filepaths.extend(sorted(p for p in pathlib.Path(input_path).rglob('*') if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS))
+        else:
+            filepaths.append(pathlib.Path(input_path))
+    return filepaths
+
+
+def _get_file_size(filepath):
+    try:
+        return filepath.stat().st_size
+    except OSError:
+        return None
+
+
+def _to_json(image_filepath, predictions=None, error=None):
+    if error:
+        return json.dumps({'image': str(image_filepath), 'error': error})
+    predictions = [{**p, 'label_id': str(p['label_id']) if p['label_id'] else None} for p in predictions]
+    return json.dumps({'image': str(image_filepath), 'predictions': predictions})
+
+
+def _print_result(task_type, predictions):
+    for p in predictions:
+        if task_type == 'image_classification':
+            print(f"{p['label_name']:<16s}: {p['probability']:.3f}")
+        else:
+            print(f"{p['label_name']:<16s}: {p['probability']:.3f} box: ({p['left']:.2f}, {p['top']:.2f}, {p['right']:.2f}, {p['bottom']:.2f})")
+
+
+def _predict_files(backend, filepaths, postprocessor):
+    """Predict the images. Yields tuples (filepath, predictions, error)."""
+    images = {}
+    for filepath in filepaths:
+        try:
+            images[filepath] = compress_image_if_needed_for_prediction(filepath.read_bytes())
+        except Exception as e:
+            yield filepath, None, f"Failed to read the image: {e}"
+
+    try:
+        results = backend.predict_batch(list(images.values()))
+    except Exception:
+        # Find the failed images.
+        results = []
+        for image in images.values():
+            try:
+                results.append(backend.predict(image))
+            except Exception as e:
+                results.append(e)
+
+    for filepath, result in zip(images, results):
+        if isinstance(result, Exception):
+            yield filepath, None, f"Failed to predict: {result}"
+        else:
+            yield filepath, postprocessor(result), None
+
+
+def predict_image(env, project_id, iteration_id, image_filepath, threshold, onnx_model=None, iou_threshold=None, max_detections=None):
+    """Predict a single image and print the result."""
     training_api = TrainingApi(env)
     prediction_api = PredictionApi(env)
 
     image = image_filepath.read_bytes()
     iteration = training_api.get_iteration(project_id, iteration_id)
-    task_type = get_task_type_by_domain_id(iteration['domain_id'])
+    task_type = get_task_type(iteration)
+
+    with open_prediction_backend(training_api, prediction_api, iteration, task_type, onnx_model) as backend:
+        result = backend.predict(image)
+
+    _print_result(task_type, PostProcessor(threshold, iou_threshold=iou_threshold, max_detections=max_detections)(result))
+
+
+def predict_images(env, project_id, iteration_id, inputs, threshold, onnx_model=None, max_workers=8, watch=False, poll_interval=2.0, iou_threshold=None, max_detections=None):
+    """Predict all images in the inputs through a single published iteration and print the results as JSON Lines.
+
+    If watch is True, the inputs are scanned every poll_interval seconds and new files are predicted once their size stops changing.
+    """
+    training_api = TrainingApi(env)
+    prediction_api = PredictionApi(env)
+
+    iteration = training_api.get_iteration(project_id, iteration_id)
+    task_type = get_task_type(iteration)
+    batch_size = max(16, max_workers * 4)
+    postprocessor = PostProcessor(threshold, iou_threshold=iou_threshold, max_detections=max_detections)
+    num_images = 0
 
-    with with_published(training_api, iteration) as publish_name:
-        result = prediction_api.predict(project_id, task_type, publish_name, image)
+    with open_prediction_backend(training_api, prediction_api, iteration, task_type, onnx_model, max_workers) as backend:
+        seen = set()
+        pending_sizes = {}  # New files found in the previous scan in watch mode. filepath => size
+        is_first_scan = True
+        while True:
+            filepaths = [p for p in find_image_files(inputs) if p not in seen]
+            if not is_first_scan:
+                # Skip files that are still being written.
+                sizes = {p: size for p, size in ((p, _get_file_size(p)) for p in filepaths) if size is not None}
+                filepaths = [p for p in filepaths if p in sizes and pending_sizes.get(p) == sizes[p]]
+                pending_sizes = sizes
+            is_first_scan = False
 
-    result = sorted(result, key=lambda r: r['probability'], reverse=True)
+            seen.update(filepaths)
+            for i in range(0, len(filepaths), batch_size):
+                for filepath, predictions, error in _predict_files(backend, filepaths[i:i + batch_size], postprocessor):
+                    print(_to_json(filepath, predictions, error), flush=True)
+                    num_images += 1
 
-    for p in result:
-        if p['probability'] > threshold:
-            if task_type == 'image_classification':
-                print(f"{p['label_name']:<16s}: {p['probability']:.3f}")
-            else:
-                print(f"{p['label_name']:<16s}: {p['probability']:.3f} box: ({p['left']:.2f}, {p['top']:.2f}, {p['right']:.2f}, {p['bottom']:.2f})")
+            if not watch:
+                break
+            try:
+                time.sleep(poll_interval)
+            except KeyboardInterrupt:
+                break
+
+    print(f"Predicted {num_images} images.", file=sys.stderr)
 
 
 def main():
-    parser = argparse.ArgumentParser(description="Send a prediction request to Custom Vision Service")
+    parser = argparse.ArgumentParser(description="Send prediction requests to Custom Vision Service")
     parser.add_argument('project_id', help="Project Id")
     parser.add_argument('iteration_id', help="Iteration Id")
-    parser.add_argument('image_filepath', type=pathlib.Path, help="Image filename")
+    parser.add_argument('inputs', nargs='+', help="Image files, directories, glob patterns or @<file> that has an image path per line")
     parser.add_argument('--threshold', type=float, default=0, help="Probability threshold to show")
+    parser.add_argument('--onnx_model', type=pathlib.Path, help="Run the exported ONNX model (zip) locally instead of calling the prediction endpoint")
+    parser.add_argument('--jsonl', action='store_true', help="Print the results as JSON Lines. This is the default if there are multiple images.")
+    parser.add_argument('--max_workers', type=int, default=8, help="The number of concurrent requests")
+    parser.add_argument('--watch', action='store_true', help="Keep watching the inputs and predict new images until interrupted")
+    parser.add_argument('--poll_interval', type=float, default=2.0, help="Seconds between scans in the watch mode")
+    add_postprocess_arguments(parser)
+    add_profile_arguments(parser)
 
     args = parser.parse_args()
 
-    if not args.image_filepath.exists():
-        parser.error("f{args.image_filepath} is not found")
+    if args.max_workers < 1:
+        parser.error("max_workers must be a positive number.")
+
+    validate_postprocess_arguments(parser, args)
+
+    single_image = len(args.inputs) == 1 and pathlib.Path(args.inputs[0]).is_file()
+    if len(args.inputs) == 1 and not args.watch and not pathlib.Path(args.inputs[0]).exists() and not _is_glob(args.inputs[0]) and not args.inputs[0].startswith('@'):
+        parser.error(f"{args.inputs[0]} is not found")
 
-    predict_image(Environment(), uuid.UUID(args.project_id), uuid.UUID(args.iteration_id), args.image_filepath, args.threshold)
+    with profile_command(args):
+        if single_image and not args.jsonl and not args.watch:
+            predict_image(Environment(), uuid.UUID(args.project_id), uuid.UUID(args.iteration_id), pathlib.Path(args.inputs[0]), args.threshold, args.onnx_model,
+                          args.iou_threshold, args.max_detections)
+        else:
+            predict_images(Environment(), uuid.UUID(args.project_id), uuid.UUID(args.iteration_id), args.inputs, args.threshold, args.onnx_model, args.max_workers, args.watch, args.poll_interval,
+                           args.iou_threshold, args.max_detections)
 
 
 if __name__ == '__main__':
@@ -2,6 +2,7 @@ import argparse
 import uuid
 from ..common import Environment
 from ..training_api import TrainingApi
+from ..profiler import add_profile_arguments, profile_command
 
 
 def remove_iteration(env, project_id, iteration_id):
@@ -16,10 +17,12 @@ def main():
     parser = argparse.ArgumentParser("Remove an iteration")
     parser.add_argument('project_id', type=str)
     parser.add_argument('iteration_id', type=str)
+    add_profile_arguments(parser)
 
     args = parser.parse_args()
 
-    remove_iteration(Environment(), uuid.UUID(args.project_id), uuid.UUID(args.iteration_id))
+    with profile_command(args):
+        remove_iteration(Environment(), uuid.UUID(args.project_id), uuid.UUID(args.iteration_id))
 
 
 if __name__ == '__main__':
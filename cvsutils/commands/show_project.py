@@ -2,6 +2,7 @@ import argparse
 import uuid
 from ..common import Environment
 from ..training_api import TrainingApi
+from ..profiler import add_profile_arguments, profile_command
 
 
 def show_project(env, project_id):
@@ -26,9 +27,11 @@ def show_project(env, project_id):
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('project_id', type=uuid.UUID)
+    add_profile_arguments(parser)
 
     args = parser.parse_args()
-    show_project(Environment(), args.project_id)
+    with profile_command(args):
+        show_project(Environment(), args.project_id)
 
 
 if __name__ == '__main__':
@@ -1,38 +1,59 @@
 import argparse
-import time
+import json
+import pathlib
 import uuid
 from ..common import Environment
 from ..training_api import TrainingApi
+from ..training_orchestrator import TrainingOrchestrator
+from ..profiler import add_profile_arguments, profile_command
 
 
-def train_project(env, project_id, force, domain_id, classification_type, export_capability):
-    training_api = TrainingApi(env)
+def _print_result(result):
+    if result['status'] == 'Completed':
+        print(f"Training completed: project_id={result['project_id']}, iteration_id={result['iteration_id']}, {result['training_time']}s")
+        if 'average_precision' in result:
+            print(f"Average Precision={result['average_precision']}, Precision={result['precision']}, Recall={result['recall']}")
+    else:
+        print(f"Training failed: project_id={result['project_id']}, iteration_id={result['iteration_id']}, status={result['status']}")
+
+    if result['error']:
+        print(result['error'])
+
 
-    iteration_id = training_api.train(project_id, force, domain_id, classification_type, export_capability)
-    print(f"Training started: iteration_id={iteration_id}")
+def train_project(env, project_ids, force, domain_id, classification_type, export_capability, max_workers=8, report_filepath=None):
+    training_api = TrainingApi(env)
+    orchestrator = TrainingOrchestrator(training_api, max_workers=max_workers)
 
-    status = 'Training'
-    start_time = time.time()
-    while status == 'Training':
-        status = training_api.get_iteration(project_id, iteration_id)['status']
-        time.sleep(5)
+    print(f"Starting training on {len(project_ids)} projects")
+    results = orchestrator.train(project_ids, force, domain_id, classification_type, export_capability, callback=_print_result)
 
-    print(f"Training completed: {time.time()-start_time}s")
+    num_completed = sum(1 for r in results if r['status'] == 'Completed')
+    print(f"{num_completed}/{len(results)} projects completed training.")
 
-    results = training_api.get_iteration_eval(project_id, iteration_id)
-    print(f"Average Precision={results['average_precision']}, Precision={results['precision']}, Recall={results['recall']}")
+    if report_filepath:
+        report_filepath.write_text(json.dumps(results, indent=2, default=str))
+        print(f"Saved the report to {report_filepath}")
 
 
 def main():
-    parser = argparse.ArgumentParser("Train a project")
-    parser.add_argument('project_id', type=str, help="Project id")
+    parser = argparse.ArgumentParser("Train projects")
+    parser.add_argument('project_id', type=str, nargs='+', help="Project ids")
     parser.add_argument('--domain_id', type=str, default=None, help="Domain id")
     parser.add_argument('--force', action='store_true', help="Trigger training even if the dataset is not changed")
     parser.add_argument('--type', choices=['multiclass', 'multilabel'], default=None, help="Classification type")
     parser.add_argument('--capability', nargs='+', help="Export capability")
+    parser.add_argument('--max_workers', type=int, default=8, help="The number of projects to start training concurrently")
+    parser.add_argument('--report', type=pathlib.Path, help="Write a summary report in JSON format")
+    add_profile_arguments(parser)
 
     args = parser.parse_args()
-    train_project(Environment(), uuid.UUID(args.project_id), args.force, args.domain_id, args.type, args.capability)
+
+    if args.max_workers < 1:
+        parser.error("max_workers must be a positive number.")
+
+    project_ids = [uuid.UUID(p) for p in args.project_id]
+    with profile_command(args):
+        train_project(Environment(), project_ids, args.force, args.domain_id, args.type, args.capability, args.max_workers, args.report)
 
 
 if __name__ == '__main__':
@@ -1,26 +1,135 @@
 import argparse
+import collections
+import concurrent.futures
+import hashlib
 import io
-import PIL
-import tqdm
-from ..dataset import DatasetReader
+import json
+import os
+import pathlib
+import PIL.Image
+from ..dataset import DatasetReader, FileReader
+from ..profiler import add_profile_arguments, profile_command
 
+BOX_RULE = "Errors: 0 <= x < x2 and 0 <= y < y2 as in Dataset.validate(). Warnings: x2 > image width or y2 > image height."
 
-def validate_dataset_file(dataset_filename):
-    dataset = DatasetReader.open(dataset_filename)
-    dataset.validate()
+_reader = None
 
-    for i in tqdm.tqdm(range(len(dataset))):
-        image, labels = dataset.get(i)
-        size = PIL.Image.open(io.BytesIO(image)).size
-        assert size[0] > 0 and size[1] > 0
+
+def _init_worker(base_dir):
+    global _reader
+    _reader = FileReader(base_dir)
+
+
+def _validate_image(task):
+    """Validate an image and its labels. This runs in a worker process. Returns (index, image_hash, errors, warnings).
+
+    The bounding boxes must satisfy the same rule as Dataset.validate(): 0 <= x < x2 and 0 <= y < y2. Boxes that extend beyond the image are warnings.
+    """
+    index, image, labels, dataset_type, num_labels, full_decode = task
+    errors = []
+    warnings = []
+    try:
+        image = _reader.read(image, 'rb') if isinstance(image, str) else image
+    except Exception as e:
+        return index, None, [f"Failed to read the image: {e}"], warnings
+
+    image_hash = hashlib.sha1(image).hexdigest()
+    try:
+        with PIL.Image.open(io.BytesIO(image)) as img:
+            width, height = img.size
+            if full_decode:
+                img.load()
+    except Exception as e:
+        return index, image_hash, [f"Failed to decode the image: {e}"], warnings
+
+    if width <= 0 or height <= 0:
+        errors.append(f"Invalid image size: {width}x{height}")
+
+    if dataset_type == 'image_classification':
+        label_ids = labels
+    else:
+        label_ids = [label[0] for label in labels]
+        for label, x, y, x2, y2 in labels:
+            if not (0 <= x < x2 and 0 <= y < y2):
+                errors.append(f"Invalid bounding box: {label} {x} {y} {x2} {y2}")
+            elif x2 > width or y2 > height:
+                warnings.append(f"Bounding box extends beyond the image ({width}x{height}): {label} {x} {y} {x2} {y2}")
+
+    for label_id in label_ids:
+        if not (0 <= label_id < num_labels):
+            errors.append(f"Label id is out of range [0, {num_labels}): {label_id}")
+
+    return index, image_hash, errors, warnings
+
+
+def validate_dataset_file(dataset_filename, full_decode=False, num_workers=None, report_filepath=None, shard_index=0, num_shards=1):
+    """Validate a dataset. If num_shards > 1, only the images in the shard are validated and the indices in the report are relative to the shard."""
+    import tqdm
+    report = {'dataset': str(dataset_filename), 'shard_index': shard_index, 'num_shards': num_shards, 'num_images': 0, 'full_decode': full_decode,
+              'box_rule': BOX_RULE, 'errors': [], 'warnings': [], 'duplicates': []}
+    try:
+        # Dataset.validate() stops at the first invalid label. The labels are checked per image below so that all of them are reported.
+        dataset = DatasetReader.open(dataset_filename, shard_index, num_shards, validate=False)
+    except Exception as e:
+        report['errors'].append({'index': None, 'image': None, 'message': f"Failed to load the dataset: {e}"})
+        dataset = None
+
+    if dataset is not None:
+        report['num_images'] = len(dataset)
+        if not dataset.image_refs:
+            report['errors'].append({'index': None, 'image': None, 'message': "The dataset has no images"})
+        num_labels = len(dataset.labels)
+        tasks = ((i, image, dataset.label_store.get(i), dataset.dataset_type, num_labels, full_decode) for i, image in enumerate(dataset.image_refs))
+        hashes = collections.defaultdict(list)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(dataset.reader.base_dir,)) as executor:
+            for index, image_hash, errors, warnings in tqdm.tqdm(executor.map(_validate_image, tasks, chunksize=64), total=len(dataset)):
+                if image_hash:
+                    hashes[image_hash].append(index)
+                image = dataset.image_refs[index]
+                image_name = image if isinstance(image, str) else None
+                report['errors'].extend({'index': index, 'image': image_name, 'message': message} for message in errors)
+                report['warnings'].extend({'index': index, 'image': image_name, 'message': message} for message in warnings)
+
+        report['duplicates'] = [indices for indices in hashes.values() if len(indices) > 1]
+
+    for error in report['errors']:
+        print(f"{error['index']} {error['image']}: {error['message']}")
+    for warning in report['warnings']:
+        print(f"{warning['index']} {warning['image']}: Warning: {warning['message']}")
+    for indices in report['duplicates']:
+        print(f"Duplicate images: {indices}")
+    print(f"Found {len(report['errors'])} errors, {len(report['warnings'])} warnings and {len(report['duplicates'])} groups of duplicate images in {report['num_images']} images.")
+
+    if report_filepath:
+        report_filepath.write_text(json.dumps(report, indent=2))
+        print(f"Saved the report to {report_filepath}")
+
+    return not report['errors']
 
 
 def main():
     parser = argparse.ArgumentParser("Validate a dataset file")
     parser.add_argument('dataset_filename', type=str, help="Dataset file path")
+    parser.add_argument('--depth', choices=['header', 'full'], default='header', help="header: Read only image headers. full: Decode whole images to detect truncated files.")
+    parser.add_argument('--num_workers', type=int, default=os.cpu_count(), help="The number of worker processes")
+    parser.add_argument('--report', type=pathlib.Path, help="Write the result in JSON format")
+    parser.add_argument('--shard_index', type=int, default=0, help="Validate only the images i where i %% num_shards == shard_index")
+    parser.add_argument('--num_shards', type=int, default=1)
+    add_profile_arguments(parser)
 
     args = parser.parse_args()
-    validate_dataset_file(args.dataset_filename)
+
+    if args.num_workers < 1:
+        parser.error("num_workers must be a positive number.")
+
+    if not (0 <= args.shard_index < args.num_shards):
+        parser.error(f"shard_index must be in range [0, {args.num_shards}).")
+
+    with profile_command(args):
+        is_valid = validate_dataset_file(args.dataset_filename, args.depth == 'full', args.num_workers, args.report, args.shard_index, args.num_shards)
+
+    if not is_valid:
+        raise SystemExit(1)
 
 
 if __name__ == '__main__':
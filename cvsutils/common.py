@@ -2,13 +2,18 @@ import contextlib
 import io
 import logging
 import os
+import sys
+import time
 import uuid
-import PIL.Image
-import requests
-import tenacity
+from .metrics import dump_at_exit, metrics, record_response
+from .profiler import profiler
+from .retry import retry_on_io_error
+from .transport import get_session
 
 logger = logging.getLogger(__name__)
 
+# numpy, PIL and requests are imported in the functions that use them so that light commands start quickly.
+
 
 KNOWN_DOMAINS = {
     uuid.UUID('ee85a74c-405e-4adc-bb47-ffa8ca0c9f31'): 'image_classification',  # General
@@ -43,6 +48,14 @@ class Environment:
 
         self._prediction_resource_id = os.getenv('CVS_PREDICTION_RESOURCE_ID', None)
 
+        # Metadata cache for TrainingApi. One of 'memory', 'disk' or 'none'.
+        self._cache_type = os.getenv('CVS_CACHE', 'memory')
+
+        # If set, request metrics are written to this file when the command exits.
+        metrics_filepath = os.getenv('CVS_METRICS_FILE', None)
+        if metrics_filepath:
+            dump_at_exit(metrics_filepath)
+
     @property
     def training_key(self):
         if not self._training_key:
@@ -69,46 +82,90 @@ class Environment:
             raise RuntimeError('Please set CVS_PREDICTION_RESOURCE_ID')
         return self._prediction_resource_id
 
+    @property
+    def cache_type(self):
+        if self._cache_type not in ('memory', 'disk', 'none'):
+            raise RuntimeError(f'Unknown CVS_CACHE: {self._cache_type}')
+        return self._cache_type
+
+
+def _record_download_retry(retry_state):
+    # The arguments are (self, url)
+    metrics.record_retry('image_download', 'GET', retry_state.args[1])
+
 
 class ImageDownloader:
     def __init__(self):
-        self._session = requests.Session()
+        self._session_instance = None
 
-    @tenacity.retry(reraise=True, retry=tenacity.retry_if_exception_type(IOError), stop=tenacity.stop_after_attempt(4), wait=tenacity.wait_exponential())
+    @property
+    def _session(self):
+        if self._session_instance is None:
+            self._session_instance = get_session()
+        return self._session_instance
+
+    @profiler.profile('ImageDownloader.download_binary')
+    @retry_on_io_error(before_sleep=_record_download_retry, reraise=True)
     def download_binary(self, url):
-        response = self._session.get(url)
+        start = time.monotonic()
+        try:
+            response = self._session.get(url)
+        except IOError:
+            metrics.record_request('image_download', 'GET', url, None, time.monotonic() - start)
+            raise
+
+        record_response('image_download', 'GET', url, response, time.monotonic() - start)
         response.raise_for_status()
         return response.content
 
 
+def get_task_type(iteration):
+    """Returns 'image_classification' or 'object_detection' for an iteration returned by TrainingApi.get_iteration()."""
+    return 'object_detection' if iteration['task_type'] == 'object_detection' else 'image_classification'
+
+
 def get_task_type_by_domain_id(domain_id):
     assert isinstance(domain_id, uuid.UUID)
     return KNOWN_DOMAINS.get(domain_id, None)
 
 
+def get_domain_type(training_api, domain_id):
+    """Returns the domain type. The API is called only if the domain is not in KNOWN_DOMAINS."""
+    return get_task_type_by_domain_id(domain_id) or training_api.get_domain(domain_id)['type']
+
+
 @contextlib.contextmanager
-def with_published(training_api, iteration):
+def with_published(training_api, iteration, publish=True):
+    """Yields the publish name of the iteration. If it is not published, it is published while the context is active.
+
+    If publish is False, the iteration must be published already.
+    """
     publish_name = iteration['publish_name']
     published = False
+    if not publish_name and not publish:
+        raise RuntimeError(f"The iteration {iteration['id']} is not published. Publish it before running this command.")
     if not publish_name:
         publish_name = uuid.uuid4()
         training_api.publish_iteration(iteration['project_id'], iteration['id'], publish_name)
         published = True
-        print(f"Published the iteration to {publish_name}")
-
-    yield publish_name
+        print(f"Published the iteration to {publish_name}", file=sys.stderr)  # Keep stdout for the results.
 
-    if published:
-        training_api.unpublish_iteration(iteration['project_id'], iteration['id'])
-        print("Unpublished the iteration")
+    try:
+        yield publish_name
+    finally:
+        if published:
+            training_api.unpublish_iteration(iteration['project_id'], iteration['id'])
+            print("Unpublished the iteration", file=sys.stderr)
 
 
+@profiler.profile('compress_image_if_needed_for_prediction')
 def compress_image_if_needed_for_prediction(image_binary):
     MAX_IMAGE_SIZE = 4194304
 
     if len(image_binary) < MAX_IMAGE_SIZE:
         return image_binary
 
+    import PIL.Image
     logger.warning(f"Image size is too large. Re-compressing... ({len(image_binary)})")
     with PIL.Image.open(io.BytesIO(image_binary)) as image:
         # First, re-compress with JPEG.
@@ -124,7 +181,9 @@ def compress_image_if_needed_for_prediction(image_binary):
     raise RuntimeError(f"Failed to compress the image size. ({len(image_binary)})")
 
 
+@profiler.profile('get_image_size')
 def get_image_size(image_binary):
     """Returns image's (width, height)."""
+    import PIL.Image
     with PIL.Image.open(io.BytesIO(image_binary)) as f:
         return f.size
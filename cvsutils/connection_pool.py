@@ -0,0 +1,49 @@
+import threading
+import requests.adapters
+import urllib3.connectionpool
+from .metrics import metrics
+
+_lock = threading.Lock()
+
+
+class _TrackedPoolMixin:
+    """Reports the usage of the pool to the metrics."""
+    _num_in_use = 0
+
+    @property
+    def _metrics_host(self):
+        return f'{self.host}:{self.port}'
+
+    def _new_conn(self):
+        metrics.record_connection_opened(self._metrics_host)
+        return super()._new_conn()
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        with _lock:
+            self._num_in_use += 1
+            num_in_use = self._num_in_use
+        metrics.record_connection_acquired(self._metrics_host, num_in_use, self.pool.maxsize if self.pool is not None else 0)
+        return conn
+
+    def _put_conn(self, conn):
+        with _lock:
+            self._num_in_use -= 1
+        if conn and self.pool is not None and self.pool.full():
+            metrics.record_connection_discarded(self._metrics_host)
+        super()._put_conn(conn)
+
+
+class TrackedHTTPConnectionPool(_TrackedPoolMixin, urllib3.connectionpool.HTTPConnectionPool):
+    pass
+
+
+class TrackedHTTPSConnectionPool(_TrackedPoolMixin, urllib3.connectionpool.HTTPSConnectionPool):
+    pass
+
+
+class TrackedHTTPAdapter(requests.adapters.HTTPAdapter):
+    """HTTPAdapter whose connection pools report the opened and discarded connections and the peak usage."""
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': TrackedHTTPConnectionPool, 'https': TrackedHTTPSConnectionPool}
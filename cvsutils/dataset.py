@@ -1,18 +1,39 @@
-import io
+import collections
+import collections.abc
+import concurrent.futures
+import contextlib
+import functools
+import mmap
 import os
 import random
+import struct
+import sys
+import threading
 import zipfile
-import PIL.Image
+import numpy as np
+from .profiler import profiler
+
+NPZ_FORMAT_VERSION = 1
 
 
 class DatasetReader:
     @classmethod
-    def open(cls, filename):
+    @profiler.profile('DatasetReader.open')
+    def open(cls, filename, shard_index=0, num_shards=1, validate=True):
+        """Read a dataset. If num_shards > 1, only the lines i where i % num_shards == shard_index are read.
+
+        If there is no labels.txt, label names are generated from the labels in the shard. Provide labels.txt to get the same names for all shards.
+        If validate is False, Dataset.validate() is not called so that the caller can check all images and report every error.
+        """
+        assert 0 <= shard_index < num_shards
+        if str(filename).endswith('.npz'):
+            return cls.read_npz_dataset(filename, shard_index, num_shards, validate)
+
         dataset_type = cls.detect_type(filename)
         if dataset_type == 'object_detection':
-            return cls.read_object_detection_dataset(filename)
+            return cls.read_object_detection_dataset(filename, shard_index, num_shards, validate)
         elif dataset_type == 'image_classification':
-            return cls.read_image_classification_dataset(filename)
+            return cls.read_image_classification_dataset(filename, shard_index, num_shards, validate)
         else:
             raise RuntimeError
 
@@ -35,12 +56,14 @@ class DatasetReader:
             return [f'label_{i}' for i in range(num_labels)]
 
     @staticmethod
-    def read_object_detection_dataset(filename):
+    def read_object_detection_dataset(filename, shard_index=0, num_shards=1, validate=True):
         dataset = Dataset('object_detection', os.path.dirname(filename))
         reader = FileReader(os.path.dirname(filename))
         max_label = 0
         with open(filename) as f:
-            for line in f:
+            for i, line in enumerate(f):
+                if i % num_shards != shard_index:
+                    continue
                 image, labels = line.strip().split()
                 assert image and labels
                 labels_file = reader.read(labels)
@@ -52,147 +75,619 @@ class DatasetReader:
                 dataset.add_data(image, labels)
 
         dataset.labels = DatasetReader.read_labels(filename, max_label + 1)
-        dataset.validate()
+        if validate:
+            dataset.validate()
         return dataset
 
     @staticmethod
-    def read_image_classification_dataset(filename):
+    def read_image_classification_dataset(filename, shard_index=0, num_shards=1, validate=True):
         dataset = Dataset('image_classification', os.path.dirname(filename))
         max_label = 0
         with open(filename) as f:
-            for line in f:
+            for i, line in enumerate(f):
+                if i % num_shards != shard_index:
+                    continue
                 image, labels = line.strip().split()
                 labels = [int(l) for l in labels.strip().split(',')]
                 max_label = max(max_label, *labels)
                 dataset.add_data(image, labels)
 
         dataset.labels = DatasetReader.read_labels(filename, max_label + 1)
-        dataset.validate()
+        if validate:
+            dataset.validate()
         return dataset
 
+    @staticmethod
+    def read_npz_dataset(filename, shard_index=0, num_shards=1, validate=True):
+        """Read a dataset written by DatasetWriter.write_npz(). Only the label table is loaded. The images are read from the blob on demand."""
+        with np.load(filename, allow_pickle=False) as data:
+            if int(data['version']) != NPZ_FORMAT_VERSION:
+                raise RuntimeError(f"Unsupported dataset version: {int(data['version'])}")
+            dataset_type = str(data['dataset_type'])
+            label_store = LabelStore(dataset_type, data['label_values'], data['label_offsets'])
+            image_offsets = data['image_offsets']
+            image_blob = str(data['image_blob'])
+            labels = data['labels'].tolist()
+
+        if num_shards > 1:
+            indices = np.arange(shard_index, len(label_store), num_shards)
+            label_store = label_store.take(indices)
+            starts, ends = image_offsets[indices], image_offsets[indices + 1]
+        else:
+            starts, ends = image_offsets[:-1], image_offsets[1:]
+
+        dataset = Dataset(dataset_type, os.path.dirname(filename))
+        dataset.image_refs = PackedImages(os.path.join(os.path.dirname(filename), image_blob), starts, ends)
+        dataset.label_store = label_store
+        dataset.labels = labels
+        if validate:
+            dataset.validate()
+        return dataset
+
+
+class PackedImages:
+    """Read-only sequence of image binaries stored back to back in a blob file. The file is memory-mapped."""
+    def __init__(self, filepath, starts, ends):
+        self.filepath = filepath
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+        self._mmap = None
+
+    def _get_mmap(self):
+        if self._mmap is None:
+            with open(self.filepath, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def get_sizes(self):
+        return self.ends - self.starts
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        start, end = int(self.starts[index]), int(self.ends[index])
+        return self._get_mmap()[start:end] if end > start else b''
+
+    def get_view(self, index):
+        """Returns the image binary as a memoryview of the mapped file without copying it."""
+        start, end = int(self.starts[index]), int(self.ends[index])
+        return memoryview(self._get_mmap())[start:end] if end > start else b''
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __getstate__(self):
+        # mmap objects cannot be pickled. They are re-opened in the other process.
+        return {**self.__dict__, '_mmap': None}
+
 
 class FileReader:
+    ZIP_LOCAL_HEADER = struct.Struct('<4s22xHH')
+
     def __init__(self, base_dir):
         self.zip_objects = {}
+        self.zip_mmaps = {}
         self.base_dir = base_dir
+        self._lock = threading.Lock()  # DatasetWriter reads images on multiple threads.
 
     def read(self, filepath, mode='r'):
         assert mode in ('r', 'rb')
 
         if '@' in filepath:
             zip_filepath, entrypath = filepath.split('@')
-            if zip_filepath not in self.zip_objects:
-                self.zip_objects[zip_filepath] = zipfile.ZipFile(os.path.join(self.base_dir, zip_filepath))
-            with self.zip_objects[zip_filepath].open(entrypath) as f:
+            with self._get_zip(zip_filepath).open(entrypath) as f:
                 return [line for line in f.read().decode('utf-8').split('\n') if line] if mode == 'r' else f.read()
         else:
             with open(os.path.join(self.base_dir, filepath), mode) as f:
-                return f.read()
+                return [line for line in f.read().split('\n') if line] if mode == 'r' else f.read()
 
+    def read_view(self, filepath):
+        """Returns the binary of the file as a memoryview of the memory-mapped file without copying it.
 
-class Dataset:
+        Compressed or encrypted zip entries and empty files are read into bytes.
+        """
+        if '@' in filepath:
+            zip_filepath, entrypath = filepath.split('@')
+            info = self._get_zip(zip_filepath).getinfo(entrypath)
+            if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1 or not info.file_size:
+                return self.read(filepath, 'rb')
+
+            # The data follows the local file header. Its name and extra fields can differ from the central directory.
+            view = self._get_zip_mmap(zip_filepath)
+            signature, name_length, extra_length = self.ZIP_LOCAL_HEADER.unpack_from(view, info.header_offset)
+            if signature != b'PK\x03\x04':
+                return self.read(filepath, 'rb')
+            start = info.header_offset + self.ZIP_LOCAL_HEADER.size + name_length + extra_length
+            return view[start:start + info.file_size]
+        else:
+            with open(os.path.join(self.base_dir, filepath), 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return b''
+                return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def _get_zip(self, zip_filepath):
+        with self._lock:
+            if zip_filepath not in self.zip_objects:
+                self.zip_objects[zip_filepath] = zipfile.ZipFile(os.path.join(self.base_dir, zip_filepath))
+            return self.zip_objects[zip_filepath]
+
+    def _get_zip_mmap(self, zip_filepath):
+        with self._lock:
+            if zip_filepath not in self.zip_mmaps:
+                with open(os.path.join(self.base_dir, zip_filepath), 'rb') as f:
+                    self.zip_mmaps[zip_filepath] = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            return self.zip_mmaps[zip_filepath]
+
+
+class LabelStore:
+    """Stores labels of all images in a contiguous array.
+
+    For object_detection, values is an int32 array of shape (num_boxes, 5). Each row is [label_id, x, y, x2, y2].
+    For image_classification, values is an int32 array of label ids.
+    The labels of the i-th image are values[offsets[i]:offsets[i+1]].
+    """
+    def __init__(self, dataset_type, values=None, offsets=None):
+        assert dataset_type in ('image_classification', 'object_detection')
+        self.dataset_type = dataset_type
+        self._row_shape = (5,) if dataset_type == 'object_detection' else ()
+
+        if values is None:
+            values = np.empty((0,) + self._row_shape, dtype=np.int32)
+            offsets = np.zeros(1, dtype=np.int64)
+        self._values = np.asarray(values, dtype=np.int32)
+        self._offsets = np.asarray(offsets, dtype=np.int64)
+        self._num_values = int(self._offsets[-1])
+        self._num_images = len(self._offsets) - 1
+
+    @property
+    def values(self):
+        return self._values[:self._num_values]
+
+    @property
+    def offsets(self):
+        return self._offsets[:self._num_images + 1]
+
+    def __len__(self):
+        return self._num_images
+
+    def append(self, labels):
+        labels = np.asarray(labels, dtype=np.int32).reshape((-1,) + self._row_shape)
+        end = self._num_values + len(labels)
+        # Grow the buffers geometrically so that appending is amortized O(1).
+        if end > len(self._values):
+            self._values = self._resize(self._values, max(end, len(self._values) * 2, 16))
+        if self._num_images + 2 > len(self._offsets):
+            self._offsets = self._resize(self._offsets, max(len(self._offsets) * 2, 16))
+
+        self._values[self._num_values:end] = labels
+        self._num_values = end
+        self._num_images += 1
+        self._offsets[self._num_images] = end
+
+    def get(self, index):
+        """Returns the labels of the image as a list. [[label_id, x, y, x2, y2], ...] or [label_id, ...]"""
+        if index < 0:
+            index += self._num_images
+        if not 0 <= index < self._num_images:
+            raise IndexError(index)
+        return self._values[self._offsets[index]:self._offsets[index + 1]].tolist()
+
+    def get_counts(self):
+        """Returns the number of labels for each image."""
+        return np.diff(self.offsets)
+
+    def get_image_indices(self):
+        """Returns the image index of each label."""
+        return np.repeat(np.arange(self._num_images), self.get_counts())
+
+    def get_label_ids(self):
+        values = self.values
+        return values[:, 0] if self.dataset_type == 'object_detection' else values
+
+    def take(self, indices):
+        """Returns a new LabelStore with the labels of the given images."""
+        indices = np.asarray(indices, dtype=np.int64)
+        counts = self.get_counts()[indices]
+        new_offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(counts, out=new_offsets[1:])
+        # Index of each value in the source array.
+        source = np.repeat(self.offsets[indices] - new_offsets[:-1], counts) + np.arange(new_offsets[-1])
+        return LabelStore(self.dataset_type, self.values[source], new_offsets)
+
+    def get_image_mask(self, label_ids):
+        """Returns a boolean array that is True for images that have any of the label_ids."""
+        matched = np.isin(self.get_label_ids(), np.asarray(label_ids))
+        return np.bincount(self.get_image_indices()[matched], minlength=self._num_images) > 0
+
+    def get_class_histogram(self, num_classes=0):
+        return np.bincount(self.get_label_ids(), minlength=num_classes)
+
+    def scale_boxes(self, scale_x, scale_y):
+        """Scale the bounding boxes in-place. The scales can be a scalar or an array with a value for each image."""
+        assert self.dataset_type == 'object_detection'
+        counts = self.get_counts()
+        scale_x = np.repeat(scale_x, counts) if np.ndim(scale_x) else scale_x
+        scale_y = np.repeat(scale_y, counts) if np.ndim(scale_y) else scale_y
+        values = self.values
+        values[:, 1] = values[:, 1] * scale_x
+        values[:, 3] = values[:, 3] * scale_x
+        values[:, 2] = values[:, 2] * scale_y
+        values[:, 4] = values[:, 4] * scale_y
+
+    @staticmethod
+    def _resize(array, size):
+        new_array = np.empty((size,) + array.shape[1:], dtype=array.dtype)
+        new_array[:len(array)] = array
+        return new_array
+
+
+class DatasetSelectionMixin:
+    """Methods to select a subset of a dataset. The subclasses implement _select() and _get_image_mask()."""
+    def shard(self, shard_index, num_shards):
+        """Returns a view of the images i where i % num_shards == shard_index."""
+        assert 0 <= shard_index < num_shards
+        return self._select(np.arange(shard_index, len(self), num_shards))
+
+    def slice(self, start=None, stop=None, step=None):
+        return self._select(np.arange(len(self))[start:stop:step])
+
+    def filter(self, mask):
+        """Returns a view of the images where the boolean mask is True."""
+        assert len(mask) == len(self)
+        return self._select(np.flatnonzero(mask))
+
+    def filter_by_labels(self, label_ids):
+        """Returns a view of the images that have any of the label_ids."""
+        return self.filter(self._get_image_mask(label_ids))
+
+
+class Dataset(DatasetSelectionMixin):
     def __init__(self, dataset_type, base_dir='.'):
         assert dataset_type in ('image_classification', 'object_detection')
 
         self.base_dir = os.path.dirname(base_dir)
         self.dataset_type = dataset_type
         self.reader = FileReader(base_dir)
-        self.images = []
+        self.image_refs = []  # Image file paths or image binaries.
+        self.label_store = LabelStore(dataset_type)
         self.labels = []  # Optional label names.
 
+    @property
+    def images(self):
+        """Read-only sequence of (image, labels). The labels are converted to Python lists on access. Use add_data() to add images."""
+        return DatasetImages(self)
+
     def validate(self):
         """Verify that the dataset is in valid state"""
-        assert self.images
+        assert self.image_refs
         if self.dataset_type == 'image_classification':
             pass
         elif self.dataset_type == 'object_detection':
-            for i, (image, labels) in enumerate(self.images):
-                if not image:
-                    raise RuntimeError(f"{i}: missing an image.")
-                for label, x, y, x2, y2 in labels:
-                    if label < 0 or x <0 or y < 0 or x >= x2 or y >= y2:
-                        raise RuntimeError(f"{i}: Invalid bounding box: {label} {x} {y} {x2} {y2}")
+            if isinstance(self.image_refs, PackedImages):
+                missing = np.flatnonzero(self.image_refs.get_sizes() <= 0)
+            else:
+                missing = [i for i, image in enumerate(self.image_refs) if not image]
+            if len(missing):
+                raise RuntimeError(f"{missing[0]}: missing an image.")
+            values = self.label_store.values
+            invalid = (values[:, 0] < 0) | (values[:, 1] < 0) | (values[:, 2] < 0) | (values[:, 1] >= values[:, 3]) | (values[:, 2] >= values[:, 4])
+            if invalid.any():
+                index = int(np.argmax(invalid))
+                image_index = int(np.searchsorted(self.label_store.offsets, index, side='right')) - 1
+                label, x, y, x2, y2 = values[index].tolist()
+                raise RuntimeError(f"{image_index}: Invalid bounding box: {label} {x} {y} {x2} {y2}")
 
     def add_data(self, image, labels):
         assert image
-        assert isinstance(labels, list) or (isinstance(labels, str) and labels)
+        if not isinstance(labels, (list, np.ndarray)):
+            raise TypeError(f"labels must be a list of label ids or boxes, not {type(labels).__name__}. Read label files before adding them.")
 
-        self.images.append((image, labels))
+        self.image_refs.append(sys.intern(image) if isinstance(image, str) else image)
+        self.label_store.append(labels)
 
     def read_image(self, image_path):
         return self.reader.read(image_path, 'rb')
 
     def __len__(self):
-        return len(self.images)
+        return len(self.image_refs)
 
     def shuffle(self):
-        random.shuffle(self.images)
+        indices = list(range(len(self)))
+        random.shuffle(indices)
+        self.image_refs = [self.image_refs[i] for i in indices]
+        self.label_store = self.label_store.take(indices)
 
-    def get(self, index):
-        image, labels = self.images[index]
+    def get_class_histogram(self):
+        """Returns the number of labels for each label id."""
+        return self.label_store.get_class_histogram(len(self.labels))
+
+    def _select(self, indices):
+        return DatasetView(self, indices)
+
+    def _get_image_mask(self, label_ids):
+        return self.label_store.get_image_mask(label_ids)
+
+    @profiler.profile('Dataset.get')
+    def get(self, index, view=False):
+        """Returns (image, labels). If view is True, the image is a memoryview of the memory-mapped file when possible."""
+        if view and isinstance(self.image_refs, PackedImages):
+            return (self.image_refs.get_view(index), self.label_store.get(index))
+
+        image = self.image_refs[index]
+        labels = self.label_store.get(index)
 
         if isinstance(image, str):
-            image = self.read_image(image)
+            image = self.reader.read_view(image) if view else self.read_image(image)
 
         return (image, labels)
 
 
+class DatasetImages(collections.abc.Sequence):
+    """(image, labels) of a Dataset. Each item is created on access, so indexing is O(1)."""
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return (self.dataset.image_refs[index], self.dataset.label_store.get(index))
+
+
+class DatasetView(DatasetSelectionMixin):
+    """A subset of a Dataset. Images and labels are not copied.
+
+    The view refers to the images by their indices. Shuffling the underlying dataset invalidates the view.
+    """
+    def __init__(self, dataset, indices):
+        assert isinstance(dataset, Dataset)
+        self.dataset = dataset
+        self.indices = np.asarray(indices, dtype=np.int64)
+
+    @property
+    def dataset_type(self):
+        return self.dataset.dataset_type
+
+    @property
+    def labels(self):
+        return self.dataset.labels
+
+    def validate(self):
+        assert len(self.indices)
+        self.dataset.validate()
+
+    def __len__(self):
+        return len(self.indices)
+
+    def shuffle(self):
+        random.shuffle(self.indices)
+
+    def get_class_histogram(self):
+        return np.bincount(self.dataset.label_store.take(self.indices).get_label_ids(), minlength=len(self.labels))
+
+    def _select(self, indices):
+        return DatasetView(self.dataset, self.indices[indices])
+
+    def _get_image_mask(self, label_ids):
+        return self.dataset.label_store.get_image_mask(label_ids)[self.indices]
+
+    def get(self, index, view=False):
+        return self.dataset.get(int(self.indices[index]), view)
+
+
+class ConcatenatedDataset:
+    """Concatenation of datasets that have the same type and label names."""
+    def __init__(self, datasets):
+        assert datasets
+        assert all(d.dataset_type == datasets[0].dataset_type for d in datasets)
+        if any(list(d.labels) != list(datasets[0].labels) for d in datasets):
+            raise RuntimeError("Label names are different between the datasets.")
+
+        self.datasets = datasets
+        self._dataset_indices = np.repeat(np.arange(len(datasets)), [len(d) for d in datasets])
+        self._local_indices = np.concatenate([np.arange(len(d)) for d in datasets])
+
+    @property
+    def dataset_type(self):
+        return self.datasets[0].dataset_type
+
+    @property
+    def labels(self):
+        return self.datasets[0].labels
+
+    def validate(self):
+        for dataset in self.datasets:
+            dataset.validate()
+
+    def __len__(self):
+        return len(self._local_indices)
+
+    def shuffle(self):
+        indices = np.arange(len(self))
+        random.shuffle(indices)
+        self._dataset_indices = self._dataset_indices[indices]
+        self._local_indices = self._local_indices[indices]
+
+    def get(self, index, view=False):
+        return self.datasets[self._dataset_indices[index]].get(int(self._local_indices[index]), view)
+
+
 class DatasetWriter:
+    CHUNK_SIZE = 256
+    ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+    IMAGE_SIGNATURES = ((b'\xff\xd8\xff', 'jpg'), (b'\x89PNG\r\n\x1a\n', 'png'), (b'BM', 'bmp'))
+
+    @staticmethod
+    def write_shards(dataset, directory, num_shards):
+        """Write the dataset as num_shards datasets to {directory}/shard_{i}/images.txt. Returns the file paths."""
+        filenames = []
+        for i in range(num_shards):
+            filename = os.path.join(directory, f'shard_{i}', 'images.txt')
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            DatasetWriter.write(dataset.shard(i, num_shards), filename)
+            filenames.append(filename)
+        return filenames
+
     @staticmethod
-    def write(dataset, filename):
+    def concatenate(filenames, output_filename, shuffle=True):
+        """Concatenate datasets into a new dataset."""
+        datasets = [DatasetReader.open(filename) for filename in filenames]
+        DatasetWriter.write(ConcatenatedDataset(datasets), output_filename, shuffle)
+
+    @staticmethod
+    @profiler.profile('DatasetWriter.write')
+    def write(dataset, filename, shuffle=True, num_workers=None, seed=0):
+        """Write a dataset in the SIMPLE format.
+
+        Images are read, type-detected and their labels serialized on worker threads in chunks. The archives are written with fixed timestamps.
+        If shuffle is True, the images are written in a random order that is derived from the seed. Either way, the output is byte-identical
+        for the same input and seed. The dataset itself is not modified.
+
+        If the filename ends with .npz, the dataset is written by write_npz().
+        """
+        if str(filename).endswith('.npz'):
+            return DatasetWriter.write_npz(dataset, filename, shuffle, num_workers, seed)
+
         dataset.validate()
 
         base_dir = os.path.dirname(filename)
-        dataset.shuffle()
+        order = DatasetWriter._get_order(len(dataset), shuffle, seed)
+        chunks = [order[i:i + DatasetWriter.CHUNK_SIZE] for i in range(0, len(order), DatasetWriter.CHUNK_SIZE)]
+        serialize = functools.partial(DatasetWriter._serialize_chunk, dataset)
+        max_workers = num_workers or min(32, (os.cpu_count() or 1) + 4)
 
         images_zip_filename = 'images.zip'
-        images_zip = zipfile.ZipFile(os.path.join(base_dir, images_zip_filename),
-                                     mode='w', compression=zipfile.ZIP_STORED)
-        if dataset.dataset_type == 'object_detection':
-            labels_zip_filename = 'labels.zip'
-            labels_zip = zipfile.ZipFile(os.path.join(base_dir, labels_zip_filename),
-                                         mode='w', compression=zipfile.ZIP_STORED)
-
-        with open(filename, 'w') as f:
-            for i in range(len(dataset)):
-                image, labels = dataset.get(i)
-                ext = DatasetWriter.detect_imagetype(image)
-                image_filepath = f'{i}.{ext}'
-                images_zip.writestr(image_filepath, data=image)
-                image_filepath = f'{images_zip_filename}@{image_filepath}'
-
-                if dataset.dataset_type == 'object_detection':
-                    labels_filepath = f'{i}.txt'
-                    with labels_zip.open(labels_filepath, 'w') as lf:
-                        for l in labels:
-                            lf.write((' '.join([str(ls) for ls in l]) + '\n').encode('utf-8'))
-                    labels = f'{labels_zip_filename}@{labels_filepath}'
-                elif dataset.dataset_type == 'image_classification':
-                    assert isinstance(labels, list)
-                    assert len(labels) > 0 or isinstance(labels[0], int)
-                    labels = ','.join([str(l) for l in labels])
-                else:
-                    raise NotImplementedError
-
-                f.write(f'{image_filepath} {labels}\n')
-
-        images_zip.close()
-        if dataset.dataset_type == 'object_detection':
-            labels_zip.close()
-
-        if dataset.labels:
+        labels_zip_filename = 'labels.zip'
+        with contextlib.ExitStack() as stack:
+            executor = stack.enter_context(concurrent.futures.ThreadPoolExecutor(max_workers=max_workers))
+            images_zip = stack.enter_context(zipfile.ZipFile(os.path.join(base_dir, images_zip_filename), mode='w', compression=zipfile.ZIP_STORED))
+            if dataset.dataset_type == 'object_detection':
+                labels_zip = stack.enter_context(zipfile.ZipFile(os.path.join(base_dir, labels_zip_filename), mode='w', compression=zipfile.ZIP_STORED))
+            f = stack.enter_context(open(filename, 'w'))
+
+            i = 0
+            for entries in DatasetWriter._map_ordered(executor, serialize, chunks, max_in_flight=max_workers * 2):
+                lines = []
+                for image, ext, labels in entries:
+                    image_filepath = f'{i}.{ext}'
+                    DatasetWriter._write_zip_entry(images_zip, image_filepath, image)
+                    image_filepath = f'{images_zip_filename}@{image_filepath}'
+
+                    if dataset.dataset_type == 'object_detection':
+                        labels_filepath = f'{i}.txt'
+                        DatasetWriter._write_zip_entry(labels_zip, labels_filepath, labels)
+                        labels = f'{labels_zip_filename}@{labels_filepath}'
+
+                    lines.append(f'{image_filepath} {labels}\n')
+                    i += 1
+                f.write(''.join(lines))
+
+        if len(dataset.labels):
             with open(os.path.join(base_dir, 'labels.txt'), 'w') as f:
                 for label_name in dataset.labels:
                     f.write(label_name + '\n')
 
-    def detect_imagetype(image_binary):
-        with PIL.Image.open(io.BytesIO(image_binary)) as img:
-            image_format = img.format
-        if image_format == 'JPEG':
-            return 'jpg'
-        elif image_format == 'BMP':
-            return 'bmp'
-        elif image_format == 'PNG':
-            return 'png'
+    @staticmethod
+    @profiler.profile('DatasetWriter.write_npz')
+    def write_npz(dataset, filename, shuffle=True, num_workers=None, seed=0):
+        """Write a dataset as a label table in a .npz file and a blob file {name}.bin that has all images back to back.
+
+        The images are shuffled in the same way as write().
+
+        The .npz file has the following arrays:
+            version, dataset_type, labels: Format version, the dataset type and the label names.
+            label_values, label_offsets: The labels of the i-th image are label_values[label_offsets[i]:label_offsets[i+1]].
+                For object_detection, each row is [label_id, x, y, x2, y2].
+            image_blob, image_offsets: The blob filename relative to the .npz file. The i-th image is blob[image_offsets[i]:image_offsets[i+1]].
+        """
+        dataset.validate()
+
+        order = DatasetWriter._get_order(len(dataset), shuffle, seed)
+
+        image_blob = os.path.splitext(os.path.basename(filename))[0] + '.bin'
+        image_offsets = np.zeros(len(order) + 1, dtype=np.int64)
+        if isinstance(dataset, Dataset):
+            label_store = dataset.label_store.take(order)
+            read_chunk = functools.partial(DatasetWriter._read_image_chunk, dataset)
         else:
-            raise NotImplementedError
+            label_store = LabelStore(dataset.dataset_type)
+            read_chunk = functools.partial(DatasetWriter._read_chunk, dataset)
+
+        chunks = [order[i:i + DatasetWriter.CHUNK_SIZE] for i in range(0, len(order), DatasetWriter.CHUNK_SIZE)]
+        max_workers = num_workers or min(32, (os.cpu_count() or 1) + 4)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor, open(os.path.join(os.path.dirname(filename), image_blob), 'wb') as f:
+            i = 0
+            for entries in DatasetWriter._map_ordered(executor, read_chunk, chunks, max_in_flight=max_workers * 2):
+                for image, labels in entries:
+                    f.write(image)
+                    image_offsets[i + 1] = image_offsets[i] + len(image)
+                    if labels is not None:
+                        label_store.append(labels)
+                    i += 1
+
+        np.savez(filename, version=np.array(NPZ_FORMAT_VERSION), dataset_type=np.array(dataset.dataset_type), labels=np.array(list(dataset.labels), dtype=str),
+                 label_values=label_store.values, label_offsets=label_store.offsets, image_blob=np.array(image_blob), image_offsets=image_offsets)
+
+    @staticmethod
+    def _get_order(num_images, shuffle, seed):
+        """Returns the indices of the images in the order to write. A seeded generator makes the shuffled order reproducible."""
+        return np.random.default_rng(seed).permutation(num_images) if shuffle else np.arange(num_images)
+
+    @staticmethod
+    def _read_chunk(dataset, indices):
+        return [dataset.get(int(index)) for index in indices]
+
+    @staticmethod
+    def _read_image_chunk(dataset, indices):
+        """Read only the images. The labels are copied from the LabelStore at once."""
+        entries = []
+        for index in indices:
+            image = dataset.image_refs[index]
+            entries.append((dataset.read_image(image) if isinstance(image, str) else image, None))
+        return entries
+
+    @staticmethod
+    def _serialize_chunk(dataset, indices):
+        """Returns a list of (image_binary, extension, labels) for the images. This runs on a worker thread."""
+        entries = []
+        for index in indices:
+            image, labels = dataset.get(int(index))
+            ext = DatasetWriter.detect_imagetype(image)
+            if dataset.dataset_type == 'object_detection':
+                labels = ''.join(f'{label} {x} {y} {x2} {y2}\n' for label, x, y, x2, y2 in labels).encode('utf-8')
+            elif dataset.dataset_type == 'image_classification':
+                assert isinstance(labels, list)
+                labels = ','.join([str(label) for label in labels])
+            else:
+                raise NotImplementedError
+            entries.append((image, ext, labels))
+        return entries
+
+    @staticmethod
+    def _map_ordered(executor, func, items, max_in_flight):
+        """Like executor.map(), but keeps at most max_in_flight tasks so that the results don't pile up in memory."""
+        futures = collections.deque()
+        for item in items:
+            if len(futures) >= max_in_flight:
+                yield futures.popleft().result()
+            futures.append(executor.submit(func, item))
+        while futures:
+            yield futures.popleft().result()
+
+    @staticmethod
+    def _write_zip_entry(zip_file, name, data):
+        # Use a fixed timestamp so that the archive doesn't depend on the current time.
+        zip_info = zipfile.ZipInfo(name, date_time=DatasetWriter.ZIP_DATE_TIME)
+        zip_info.compress_type = zipfile.ZIP_STORED
+        zip_info.external_attr = 0o644 << 16
+        zip_file.writestr(zip_info, data)
+
+    @staticmethod
+    def detect_imagetype(image_binary):
+        for signature, ext in DatasetWriter.IMAGE_SIGNATURES:
+            if image_binary[:len(signature)] == signature:
+                return ext
+        raise NotImplementedError(f"Unknown image type: {bytes(image_binary[:8])}")
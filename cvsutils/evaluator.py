@@ -3,8 +3,6 @@ import collections
 import statistics
 
 import numpy as np
-import sklearn.metrics
-import torch
 
 
 class Evaluator(ABC):
@@ -25,79 +23,341 @@ class Evaluator(ABC):
     def reset(self):
         pass
 
+    def get_analysis(self, num_classes=None):
+        """Returns per-class metrics as a dict of numpy arrays. See write_analysis().
+
+        num_classes is inferred from the predictions if not given.
+        """
+        raise NotImplementedError
+
+
+PR_CURVE_THRESHOLDS = np.linspace(0, 1, 101)  # The probability thresholds where the precision-recall curves are sampled.
+
+
+class HardestExamples:
+    """Keeps the num_examples examples with the highest (or the lowest) scores. Examples are (image index, label index, score)."""
+    def __init__(self, num_examples, largest=True):
+        self.num_examples = num_examples
+        self.largest = largest
+        self.image_indices = np.empty(0, dtype=np.int64)
+        self.labels = np.empty(0, dtype=np.int64)
+        self.scores = np.empty(0, dtype=np.float64)
+
+    def add(self, image_indices, labels, scores):
+        self.image_indices = np.concatenate([self.image_indices, image_indices])
+        self.labels = np.concatenate([self.labels, labels])
+        self.scores = np.concatenate([self.scores, scores])
+        if len(self.scores) > self.num_examples:
+            keep = np.argpartition(self._keys(), self.num_examples - 1)[:self.num_examples]
+            self.image_indices, self.labels, self.scores = self.image_indices[keep], self.labels[keep], self.scores[keep]
+
+    def get_analysis(self, prefix):
+        order = np.argsort(self._keys(), kind='stable')
+        return {f'{prefix}_images': self.image_indices[order], f'{prefix}_labels': self.labels[order], f'{prefix}_scores': self.scores[order]}
+
+    def _keys(self):
+        return -self.scores if self.largest else self.scores
+
+
+def write_analysis(analysis, filepath, label_names=None):
+    """Write the result of Evaluator.get_analysis() to a .npz file or a JSON file.
+
+    NPZ is more compact for large class counts. In JSON, NaN is written as null.
+    """
+    import json
+    import pathlib
+    filepath = pathlib.Path(filepath)
+    if label_names is not None:
+        analysis = {'label_names': np.array(label_names), **analysis}
+    if filepath.suffix == '.npz':
+        np.savez_compressed(filepath, **analysis)
+    else:
+        data = {key: np.where(np.isnan(value), None, value).tolist() if value.dtype.kind == 'f' else value.tolist() for key, value in analysis.items()}
+        filepath.write_text(json.dumps(data, separators=(',', ':')))
+
+
+class AveragePrecisionAccumulator:
+    """Accumulates classification scores in chunks and computes the average precision of each class.
+
+    If num_bins is None, the scores are kept and the result is the same as sklearn.metrics.average_precision_score for each class.
+    Otherwise only the histograms of the scores are kept. The scores must be in [0, 1] and are quantized to 1 / num_bins,
+    so the memory doesn't grow with the number of samples.
+    """
+    COLUMN_BLOCK_SIZE = 64  # The number of classes sorted at once.
+
+    def __init__(self, num_classes, num_bins=None):
+        self.num_classes = num_classes
+        self.num_bins = num_bins
+        self.num_samples = 0
+        if num_bins:
+            self._histogram = np.zeros((num_classes, num_bins), dtype=np.int64)
+            self._positive_histogram = np.zeros((num_classes, num_bins), dtype=np.int64)
+        else:
+            self._scores = []
+            self._positive_classes = []
+            self._positive_scores = []
+        self._statistics = None
+
+    def add(self, scores, positive_classes, positive_scores):
+        """Add a chunk of scores.
+        Args:
+            scores: Shape (N, num_classes)
+            positive_classes: The class indices of the positive samples. Shape (M,)
+            positive_scores: The scores of the positive samples. Shape (M,)
+        """
+        self.num_samples += len(scores)
+        self._statistics = None
+        if self.num_bins:
+            bins = self._to_bins(scores) + np.arange(self.num_classes) * self.num_bins
+            self._histogram += np.bincount(bins.ravel(), minlength=self.num_classes * self.num_bins).reshape(self.num_classes, self.num_bins)
+            positive_bins = self._to_bins(positive_scores) + positive_classes * self.num_bins
+            self._positive_histogram += np.bincount(positive_bins, minlength=self.num_classes * self.num_bins).reshape(self.num_classes, self.num_bins)
+        else:
+            self._scores.append(np.asarray(scores, dtype=np.float32))
+            self._positive_classes.append(positive_classes)
+            self._positive_scores.append(np.asarray(positive_scores, dtype=np.float32))
+
+    def get_average_precisions(self):
+        """Returns the average precision of each class. NaN for the classes without positive samples."""
+        if self.num_bins:
+            # Each bin is a threshold. Precision at a threshold = positives above it / samples above it.
+            num_above, num_positives_above = self._get_cumulative_histograms()
+            precisions = num_positives_above / np.maximum(num_above, 1)
+            num_positives = self._positive_histogram.sum(axis=1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return (self._positive_histogram * precisions[:, :-1]).sum(axis=1) / np.where(num_positives > 0, num_positives, np.nan)
+
+        return self._get_statistics()[0]
+
+    def get_precision_recall_curves(self):
+        """Returns the precisions and the recalls of the predictions with scores >= each of PR_CURVE_THRESHOLDS. Shape (num_classes, len(PR_CURVE_THRESHOLDS)).
+
+        The precision is 1 if there is no prediction above the threshold. The recall is NaN for the classes without positive samples.
+        """
+        if self.num_bins:
+            num_above, num_positives_above = self._get_cumulative_histograms()
+            bins = np.clip(np.ceil(PR_CURVE_THRESHOLDS * self.num_bins).astype(np.int64), 0, self.num_bins)
+            num_above, num_positives_above = num_above[:, bins], num_positives_above[:, bins]
+            num_positives = self._positive_histogram.sum(axis=1)
+        else:
+            _, num_above, num_positives_above, num_positives = self._get_statistics()
+
+        precisions = np.where(num_above > 0, num_positives_above / np.maximum(num_above, 1), 1.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            recalls = num_positives_above / np.where(num_positives > 0, num_positives, np.nan)[:, np.newaxis]
+        return precisions, recalls
+
+    def _get_statistics(self):
+        """Sorts the kept scores once and returns (average precisions, samples above each PR curve threshold, positives above each threshold, positives)."""
+        if self._statistics is not None:
+            return self._statistics
+
+        average_precisions = np.full(self.num_classes, np.nan)
+        thresholds = PR_CURVE_THRESHOLDS.astype(np.float32)
+        num_above = np.zeros((self.num_classes, len(thresholds)), dtype=np.int64)
+        num_positives_above = np.zeros((self.num_classes, len(thresholds)), dtype=np.int64)
+        num_positives = np.zeros(self.num_classes, dtype=np.int64)
+        for c, sorted_scores, positives in self._iterate_classes():
+            num_above[c] = self.num_samples - np.searchsorted(sorted_scores, thresholds, 'left')
+            num_positives_above[c] = len(positives) - np.searchsorted(positives, thresholds, 'left')
+            num_positives[c] = len(positives)
+            if len(positives):
+                # The precision at the score of each positive sample. Samples with the same score share a threshold.
+                positive_num_above = self.num_samples - np.searchsorted(sorted_scores, positives, 'left')
+                positive_num_positives_above = len(positives) - np.searchsorted(positives, positives, 'left')
+                average_precisions[c] = np.mean(positive_num_positives_above / positive_num_above)
+
+        self._statistics = (average_precisions, num_above, num_positives_above, num_positives)
+        return self._statistics
+
+    def _get_cumulative_histograms(self):
+        """Returns the number of samples and positive samples in each bin or above. Shape (num_classes, num_bins + 1)."""
+        def cumulate(histogram):
+            return np.pad(np.cumsum(histogram[:, ::-1], axis=1)[:, ::-1], ((0, 0), (0, 1)))
+        return cumulate(self._histogram), cumulate(self._positive_histogram)
+
+    def _iterate_classes(self):
+        """Yields (class index, sorted scores of all samples, sorted scores of the positive samples)."""
+        if not self._scores:
+            return
+
+        positive_classes = np.concatenate(self._positive_classes)
+        positive_scores = np.concatenate(self._positive_scores)
+        order = np.lexsort((positive_scores, positive_classes))
+        positive_classes, positive_scores = positive_classes[order], positive_scores[order]
+        boundaries = np.searchsorted(positive_classes, np.arange(self.num_classes + 1))
+
+        for block_start in range(0, self.num_classes, self.COLUMN_BLOCK_SIZE):
+            block_end = min(block_start + self.COLUMN_BLOCK_SIZE, self.num_classes)
+            # Sorting the rows of the transposed block is faster than sorting the columns.
+            sorted_scores = np.concatenate([s[:, block_start:block_end] for s in self._scores]).T.copy()
+            sorted_scores.sort(axis=1)
+            for c in range(block_start, block_end):
+                yield c, sorted_scores[c - block_start], positive_scores[boundaries[c]:boundaries[c + 1]]
+
+    def _to_bins(self, scores):
+        return np.clip((np.asarray(scores) * self.num_bins).astype(np.int64), 0, self.num_bins - 1)
+
+
+def _mean_average_precision(average_precisions):
+    average_precisions = average_precisions[~np.isnan(average_precisions)]
+    return float(average_precisions.mean()) if len(average_precisions) else 0.0
+
 
 class MulticlassClassificationEvaluator(Evaluator):
+    CHUNK_SIZE = 4096  # The number of rows processed at once to bound the temporary memory.
+
+    def __init__(self, num_bins=None, num_hardest=100):
+        """If num_bins is given, the average precision is computed from histograms of the scores instead of keeping all scores.
+
+        num_hardest is the number of the most confident mistakes and the least confident ground truths kept for get_analysis().
+        """
+        self.num_bins = num_bins
+        self.num_hardest = num_hardest
+        super().__init__()
+
     def add_predictions(self, predictions, targets):
         """ Evaluate a batch of predictions.
         Args:
-            predictions: the model output tensor. Shape (N, num_class)
-            targets: the golden truths. Shape (N,)
+            predictions: the model output array. Shape (N, num_class)
+            targets: the golden truths. Shape (N,). Negative values mean that the image has no label.
         """
+        predictions = np.asarray(predictions)
+        targets = np.asarray(targets, dtype=np.int64)
         assert len(predictions) == len(targets)
         assert len(targets.shape) == 1
-
-        # top-1 accuracy
-        _, indices = torch.topk(predictions, 1)
-        correct = indices.view(-1).eq(targets)
-        correct_num = int(correct.long().sum(0))
-        self.top1_correct_num += correct_num
-
-        # top-5 accuracy
-        k = min(5, predictions.shape[1])
-        _, indices = torch.topk(predictions, k)
-        correct = indices == targets.view(-1, 1).long().expand(-1, k)
-        self.top5_correct_num += int(correct.long().sum())
-
-        # Average precision
-        target_vec = torch.zeros_like(predictions, dtype=torch.uint8)
-        for i, t in enumerate(targets):
-            target_vec[i, t] = 1
-        ap = sklearn.metrics.average_precision_score(target_vec.view(-1).cpu().numpy(), predictions.view(-1).cpu().numpy(), average='macro')
-        self.ap += ap * len(predictions)
+        for start in range(0, len(predictions), self.CHUNK_SIZE):
+            self._add_chunk(predictions[start:start + self.CHUNK_SIZE], targets[start:start + self.CHUNK_SIZE])
+
+    def _add_chunk(self, predictions, targets):
+        num_classes = predictions.shape[1]
+        if self._average_precision is None:
+            self._average_precision = AveragePrecisionAccumulator(num_classes, self.num_bins)
+            self.confusion_matrix = np.zeros((num_classes, num_classes), dtype=np.int64)
+        rows = np.arange(len(predictions))
+        image_indices = rows + self.total_num
+
+        # Top-5 with a single partial sort. Top-1 is the best of the top-5. Ties go to the smallest class index as in np.argmax.
+        k = min(5, num_classes)
+        top_k = np.argpartition(predictions, num_classes - k, axis=1)[:, num_classes - k:]
+        top_k_scores = predictions[rows[:, np.newaxis], top_k]
+        top_1 = np.where(top_k_scores == top_k_scores.max(axis=1, keepdims=True), top_k, num_classes).min(axis=1)
+        self.top1_correct_num += int(np.count_nonzero(top_1 == targets))
+        self.top5_correct_num += int(np.count_nonzero((top_k == targets[:, np.newaxis]).any(axis=1)))
+
+        has_target = targets >= 0
+        target_scores = predictions[rows[has_target], targets[has_target]]
+        self._average_precision.add(predictions, targets[has_target], target_scores)
+
+        # Rows are the targets, columns are the top-1 predictions.
+        self.confusion_matrix += np.bincount(targets[has_target] * num_classes + top_1[has_target], minlength=num_classes * num_classes).reshape(num_classes, num_classes)
+        is_wrong = top_1 != targets
+        self.hardest_false_positives.add(image_indices[is_wrong], top_1[is_wrong], predictions[rows[is_wrong], top_1[is_wrong]])
+        self.hardest_false_negatives.add(image_indices[has_target], targets[has_target], target_scores)
         self.total_num += len(predictions)
 
     def get_report(self):
+        average_precision = _mean_average_precision(self._average_precision.get_average_precisions()) if self._average_precision else 0.0
         return {'top1_accuracy': float(self.top1_correct_num) / self.total_num if self.total_num else 0.0,
                 'top5_accuracy': float(self.top5_correct_num) / self.total_num if self.total_num else 0.0,
-                'average_precision': self.ap / self.total_num if self.total_num else 0.0}
+                'average_precision': average_precision}
+
+    def get_analysis(self, num_classes=None):
+        """Per-class top-1 precision and recall, AP, precision-recall curves, the confusion matrix and the hardest examples.
+
+        The hardest false positives are the most confident wrong top-1 predictions. The hardest false negatives are the ground truths with the lowest scores.
+        """
+        if self._average_precision is None:
+            raise RuntimeError("No predictions were added.")
+        true_positives = np.diag(self.confusion_matrix)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            precisions = true_positives / self.confusion_matrix.sum(axis=0)
+            recalls = true_positives / self.confusion_matrix.sum(axis=1)
+        pr_precisions, pr_recalls = self._average_precision.get_precision_recall_curves()
+        return {'num_samples': self.confusion_matrix.sum(axis=1), 'precision': precisions, 'recall': recalls,
+                'average_precision': self._average_precision.get_average_precisions(), 'confusion_matrix': self.confusion_matrix,
+                'pr_thresholds': PR_CURVE_THRESHOLDS, 'pr_precision': pr_precisions, 'pr_recall': pr_recalls,
+                **self.hardest_false_positives.get_analysis('hardest_false_positive'), **self.hardest_false_negatives.get_analysis('hardest_false_negative')}
 
     def reset(self):
         self.top1_correct_num = 0
         self.top5_correct_num = 0
-        self.ap = 0
+        self._average_precision = None
+        self.confusion_matrix = None
+        self.hardest_false_positives = HardestExamples(self.num_hardest)
+        self.hardest_false_negatives = HardestExamples(self.num_hardest, largest=False)
         self.total_num = 0
 
 
 class MultilabelClassificationEvaluator(Evaluator):
+    def __init__(self, num_bins=None, num_hardest=100):
+        self.num_bins = num_bins
+        self.num_hardest = num_hardest
+        super().__init__()
+
     def add_predictions(self, predictions, targets):
         """ Evaluate a batch of predictions.
         Args:
-            predictions: the model output tensor. Shape (N, num_class)
+            predictions: the model output array. Shape (N, num_class)
             targets: the golden truths. Shape (N, num_class)
         """
-        assert len(predictions) == len(targets)
-        targets = targets.to(torch.uint8)
-        num = torch.mul(predictions > 0.5, targets).long().sum(1)  # shape (N,)
-        den = torch.add(predictions > 0.5, targets).ge(1).long().sum(1)  # shape (N,)
+        predictions = np.asarray(predictions)
+        targets = np.asarray(targets).astype(bool)
+        assert predictions.shape == targets.shape
+        if self._average_precision is None:
+            self._average_precision = AveragePrecisionAccumulator(predictions.shape[1], self.num_bins)
+            self.true_positives, self.false_positives, self.false_negatives = (np.zeros(predictions.shape[1], dtype=np.int64) for _ in range(3))
+
+        predicted = predictions > 0.5
+        num = np.count_nonzero(predicted & targets, axis=1)
+        den = np.count_nonzero(predicted | targets, axis=1)
         den[den == 0] = 1  # To avoid zero-division. If den==0, num should be zero as well.
-        self.correct_num += torch.sum(num.to(torch.float32) / den.to(torch.float32))
+        self.correct_num += float(np.sum(num / den))
+
+        self.true_positives += np.count_nonzero(predicted & targets, axis=0)
+        self.false_positives += np.count_nonzero(predicted & ~targets, axis=0)
+        self.false_negatives += np.count_nonzero(~predicted & targets, axis=0)
 
-        ap = sklearn.metrics.average_precision_score(targets.view(-1).cpu().numpy(), predictions.view(-1).cpu().numpy(), average='macro')
-        self.ap += ap * len(predictions)
+        rows, classes = np.nonzero(targets)
+        self._average_precision.add(predictions, classes, predictions[rows, classes])
+        self.hardest_false_negatives.add(rows + self.total_num, classes, predictions[rows, classes])
+        rows, classes = np.nonzero(predicted & ~targets)
+        self.hardest_false_positives.add(rows + self.total_num, classes, predictions[rows, classes])
         self.total_num += len(predictions)
 
     def get_report(self):
+        average_precision = _mean_average_precision(self._average_precision.get_average_precisions()) if self._average_precision else 0.0
         return {'accuracy_50': float(self.correct_num) / self.total_num if self.total_num else 0.0,
-                'average_precision': self.ap / self.total_num if self.total_num else 0.0}
+                'average_precision': average_precision}
+
+    def get_analysis(self, num_classes=None):
+        """Per-class precision and recall at 0.5, AP, precision-recall curves and the hardest examples.
+
+        The hardest false positives are the most confident predictions above 0.5 for absent labels. The hardest false negatives are the ground truths with the lowest scores.
+        """
+        if self._average_precision is None:
+            raise RuntimeError("No predictions were added.")
+        with np.errstate(invalid='ignore', divide='ignore'):
+            precisions = self.true_positives / (self.true_positives + self.false_positives)
+            recalls = self.true_positives / (self.true_positives + self.false_negatives)
+        pr_precisions, pr_recalls = self._average_precision.get_precision_recall_curves()
+        return {'num_samples': self.true_positives + self.false_negatives, 'precision': precisions, 'recall': recalls,
+                'average_precision': self._average_precision.get_average_precisions(),
+                'true_positives': self.true_positives, 'false_positives': self.false_positives, 'false_negatives': self.false_negatives,
+                'pr_thresholds': PR_CURVE_THRESHOLDS, 'pr_precision': pr_precisions, 'pr_recall': pr_recalls,
+                **self.hardest_false_positives.get_analysis('hardest_false_positive'), **self.hardest_false_negatives.get_analysis('hardest_false_negative')}
 
     def reset(self):
         self.correct_num = 0
-        self.ap = 0
+        self._average_precision = None
+        self.hardest_false_positives = HardestExamples(self.num_hardest)
+        self.hardest_false_negatives = HardestExamples(self.num_hardest, largest=False)
         self.total_num = 0
 
 
 class ObjectDetectionSingleIOUEvaluator(Evaluator):
-    def __init__(self, iou):
+    def __init__(self, iou, num_hardest=100):
+        self.num_hardest = num_hardest
         super(ObjectDetectionSingleIOUEvaluator, self).__init__()
         self.iou = iou
 
@@ -112,12 +372,13 @@ class ObjectDetectionSingleIOUEvaluator(Evaluator):
 
         eval_predictions = collections.defaultdict(list)
         eval_ground_truths = collections.defaultdict(dict)
-        for img_idx, prediction in enumerate(predictions):
+        # Image indices are counted from the first image of the first batch.
+        for img_idx, prediction in enumerate(predictions, self.num_images):
             for bbox in prediction:
                 label = int(bbox[0])
                 eval_predictions[label].append([img_idx, float(bbox[1]), float(bbox[2]), float(bbox[3]), float(bbox[4]), float(bbox[5])])
 
-        for img_idx, target in enumerate(targets):
+        for img_idx, target in enumerate(targets, self.num_images):
             for bbox in target:
                 label = int(bbox[0])
                 if img_idx not in eval_ground_truths[label]:
@@ -126,12 +387,15 @@ class ObjectDetectionSingleIOUEvaluator(Evaluator):
 
         class_indices = set(list(eval_predictions.keys()) + list(eval_ground_truths.keys()))
         for class_index in class_indices:
-            is_correct, probabilities = self._evaluate_predictions(eval_ground_truths[class_index], eval_predictions[class_index], self.iou)
+            is_correct, probabilities, image_indices = self._evaluate_predictions(eval_ground_truths[class_index], eval_predictions[class_index], self.iou)
             true_num = sum([len(l) for l in eval_ground_truths[class_index].values()])
 
             self.is_correct[class_index].extend(is_correct)
             self.probabilities[class_index].extend(probabilities)
             self.true_num[class_index] += true_num
+            if len(is_correct):
+                self.hardest_false_positives.add(image_indices[~is_correct], np.full(np.count_nonzero(~is_correct), class_index), probabilities[~is_correct])
+        self.num_images += len(predictions)
 
     def _calculate_area(self, rect):
         w = rect[2] - rect[0]+1e-5
@@ -179,16 +443,18 @@ class ObjectDetectionSingleIOUEvaluator(Evaluator):
                                                                iou_threshold)
             is_correct.append(correct)
 
-        is_correct = np.array(is_correct)
+        is_correct = np.array(is_correct, dtype=bool)
         probabilities = np.array([p[1] for p in sorted_predictions])
+        image_indices = np.array([p[0] for p in sorted_predictions], dtype=np.int64)
 
-        return is_correct, probabilities
+        return is_correct, probabilities, image_indices
 
     def _calculate_average_precision(self, is_correct, probabilities, true_num):
         if true_num == 0:
             return 0
         if not is_correct or not any(is_correct):
             return 0
+        import sklearn.metrics
         recall = float(np.sum(is_correct)) / true_num
         return sklearn.metrics.average_precision_score(is_correct, probabilities) * recall
 
@@ -203,10 +469,41 @@ class ObjectDetectionSingleIOUEvaluator(Evaluator):
         mean_ap = statistics.mean(all_aps) if all_aps else 0
         return {'mAP_{}'.format(int(self.iou*100)): mean_ap}
 
+    def get_analysis(self, num_classes=None):
+        """Per-class precision and recall of all predictions, AP, precision-recall curves and the most confident false positives."""
+        class_indices = set(self.true_num) | set(self.is_correct)
+        if num_classes is None:
+            num_classes = max(class_indices) + 1 if class_indices else 0
+
+        num_samples = np.zeros(num_classes, dtype=np.int64)
+        average_precisions = np.full(num_classes, np.nan)
+        num_above = np.zeros((num_classes, len(PR_CURVE_THRESHOLDS)), dtype=np.int64)
+        num_correct_above = np.zeros((num_classes, len(PR_CURVE_THRESHOLDS)), dtype=np.int64)
+        for class_index in class_indices:
+            is_correct = np.array(self.is_correct[class_index], dtype=bool)
+            probabilities = np.array(self.probabilities[class_index], dtype=np.float64)
+            num_samples[class_index] = self.true_num[class_index]
+            if self.true_num[class_index]:
+                average_precisions[class_index] = self._calculate_average_precision(list(is_correct), probabilities, self.true_num[class_index])
+
+            order = np.argsort(probabilities, kind='stable')
+            cumulative_correct = np.concatenate([[0], np.cumsum(is_correct[order][::-1])])  # The number of correct predictions in the top-k.
+            num_above[class_index] = len(probabilities) - np.searchsorted(probabilities[order], PR_CURVE_THRESHOLDS, 'left')
+            num_correct_above[class_index] = cumulative_correct[num_above[class_index]]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            recalls = num_correct_above / num_samples[:, np.newaxis]
+        precisions = np.where(num_above > 0, num_correct_above / np.maximum(num_above, 1), 1.0)
+        return {'num_samples': num_samples, 'precision': np.where(num_above[:, 0] > 0, precisions[:, 0], np.nan), 'recall': recalls[:, 0],
+                'average_precision': average_precisions, 'pr_thresholds': PR_CURVE_THRESHOLDS, 'pr_precision': precisions, 'pr_recall': recalls,
+                **self.hardest_false_positives.get_analysis('hardest_false_positive')}
+
     def reset(self):
         self.is_correct = collections.defaultdict(list)
         self.probabilities = collections.defaultdict(list)
         self.true_num = collections.defaultdict(int)
+        self.num_images = 0
+        self.hardest_false_positives = HardestExamples(self.num_hardest)
 
 
 class ObjectDetectionEvaluator(Evaluator):
@@ -224,6 +521,11 @@ class ObjectDetectionEvaluator(Evaluator):
             report.update(evaluator.get_report())
         return report
 
+    def get_analysis(self, num_classes=None):
+        """The analysis at IoU 0.5, or at the first IoU value if 0.5 is not evaluated."""
+        evaluator = next((e for e in self.evaluators if e.iou == 0.5), self.evaluators[0])
+        return evaluator.get_analysis(num_classes)
+
     def reset(self):
         for evaluator in self.evaluators:
             evaluator.reset()
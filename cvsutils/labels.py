@@ -0,0 +1,50 @@
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class TagMapping:
+    """Maps tag ids and tag names to label indices. The index of a tag is its position in the given lists."""
+    def __init__(self, tag_names, tag_ids=None):
+        self.tag_names = list(tag_names)
+        self.tag_ids = list(tag_ids) if tag_ids is not None else []
+        self._index_by_name = {name: i for i, name in enumerate(self.tag_names)}
+        self._index_by_id = {tag_id: i for i, tag_id in enumerate(self.tag_ids)}
+        self._unknown_labels = set()  # Label names that have been warned about.
+
+    def __len__(self):
+        return len(self.tag_names)
+
+    def has_id(self, tag_id):
+        return tag_id in self._index_by_id
+
+    def get_index_by_id(self, tag_id):
+        return self._index_by_id[tag_id]
+
+    def get_index_by_name(self, tag_name):
+        return self._index_by_name[tag_name]
+
+    def get_indices_by_ids(self, tag_ids):
+        return np.fromiter((self._index_by_id[t] for t in tag_ids), dtype=np.int64, count=len(tag_ids))
+
+    def get_indices_by_names(self, tag_names):
+        return np.fromiter((self._index_by_name[t] for t in tag_names), dtype=np.int64, count=len(tag_names))
+
+    def filter_predictions(self, predictions, by_name=False):
+        """Returns the predictions whose label_id (or label_name if by_name is True) is in the mapping.
+
+        A local model can predict labels that are not in the project tags. A warning is logged once for each of them.
+        """
+        key, known = ('label_name', self._index_by_name) if by_name else ('label_id', self._index_by_id)
+        known_predictions = [p for p in predictions if p[key] in known]
+        if len(known_predictions) < len(predictions):
+            for label_name in sorted({p['label_name'] for p in predictions if p[key] not in known} - self._unknown_labels):
+                logger.warning(f"Ignored the predictions of a label that is not in the project tags: {label_name}")
+                self._unknown_labels.add(label_name)
+        return known_predictions
+
+
+def to_pixel_boxes(boxes, width, height):
+    """Convert normalized boxes [[left, top, right, bottom], ...] to pixel coordinates. Returns a float array of shape (N, 4)."""
+    return np.asarray(boxes, dtype=np.float64).reshape(-1, 4) * np.array([width, height, width, height], dtype=np.float64)
@@ -0,0 +1,234 @@
+import atexit
+import bisect
+import collections
+import json
+import re
+import sys
+import threading
+import urllib.parse
+
+UUID_PATTERN = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+
+# Upper bounds of the latency histogram buckets in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf'))
+
+
+class EndpointStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.throttled = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.server_time_sum = 0.0
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+
+    def add(self, status_code, latency, server_time, bytes_sent, bytes_received):
+        self.count += 1
+        if status_code is None or status_code >= 400:
+            self.errors += 1
+        if status_code == 429:
+            self.throttled += 1
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+        self.latency_sum += latency
+        self.latency_max = max(self.latency_max, latency)
+        self.server_time_sum += server_time
+        self.latency_buckets[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+    def get_percentile(self, percentile):
+        """Estimates the latency percentile from the histogram, interpolating linearly inside a bucket."""
+        if not self.count:
+            return 0.0
+        rank = self.count * percentile / 100
+        accumulated = 0
+        for i, num in enumerate(self.latency_buckets):
+            if num and accumulated + num >= rank:
+                lower = LATENCY_BUCKETS[i - 1] if i > 0 else 0.0
+                upper = min(LATENCY_BUCKETS[i], self.latency_max)
+                return lower + (upper - lower) * (rank - accumulated) / num
+            accumulated += num
+        return self.latency_max
+
+    def to_dict(self):
+        return {'count': self.count,
+                'errors': self.errors,
+                'throttled': self.throttled,
+                'retries': self.retries,
+                'bytes_sent': self.bytes_sent,
+                'bytes_received': self.bytes_received,
+                'latency': {'mean': self.latency_sum / self.count if self.count else 0.0,
+                            'p50': self.get_percentile(50),
+                            'p95': self.get_percentile(95),
+                            'p99': self.get_percentile(99),
+                            'max': self.latency_max},
+                'server_time_sum': self.server_time_sum}
+
+
+class ConnectionPoolStats:
+    def __init__(self):
+        self.pool_size = 0
+        self.opened = 0
+        self.discarded = 0
+        self.max_in_use = 0
+
+    def to_dict(self):
+        return {'pool_size': self.pool_size,
+                'opened': self.opened,
+                'discarded': self.discarded,
+                'max_in_use': self.max_in_use,
+                'saturated': self.discarded > 0 or self.max_in_use >= self.pool_size}
+
+
+class RequestMetrics:
+    """Collects per-endpoint statistics of the HTTP requests.
+
+    Hooks are called with a dict for each request. The keys are client, endpoint, status_code, latency, server_time, bytes_sent and bytes_received.
+    latency is the total time of the request including the data transfer. server_time is the time until the response headers arrived.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hooks = []
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stats = collections.defaultdict(EndpointStats)
+            self._pools = collections.defaultdict(ConnectionPoolStats)
+
+    def add_hook(self, hook):
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self._hooks.remove(hook)
+
+    def record_request(self, client, method, url, status_code, latency, server_time=0.0, bytes_sent=0, bytes_received=0):
+        endpoint = get_endpoint_name(client, method, url)
+        with self._lock:
+            self._stats[(client, endpoint)].add(status_code, latency, server_time, bytes_sent, bytes_received)
+
+        if self._hooks:
+            event = {'client': client, 'endpoint': endpoint, 'status_code': status_code, 'latency': latency,
+                     'server_time': server_time, 'bytes_sent': bytes_sent, 'bytes_received': bytes_received}
+            for hook in self._hooks:
+                hook(event)
+
+    def record_retry(self, client, method, url):
+        endpoint = get_endpoint_name(client, method, url)
+        with self._lock:
+            self._stats[(client, endpoint)].retries += 1
+
+    def record_connection_opened(self, host):
+        with self._lock:
+            self._pools[host].opened += 1
+
+    def record_connection_acquired(self, host, num_in_use, pool_size):
+        with self._lock:
+            stats = self._pools[host]
+            stats.pool_size = pool_size
+            stats.max_in_use = max(stats.max_in_use, num_in_use)
+
+    def record_connection_discarded(self, host):
+        """A connection was closed because the pool was full. It means that the pool is too small for the concurrency."""
+        with self._lock:
+            self._pools[host].discarded += 1
+
+    def get_summary(self):
+        with self._lock:
+            summary = {client: {endpoint: stats.to_dict() for (c, endpoint), stats in sorted(self._stats.items()) if c == client}
+                       for client in sorted(set(c for c, _ in self._stats))}
+            if self._pools:
+                summary['connection_pools'] = {host: stats.to_dict() for host, stats in sorted(self._pools.items())}
+            return summary
+
+    def to_json(self):
+        return json.dumps(self.get_summary(), indent=2)
+
+    def to_prometheus(self):
+        lines = []
+        counters = [('requests_total', 'count'), ('request_errors_total', 'errors'), ('request_throttled_total', 'throttled'), ('request_retries_total', 'retries'),
+                    ('request_bytes_sent_total', 'bytes_sent'), ('request_bytes_received_total', 'bytes_received'), ('request_server_seconds_total', 'server_time_sum')]
+        with self._lock:
+            stats = sorted(self._stats.items())
+            for name, attribute in counters:
+                lines.append(f'# TYPE cvs_{name} counter')
+                for (client, endpoint), s in stats:
+                    lines.append(f'cvs_{name}{{{_get_labels(client, endpoint)}}} {getattr(s, attribute)}')
+
+            lines.append('# TYPE cvs_request_duration_seconds histogram')
+            for (client, endpoint), s in stats:
+                labels = _get_labels(client, endpoint)
+                accumulated = 0
+                for upper, num in zip(LATENCY_BUCKETS, s.latency_buckets):
+                    accumulated += num
+                    le = '+Inf' if upper == float('inf') else str(upper)
+                    lines.append(f'cvs_request_duration_seconds_bucket{{{labels},le="{le}"}} {accumulated}')
+                lines.append(f'cvs_request_duration_seconds_sum{{{labels}}} {s.latency_sum}')
+                lines.append(f'cvs_request_duration_seconds_count{{{labels}}} {s.count}')
+
+            pools = sorted(self._pools.items())
+            for name, attribute, metric_type in [('connections_opened_total', 'opened', 'counter'), ('connections_discarded_total', 'discarded', 'counter'),
+                                                 ('connection_pool_size', 'pool_size', 'gauge'), ('connection_pool_max_in_use', 'max_in_use', 'gauge')]:
+                lines.append(f'# TYPE cvs_{name} {metric_type}')
+                for host, s in pools:
+                    lines.append(f'cvs_{name}{{host="{host}"}} {getattr(s, attribute)}')
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, filepath):
+        """Write the metrics to the file. Prometheus text format is used if the extension is .prom. Otherwise JSON. '-' means stderr."""
+        if filepath == '-':
+            print(self.to_json(), file=sys.stderr)
+            return
+
+        text = self.to_prometheus() if filepath.endswith('.prom') else self.to_json()
+        with open(filepath, 'w') as f:
+            f.write(text)
+
+
+def get_endpoint_name(client, method, url):
+    """Returns a name that groups the requests. Ids in the path are replaced with {id}."""
+    parsed = urllib.parse.urlparse(url)
+    if client in ('image_download', 'model_download'):
+        # Image and model URLs are unique per file. Group them by the host.
+        return f'{method} {parsed.netloc}'
+    return f'{method} ' + UUID_PATTERN.sub('{id}', parsed.path)
+
+
+def _get_labels(client, endpoint):
+    endpoint = endpoint.replace('\\', '\\\\').replace('"', '\\"')
+    return f'client="{client}",endpoint="{endpoint}"'
+
+
+def record_response(client, method, url, response, latency):
+    """Records a requests.Response."""
+    metrics.record_request(client, method, url, response.status_code, latency, response.elapsed.total_seconds(),
+                           get_body_size(response.request.body), len(response.content))
+
+
+def get_body_size(body):
+    if body is None:
+        return 0
+    try:
+        return len(body)
+    except TypeError:
+        return 0  # Streaming body. The size is unknown.
+
+
+metrics = RequestMetrics()
+_dump_filepaths = set()
+_dump_at_exit_enabled = True
+
+
+def dump_at_exit(filepath):
+    if _dump_at_exit_enabled and filepath not in _dump_filepaths:
+        _dump_filepaths.add(filepath)
+        atexit.register(metrics.dump, filepath)
+
+
+def disable_dump_at_exit():
+    """Ignore dump_at_exit(). Used by the daemon, which dumps the metrics at the end of each command instead."""
+    global _dump_at_exit_enabled
+    _dump_at_exit_enabled = False
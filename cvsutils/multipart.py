@@ -0,0 +1,57 @@
+import bisect
+import io
+import itertools
+import uuid
+
+
+class MultipartEncoder(io.RawIOBase):
+    """A multipart/form-data body of binary files that is produced while it is read.
+
+    The files are bytes-like objects such as memoryviews of memory-mapped files. They are not copied into a single buffer,
+    so only a read chunk is in memory at a time. The length is known in advance so that Content-Length is sent.
+    The body is seekable so that a failed request can be retried.
+    """
+    def __init__(self, files, boundary=None):
+        """files: list of (name, binary). The file names are the same as the field names."""
+        self.boundary = boundary or uuid.uuid4().hex
+        self._segments = []
+        for name, binary in files:
+            self._segments.append(f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{name}"\r\n\r\n'.encode('utf-8'))
+            self._segments.append(memoryview(binary).cast('B'))
+            self._segments.append(b'\r\n')
+        self._segments.append(f'--{self.boundary}--\r\n'.encode('utf-8'))
+        self._starts = list(itertools.accumulate((len(s) for s in self._segments), initial=0))
+        self._position = 0
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return self._starts[-1]
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self)}[whence]
+        self._position = min(max(base + offset, 0), len(self))
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def readinto(self, buffer):
+        buffer = memoryview(buffer).cast('B')
+        written = 0
+        while written < len(buffer) and self._position < len(self):
+            index = bisect.bisect_right(self._starts, self._position) - 1
+            segment_offset = self._position - self._starts[index]
+            size = min(len(buffer) - written, len(self._segments[index]) - segment_offset)
+            buffer[written:written + size] = self._segments[index][segment_offset:segment_offset + size]
+            written += size
+            self._position += size
+        return written
@@ -0,0 +1,160 @@
+import io
+import os
+import zipfile
+import numpy as np
+import PIL.Image
+from .postprocess import non_max_suppression
+from .profiler import profiler
+
+# Anchors of the compact object detection models. Used only for the exports that output the raw feature map.
+YOLO_ANCHORS = np.array([[0.573, 0.677], [1.87, 2.06], [3.34, 5.47], [7.88, 3.53], [9.77, 9.17]])
+YOLO_PROB_THRESHOLD = 0.01
+YOLO_IOU_THRESHOLD = 0.45
+YOLO_MAX_DETECTIONS = 20
+DEFAULT_INPUT_SIZE = {'image_classification': (224, 224), 'object_detection': (416, 416)}
+
+
+class OnnxPredictionBackend:
+    """Runs an ONNX model exported by cvs_export_model on the local CPU.
+
+    model_filepath is the exported zip file, or a .onnx file with labels.txt in the same directory.
+    The outputs are in the same format as PredictionApi.predict(). label_id is taken from tag_ids {label_name: tag_id} and is None if missing.
+    """
+    def __init__(self, model_filepath, task_type, tag_ids=None, batch_size=16, num_threads=None):
+        if task_type not in ('image_classification', 'object_detection'):
+            raise ValueError(f"Unsupported task type: {task_type}. The task type must be image_classification or object_detection.")
+        try:
+            import onnxruntime
+        except ImportError:
+            raise RuntimeError("onnxruntime is required to run ONNX models. Please install it by 'pip install cvsutils[onnx]'.")
+
+        model, self.label_names = self._load_model(model_filepath)
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(model, options, providers=['CPUExecutionProvider'])
+        self.task_type = task_type
+        self.tag_ids = tag_ids or {}
+        self.batch_size = batch_size
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, height, width = model_input.shape
+        self.fixed_batch_size = batch if isinstance(batch, int) else None
+        self.input_size = (width, height) if isinstance(width, int) and isinstance(height, int) else DEFAULT_INPUT_SIZE[task_type]
+        self.output_names = [o.name for o in self.session.get_outputs()]
+
+        # The exported models have the expected pixel format in the metadata.
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.is_bgr = metadata.get('Image.BitmapPixelFormat', 'Bgr8') == 'Bgr8'
+        self.is_range255 = metadata.get('Image.NominalPixelRange', 'NominalRange_0_255') == 'NominalRange_0_255'
+
+    @staticmethod
+    def _load_model(model_filepath):
+        """Returns a tuple (model_binary, label_names)."""
+        if zipfile.is_zipfile(model_filepath):
+            with zipfile.ZipFile(model_filepath) as z:
+                names = z.namelist()
+                model_names = [n for n in names if n.endswith('.onnx')]
+                labels_names = [n for n in names if os.path.basename(n) == 'labels.txt']
+                if len(model_names) != 1 or not labels_names:
+                    raise RuntimeError(f"{model_filepath} must have a .onnx file and labels.txt. Found: {names}")
+                model = z.read(model_names[0])
+                labels = z.read(labels_names[0]).decode('utf-8')
+        else:
+            labels_filepath = os.path.join(os.path.dirname(model_filepath), 'labels.txt')
+            if not os.path.exists(labels_filepath):
+                raise RuntimeError(f"{labels_filepath} is not found.")
+            with open(model_filepath, 'rb') as f:
+                model = f.read()
+            with open(labels_filepath) as f:
+                labels = f.read()
+        return model, [line.strip() for line in labels.splitlines() if line.strip()]
+
+    def predict(self, image_binary):
+        return self.predict_batch([image_binary])[0]
+
+    @profiler.profile('OnnxPredictionBackend.predict_batch')
+    def predict_batch(self, image_binaries):
+        batch_size = self.fixed_batch_size or self.batch_size
+        results = []
+        for i in range(0, len(image_binaries), batch_size):
+            inputs = np.stack([self._preprocess(image_binary) for image_binary in image_binaries[i:i + batch_size]])
+            num_images = len(inputs)
+            if self.fixed_batch_size and num_images < batch_size:
+                inputs = np.concatenate([inputs, np.zeros((batch_size - num_images,) + inputs.shape[1:], dtype=inputs.dtype)])
+            with profiler.stage('onnxruntime'):
+                outputs = dict(zip(self.output_names, self.session.run(self.output_names, {self.input_name: inputs})))
+            results.extend(self._postprocess(outputs, num_images))
+        return results
+
+    def _preprocess(self, image_binary):
+        with PIL.Image.open(io.BytesIO(image_binary)) as image:
+            image = image.convert('RGB').resize(self.input_size, PIL.Image.BILINEAR)
+        array = np.asarray(image, dtype=np.float32).transpose((2, 0, 1))  # CHW
+        if self.is_bgr:
+            array = array[::-1]
+        if not self.is_range255:
+            array = array / 255
+        return np.ascontiguousarray(array)
+
+    def _postprocess(self, outputs, num_images):
+        if self.task_type == 'image_classification':
+            return [self._get_classification_result(probs) for probs in self._get_class_probabilities(outputs, num_images)]
+
+        if 'detected_boxes' in outputs:
+            boxes, label_ids, scores = outputs['detected_boxes'], outputs['detected_classes'], outputs['detected_scores']
+            return [self._get_detection_result(boxes[i], label_ids[i], scores[i]) for i in range(num_images)]
+
+        feature_maps = outputs[self.output_names[0]]
+        return [self._get_detection_result(*self._decode_yolo(feature_maps[i])) for i in range(num_images)]
+
+    def _get_class_probabilities(self, outputs, num_images):
+        for name in self.output_names:
+            value = outputs[name]
+            if isinstance(value, list) and value and isinstance(value[0], dict):
+                # Older exports output a sequence of {label_name: probability}.
+                return np.array([[v[label_name] for label_name in self.label_names] for v in value[:num_images]])
+            if isinstance(value, np.ndarray) and value.dtype.kind == 'f':
+                return value.reshape(len(value), -1)[:num_images]
+        raise RuntimeError(f"Unexpected outputs: {self.output_names}")
+
+    def _decode_yolo(self, feature_map):
+        """Decode a (num_anchors * (5 + num_classes), H, W) feature map. Returns boxes [x, y, x2, y2], label ids and scores."""
+        _, height, width = feature_map.shape
+        outputs = feature_map.transpose((1, 2, 0)).reshape((height, width, len(YOLO_ANCHORS), -1))
+
+        def sigmoid(x):
+            return 1 / (1 + np.exp(-x))
+
+        x = (sigmoid(outputs[..., 0]) + np.arange(width)[np.newaxis, :, np.newaxis]) / width
+        y = (sigmoid(outputs[..., 1]) + np.arange(height)[:, np.newaxis, np.newaxis]) / height
+        w = np.exp(outputs[..., 2]) * YOLO_ANCHORS[:, 0] / width
+        h = np.exp(outputs[..., 3]) * YOLO_ANCHORS[:, 1] / height
+        boxes = np.stack([x - w / 2, y - h / 2, x + w / 2, y + h / 2], axis=-1).reshape(-1, 4)
+
+        class_logits = outputs[..., 5:]
+        class_probs = np.exp(class_logits - class_logits.max(axis=-1, keepdims=True))
+        class_probs = (class_probs / class_probs.sum(axis=-1, keepdims=True) * sigmoid(outputs[..., 4:5])).reshape(len(boxes), -1)
+
+        label_ids = class_probs.argmax(axis=1)
+        scores = class_probs[np.arange(len(boxes)), label_ids]
+        selected = scores > YOLO_PROB_THRESHOLD
+        boxes, label_ids, scores = boxes[selected], label_ids[selected], scores[selected]
+        keep = non_max_suppression(boxes, scores, YOLO_IOU_THRESHOLD, label_ids, YOLO_MAX_DETECTIONS)
+        return boxes[keep], label_ids[keep], scores[keep]
+
+    def _get_classification_result(self, probs):
+        order = np.argsort(-probs, kind='stable')
+        return [self._make_prediction(int(i), probs[i]) for i in order]
+
+    def _get_detection_result(self, boxes, label_ids, scores):
+        boxes = np.clip(np.asarray(boxes, dtype=np.float64).reshape(-1, 4), 0, 1)
+        return [self._make_prediction(int(label_id), score, box) for box, label_id, score in zip(boxes, label_ids, scores)]
+
+    def _make_prediction(self, label_index, probability, box=None):
+        label_name = self.label_names[label_index]
+        prediction = {'label_id': self.tag_ids.get(label_name), 'label_name': label_name, 'probability': float(probability)}
+        if box is not None:
+            prediction.update({'left': float(box[0]), 'top': float(box[1]), 'right': float(box[2]), 'bottom': float(box[3])})
+        return prediction
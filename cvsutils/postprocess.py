@@ -0,0 +1,106 @@
+import numpy as np
+
+
+def box_iou(box, boxes):
+    """IoU between a box [x, y, x2, y2] and boxes of shape (N, 4)."""
+    width = np.clip(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0, None)
+    height = np.clip(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0, None)
+    intersection = width * height
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    union = area + areas - intersection
+    return np.where(union > 0, intersection / np.where(union > 0, union, 1), 0)
+
+
+def non_max_suppression(boxes, scores, iou_threshold, label_ids=None, max_detections=None):
+    """Returns the indices of the boxes to keep, sorted by descending scores.
+
+    If label_ids is given, boxes with different labels don't suppress each other.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float64)
+    if label_ids is None:
+        return _greedy_nms(boxes, scores, iou_threshold, max_detections)
+
+    # Run NMS for each label separately. It skips the comparisons between the boxes of different labels.
+    label_ids = np.asarray(label_ids)
+    order = np.argsort(label_ids, kind='stable')
+    groups = np.split(order, np.flatnonzero(np.diff(label_ids[order])) + 1)
+    keep = np.concatenate([np.empty(0, dtype=np.int64)] + [indices[_greedy_nms(boxes[indices], scores[indices], iou_threshold, max_detections)] for indices in groups if len(indices)])
+    return keep[np.lexsort((keep, -scores[keep]))][:max_detections]
+
+
+def _greedy_nms(boxes, scores, iou_threshold, max_detections):
+    order = np.argsort(-scores, kind='stable')
+    boxes = boxes[order]
+    suppressed = np.zeros(len(order), dtype=bool)
+    keep = []
+    for i in range(len(order)):
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        if len(keep) == max_detections:
+            break
+        suppressed[i + 1:] |= box_iou(boxes[i], boxes[i + 1:]) > iou_threshold
+    return order[np.array(keep, dtype=np.int64)]
+
+
+class PostProcessor:
+    """Filters the predictions of an image. The predictions are the lists of dicts returned by the prediction backends.
+
+    Applies the per-label probability thresholds, clips the boxes to the image, drops empty boxes, runs class-aware NMS
+    and keeps the max_detections most probable predictions. The result is sorted by descending probability.
+    """
+    def __init__(self, threshold=0.0, thresholds_per_label=None, iou_threshold=None, max_detections=None, clip_boxes=True):
+        self.threshold = threshold
+        self.thresholds_per_label = thresholds_per_label or {}
+        self.iou_threshold = iou_threshold
+        self.max_detections = max_detections
+        self.clip_boxes = clip_boxes
+
+    def __call__(self, predictions):
+        if not predictions:
+            return []
+
+        scores = np.array([p['probability'] for p in predictions], dtype=np.float64)
+        label_names, label_ids = np.unique([p['label_name'] for p in predictions], return_inverse=True)
+        thresholds = np.array([self._get_threshold(name) for name in label_names], dtype=np.float64)
+        mask = scores > thresholds[label_ids]
+
+        is_detection = 'left' in predictions[0]
+        if is_detection:
+            boxes = np.array([[p['left'], p['top'], p['right'], p['bottom']] for p in predictions], dtype=np.float64)
+            if self.clip_boxes:
+                boxes = np.clip(boxes, 0, 1)
+            mask &= (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+
+        indices = np.flatnonzero(mask)
+        if is_detection and self.iou_threshold is not None:
+            indices = indices[non_max_suppression(boxes[indices], scores[indices], self.iou_threshold, label_ids[indices], self.max_detections)]
+        else:
+            indices = indices[np.argsort(-scores[indices], kind='stable')][:self.max_detections]
+
+        if not (is_detection and self.clip_boxes):
+            return [predictions[i] for i in indices.tolist()]
+        boxes = boxes.tolist()
+        return [{**predictions[i], 'left': boxes[i][0], 'top': boxes[i][1], 'right': boxes[i][2], 'bottom': boxes[i][3]} for i in indices.tolist()]
+
+    def _get_threshold(self, label_name):
+        try:
+            return self.thresholds_per_label[label_name]  # May be a defaultdict.
+        except KeyError:
+            return self.threshold
+
+
+def add_postprocess_arguments(parser):
+    parser.add_argument('--iou_threshold', type=float, help="Merge overlapping boxes of the same label with NMS at this IoU threshold")
+    parser.add_argument('--max_detections', type=int, help="The max number of predictions per image")
+
+
+def validate_postprocess_arguments(parser, args):
+    """Report invalid values of the arguments added by add_postprocess_arguments() with parser.error()."""
+    if args.iou_threshold is not None and not (0 <= args.iou_threshold <= 1):
+        parser.error(f"iou_threshold must be in range [0, 1]. iou_threshold={args.iou_threshold}")
+
+    if args.max_detections is not None and args.max_detections < 1:
+        parser.error("max_detections must be a positive number.")
@@ -1,8 +1,20 @@
+import concurrent.futures
+import logging
+import time
 import urllib
 import uuid
 
-import requests
-import tenacity
+from .metrics import metrics, record_response
+from .profiler import profiler
+from .retry import retry_on_io_error
+from .transport import get_session
+
+logger = logging.getLogger(__name__)
+
+
+def _record_retry(retry_state):
+    # The arguments are (self, api_path, data)
+    metrics.record_retry('prediction', 'POST', retry_state.args[1])
 
 
 class PredictionApi:
@@ -11,8 +23,14 @@ class PredictionApi:
 
     def __init__(self, env):
         self.api_url = env.prediction_endpoint
-        self._session = requests.Session()
-        self._session.headers.update({'Prediction-Key': env.prediction_key, 'Content-Type': 'application/octet-stream'})
+        self._prediction_key = env.prediction_key
+        self._session_instance = None
+
+    @property
+    def _session(self):
+        if self._session_instance is None:
+            self._session_instance = get_session({'Prediction-Key': self._prediction_key, 'Content-Type': 'application/octet-stream'})
+        return self._session_instance
 
     def predict(self, project_id, task_type, name, image_binary):
         assert task_type in ['image_classification', 'object_detection']
@@ -36,12 +54,28 @@ class PredictionApi:
                  'label_name': r['tagName'],
                  'probability': r['probability']} for r in response['predictions']]
 
-    @tenacity.retry(retry=tenacity.retry_if_exception_type(IOError), stop=tenacity.stop_after_attempt(4), wait=tenacity.wait_exponential())
+    def predict_images(self, project_id, task_type, name, image_binaries, max_workers=8):
+        """Predict multiple images with concurrent requests. Returns the results in the same order as the images."""
+        if max_workers <= 1 or len(image_binaries) <= 1:
+            return [self.predict(project_id, task_type, name, image_binary) for image_binary in image_binaries]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(image_binaries))) as executor:
+            return list(executor.map(lambda image_binary: self.predict(project_id, task_type, name, image_binary), image_binaries))
+
+    @profiler.profile('PredictionApi._request')
+    @retry_on_io_error(before_sleep=_record_retry)
     def _request(self, api_path, data):
         url = urllib.parse.urljoin(self.api_url, api_path)
-        response = self._session.request('POST', url, data=data, timeout=60)
+        start = time.monotonic()
+        try:
+            response = self._session.request('POST', url, data=data, timeout=60)
+        except IOError:
+            metrics.record_request('prediction', 'POST', url, None, time.monotonic() - start)
+            raise
+
+        record_response('prediction', 'POST', url, response, time.monotonic() - start)
         if not response.ok:
-            print(response)
+            logger.error(f"Request failed: POST {api_path} status={response.status_code} response={response.text}")
 
         response.raise_for_status()
         return response.json()
@@ -0,0 +1,34 @@
+import contextlib
+from .common import with_published
+
+
+class CloudPredictionBackend:
+    """Sends prediction requests to a published iteration."""
+    def __init__(self, prediction_api, project_id, task_type, publish_name, max_workers=1):
+        self.prediction_api = prediction_api
+        self.project_id = project_id
+        self.task_type = task_type
+        self.publish_name = publish_name
+        self.max_workers = max_workers
+
+    def predict(self, image_binary):
+        return self.prediction_api.predict(self.project_id, self.task_type, self.publish_name, image_binary)
+
+    def predict_batch(self, image_binaries):
+        return self.prediction_api.predict_images(self.project_id, self.task_type, self.publish_name, image_binaries, self.max_workers)
+
+
+@contextlib.contextmanager
+def open_prediction_backend(training_api, prediction_api, iteration, task_type, onnx_model=None, max_workers=1, publish=True):
+    """Yields a prediction backend for the iteration. The iteration is published while the context is active unless onnx_model is given.
+
+    max_workers is the number of concurrent requests in predict_batch() of the cloud backend.
+    If publish is False, the iteration must be published already. See with_published().
+    """
+    if onnx_model:
+        from .onnx_backend import OnnxPredictionBackend
+        tag_ids = dict(training_api.get_tags(iteration['project_id'], iteration['id']))
+        yield OnnxPredictionBackend(onnx_model, task_type, tag_ids)
+    else:
+        with with_published(training_api, iteration, publish) as publish_name:
+            yield CloudPredictionBackend(prediction_api, iteration['project_id'], task_type, publish_name, max_workers)
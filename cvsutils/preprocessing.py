@@ -0,0 +1,80 @@
+import io
+import PIL.Image
+import PIL.ImageOps
+
+EXIF_ORIENTATION_TAG = 0x0112
+
+
+def _transform_point(orientation, x, y, width, height):
+    """Map a point on the raw image to the image after applying the EXIF orientation."""
+    if orientation == 2:
+        return width - x, y
+    elif orientation == 3:
+        return width - x, height - y
+    elif orientation == 4:
+        return x, height - y
+    elif orientation == 5:
+        return y, x
+    elif orientation == 6:
+        return height - y, x
+    elif orientation == 7:
+        return height - y, width - x
+    elif orientation == 8:
+        return y, width - x
+    return x, y
+
+
+def transform_boxes(boxes, orientation, width, height, scale):
+    """Apply the EXIF orientation and the scale to bounding boxes [[label, x, y, x2, y2], ...] on a width x height image."""
+    new_width, new_height = (height, width) if orientation in (5, 6, 7, 8) else (width, height)
+    new_width, new_height = max(1, round(new_width * scale)), max(1, round(new_height * scale))
+
+    new_boxes = []
+    for label, x, y, x2, y2 in boxes:
+        x, y = _transform_point(orientation, x, y, width, height)
+        x2, y2 = _transform_point(orientation, x2, y2, width, height)
+        x, x2 = sorted((round(x * scale), round(x2 * scale)))
+        y, y2 = sorted((round(y * scale), round(y2 * scale)))
+        # Keep at least 1 pixel so that the box stays valid after rounding.
+        x, y = min(x, new_width - 1), min(y, new_height - 1)
+        new_boxes.append([label, x, y, min(max(x2, x + 1), new_width), min(max(y2, y + 1), new_height)])
+    return new_boxes
+
+
+class ImagePreprocessor:
+    """Downscales images to max_side, applies the EXIF orientation and strips EXIF by re-encoding.
+
+    Images without alpha channel are re-encoded as JPEG. Images that are already small enough and have no EXIF are returned as is.
+    Instances are picklable so that they can be used with a process pool.
+    """
+    def __init__(self, dataset_type, max_side, jpeg_quality=90):
+        assert dataset_type in ('image_classification', 'object_detection')
+        assert max_side > 0
+        self.dataset_type = dataset_type
+        self.max_side = max_side
+        self.jpeg_quality = jpeg_quality
+
+    def __call__(self, image_and_labels):
+        """Returns a tuple (image_binary, labels)."""
+        image_binary, labels = image_and_labels
+        with PIL.Image.open(io.BytesIO(image_binary)) as image:
+            width, height = image.size
+            exif = image.getexif()
+            orientation = exif.get(EXIF_ORIENTATION_TAG, 1)
+            scale = min(1.0, self.max_side / max(width, height))
+            if scale == 1.0 and not exif and 'exif' not in image.info:
+                return image_binary, labels
+
+            image = PIL.ImageOps.exif_transpose(image)
+            if scale < 1.0:
+                image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), PIL.Image.LANCZOS)
+
+            output = io.BytesIO()
+            if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+                image.save(output, format='PNG', optimize=True)
+            else:
+                image.convert('RGB').save(output, format='JPEG', quality=self.jpeg_quality)
+
+        if self.dataset_type == 'object_detection':
+            labels = transform_boxes(labels, orientation, width, height, scale)
+        return output.getvalue(), labels
@@ -0,0 +1,116 @@
+import collections
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+
+
+class Profiler:
+    """Measures wall-clock time spent in each pipeline stage. Does nothing unless enabled.
+
+    Stages can be nested. The time of a nested stage is counted in both the inner and the outer stage.
+    """
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._stats = collections.defaultdict(lambda: [0, 0.0])  # name => [count, total_seconds]
+        self._trace_events = None
+
+    def start(self, record_trace=False):
+        self.enabled = True
+        self._stats.clear()
+        self._trace_events = [] if record_trace else None
+        self._start_time = time.perf_counter()
+
+    def reset(self):
+        self.enabled = False
+        self._stats.clear()
+        self._trace_events = None
+
+    def stop(self):
+        self.enabled = False
+        self._wall_time = time.perf_counter() - self._start_time
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(name, start, time.perf_counter())
+
+    def profile(self, name):
+        """Decorator to measure a function as a stage."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self._add(name, start, time.perf_counter())
+            return wrapper
+        return decorator
+
+    def _add(self, name, start, end):
+        with self._lock:
+            stats = self._stats[name]
+            stats[0] += 1
+            stats[1] += end - start
+            if self._trace_events is not None:
+                self._trace_events.append({'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                                           'ts': (start - self._start_time) * 1e6, 'dur': (end - start) * 1e6})
+
+    def print_report(self):
+        print(f"Profile (wall time: {self._wall_time:.3f}s)")
+        print(f"{'Stage':<48s} {'Count':>8s} {'Total(s)':>10s} {'Mean(ms)':>10s} {'Wall%':>7s}")
+        for name, (count, total) in sorted(self._stats.items(), key=lambda x: -x[1][1]):
+            print(f"{name:<48s} {count:>8d} {total:>10.3f} {total / count * 1000:>10.3f} {total / self._wall_time * 100:>6.1f}%")
+
+    def write_trace(self, filepath):
+        with open(filepath, 'w') as f:
+            json.dump({'traceEvents': self._trace_events}, f)
+
+
+profiler = Profiler()
+
+
+def add_profile_arguments(parser):
+    parser.add_argument('--profile', action='store_true', help="Print a breakdown of the time spent in each stage")
+    parser.add_argument('--profile_output', help="Write a cProfile result (*.prof) or a Chrome trace (*.json) file. Implies --profile.")
+
+
+@contextlib.contextmanager
+def profile_command(args):
+    """Profile the command if requested by the arguments added by add_profile_arguments()."""
+    if not (args.profile or args.profile_output):
+        yield
+        return
+
+    output = args.profile_output
+    cprofile = cProfile.Profile() if output and output.endswith('.prof') else None
+    profiler.start(record_trace=bool(output) and not cprofile)
+    if cprofile:
+        cprofile.enable()
+    try:
+        yield
+    finally:
+        if cprofile:
+            cprofile.disable()
+        profiler.stop()
+        profiler.print_report()
+        if cprofile:
+            cprofile.dump_stats(output)
+            print(f"Saved the cProfile result to {output}")
+        elif output:
+            profiler.write_trace(output)
+            print(f"Saved the trace to {output}")
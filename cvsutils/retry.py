@@ -0,0 +1,21 @@
+import functools
+
+
+def retry_on_io_error(before_sleep=None, reraise=False):
+    """Retries the decorated function up to 4 times on IOError with exponential backoff.
+
+    tenacity is imported on the first call so that the commands answered without a request don't load it.
+    """
+    def decorator(func):
+        retrying = None
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            nonlocal retrying
+            if retrying is None:
+                import tenacity
+                retrying = tenacity.retry(reraise=reraise, retry=tenacity.retry_if_exception_type(IOError), stop=tenacity.stop_after_attempt(4), wait=tenacity.wait_exponential(),
+                                          before_sleep=before_sleep)(func)
+            return retrying(*args, **kwargs)
+        return wrapper
+    return decorator
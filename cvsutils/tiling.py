@@ -0,0 +1,108 @@
+import contextlib
+import io
+import warnings
+import numpy as np
+import PIL.Image
+from .common import compress_image_if_needed_for_prediction
+from .postprocess import non_max_suppression
+from .profiler import profiler
+
+# Tiling is meant for very large images such as aerial photos. Larger images are rejected as decompression bombs.
+DEFAULT_MAX_IMAGE_PIXELS = 1_000_000_000
+
+
+def get_tile_offsets(length, tile_size, overlap):
+    """Returns the start offsets of the tiles that cover [0, length). The last tile is aligned to the end."""
+    if length <= tile_size:
+        return [0]
+    offsets = list(range(0, length - tile_size, tile_size - overlap))
+    return offsets + [length - tile_size]
+
+
+def get_tiles(width, height, tile_size, overlap):
+    """Returns a list of tiles (x, y, x2, y2) in pixels that cover the image."""
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+            for y in get_tile_offsets(height, tile_size, overlap) for x in get_tile_offsets(width, tile_size, overlap)]
+
+
+@contextlib.contextmanager
+def allow_large_images(max_image_pixels):
+    """Raise PIL's decompression bomb limit to max_image_pixels while the context is active.
+
+    PIL warns above its limit and fails above twice of it. The limit is process-wide, so it is restored when the context exits.
+    """
+    saved_max_image_pixels = PIL.Image.MAX_IMAGE_PIXELS
+    PIL.Image.MAX_IMAGE_PIXELS = max_image_pixels // 2
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', PIL.Image.DecompressionBombWarning)
+            yield
+    finally:
+        PIL.Image.MAX_IMAGE_PIXELS = saved_max_image_pixels
+
+
+class TiledPredictionBackend:
+    """Splits large images into overlapping tiles and predicts the tiles with another backend.
+
+    The boxes are mapped back to the full image and the duplicates in the overlapping areas are merged with class-aware NMS.
+    Images that fit in a tile are sent as is. Only for object detection. Images up to max_image_pixels can be split.
+    """
+    def __init__(self, backend, tile_size, overlap, iou_threshold=0.5, max_image_pixels=DEFAULT_MAX_IMAGE_PIXELS):
+        assert 0 <= overlap < tile_size
+        self.backend = backend
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.iou_threshold = iou_threshold
+        self.max_image_pixels = max_image_pixels
+
+    def predict(self, image_binary):
+        return self.predict_batch([image_binary])[0]
+
+    def predict_batch(self, image_binaries):
+        # Send the tiles of all images at once so that the backend can run them concurrently.
+        tile_images = []
+        tiles_per_image = []
+        for image_binary in image_binaries:
+            tiles, binaries = self._split(image_binary)
+            tiles_per_image.append(tiles)
+            tile_images.extend(binaries)
+
+        tile_results = iter(self.backend.predict_batch(tile_images))
+        return [self._merge(tiles, [next(tile_results) for _ in tiles]) for tiles in tiles_per_image]
+
+    @profiler.profile('TiledPredictionBackend._split')
+    def _split(self, image_binary):
+        """Returns normalized tiles [(x, y, x2, y2), ...] and the image binaries of the tiles."""
+        with allow_large_images(self.max_image_pixels), PIL.Image.open(io.BytesIO(image_binary)) as image:
+            width, height = image.size
+            if width <= self.tile_size and height <= self.tile_size:
+                return [(0.0, 0.0, 1.0, 1.0)], [compress_image_if_needed_for_prediction(image_binary)]
+
+            image = image.convert('RGB')
+            tiles = []
+            binaries = []
+            for x, y, x2, y2 in get_tiles(width, height, self.tile_size, self.overlap):
+                output = io.BytesIO()
+                image.crop((x, y, x2, y2)).save(output, format='JPEG', quality=95)
+                binaries.append(compress_image_if_needed_for_prediction(output.getvalue()))
+                tiles.append((x / width, y / height, x2 / width, y2 / height))
+        return tiles, binaries
+
+    def _merge(self, tiles, tile_results):
+        predictions = [p for results in tile_results for p in results]
+        if len(tiles) == 1 or not predictions:
+            return predictions
+
+        # Map the boxes from the tile coordinates to the image coordinates.
+        tile_boxes = np.repeat(np.array(tiles, dtype=np.float64), [len(results) for results in tile_results], axis=0)
+        boxes = np.array([[p['left'], p['top'], p['right'], p['bottom']] for p in predictions], dtype=np.float64)
+        tile_width, tile_height = tile_boxes[:, 2] - tile_boxes[:, 0], tile_boxes[:, 3] - tile_boxes[:, 1]
+        boxes[:, [0, 2]] = tile_boxes[:, [0]] + boxes[:, [0, 2]] * tile_width[:, np.newaxis]
+        boxes[:, [1, 3]] = tile_boxes[:, [1]] + boxes[:, [1, 3]] * tile_height[:, np.newaxis]
+
+        label_indices = {name: i for i, name in enumerate(sorted({p['label_name'] for p in predictions}))}
+        label_ids = np.array([label_indices[p['label_name']] for p in predictions])
+        scores = np.array([p['probability'] for p in predictions])
+        keep = non_max_suppression(boxes, scores, self.iou_threshold, label_ids).tolist()
+        boxes = boxes.tolist()
+        return [{**predictions[i], 'left': boxes[i][0], 'top': boxes[i][1], 'right': boxes[i][2], 'bottom': boxes[i][3]} for i in keep]
@@ -1,7 +1,20 @@
+import logging
+import time
 import urllib.parse
 import uuid
-import requests
-import tenacity
+from .cache import get_default_cache
+from .metrics import metrics, record_response
+from .multipart import MultipartEncoder
+from .profiler import profiler
+from .retry import retry_on_io_error
+from .transport import get_session
+
+logger = logging.getLogger(__name__)
+
+
+def _record_retry(retry_state):
+    # The arguments are (self, method, api_path, ...)
+    metrics.record_retry('training', retry_state.args[1], retry_state.args[2])
 
 
 class TrainingApi:
@@ -28,11 +41,22 @@ class TrainingApi:
     EXPORT_API = ITERATION_API + '/export'
     DOMAIN_API = '/customvision/v3.2/training/domains/{domain_id}'
 
-    def __init__(self, env):
+    # Seconds to keep the read results in the metadata cache.
+    CACHE_TTLS = {'project': 300, 'tags': 300, 'iteration': 60, 'domain': 86400, 'domains': 86400}
+
+    def __init__(self, env, cache=None, cache_ttls=None):
         self.env = env
         self.api_url = env.training_endpoint
-        self._session = requests.Session()
-        self._session.headers.update({'Training-Key': env.training_key})
+        self._session_instance = None
+        self._cache = cache if cache is not None else get_default_cache(env.cache_type)
+        self._cache_ttls = {**self.CACHE_TTLS, **(cache_ttls or {})}
+
+    @property
+    def _session(self):
+        # The session is created on the first request so that the results in the cache are returned without loading requests.
+        if self._session_instance is None:
+            self._session_instance = get_session({'Training-Key': self.env.training_key})
+        return self._session_instance
 
     def train(self, project_id, force, domain_id=None, classification_type=None, export_capability=None):
         assert (not classification_type) or classification_type in ['multilabel', 'multiclass']
@@ -54,6 +78,7 @@ class TrainingApi:
                 updated = True
             if updated:
                 self._request('PATCH', url, json=response)
+                self._invalidate_cache('project', project_id)
 
         url = self.TRAIN_PROJECT_API.format(project_id=project_id)
         params = {'forceTrain': force}
@@ -70,15 +95,18 @@ class TrainingApi:
 
     def create_image(self, project_id, image_binary):
         url = self.CREATE_IMAGE_API.format(project_id=project_id)
-        response = self._request('POST', url, files={'files[0]': image_binary})
+        body = MultipartEncoder([('files[0]', image_binary)])
+        response = self._request('POST', url, data=body, headers={'Content-Type': body.content_type})
         return uuid.UUID(response['images'][0]['image']['id'])
 
     def create_images(self, project_id, image_binary_list):
+        """Upload the images in a request. The binaries can be memoryviews of memory-mapped files. They are streamed without being copied."""
         assert isinstance(project_id, uuid.UUID)
         assert isinstance(image_binary_list, list)
 
         url = self.CREATE_IMAGE_API.format(project_id=project_id)
-        response = self._request('POST', url, files={str(i): binary for i, binary in enumerate(image_binary_list)})
+        body = MultipartEncoder([(str(i), binary) for i, binary in enumerate(image_binary_list)])
+        response = self._request('POST', url, data=body, headers={'Content-Type': body.content_type})
         sorted_images = sorted(response['images'], key=lambda i: int(i['sourceUrl'].replace('"', '')))
         return [uuid.UUID(response_image['image']['id']) for response_image in sorted_images]
 
@@ -86,6 +114,7 @@ class TrainingApi:
         url = self.TAG_API.format(project_id=project_id)
         params = {'name': tag_name}
         response = self._request('POST', url, params)
+        self._invalidate_cache('tags', project_id, None)
         return uuid.UUID(response['id'])
 
     def export_iteration(self, project_id, iteration_id, platform, flavor):
@@ -108,6 +137,10 @@ class TrainingApi:
         return None
 
     def get_iteration(self, project_id, iteration_id):
+        iteration = self._cache.get(self._get_cache_key('iteration', project_id, iteration_id))
+        if iteration:
+            return iteration
+
         url = self.ITERATION_API.format(project_id=project_id, iteration_id=iteration_id)
         response = self._request('GET', url)
         if response['classificationType'] == 'Multiclass':
@@ -117,12 +150,17 @@ class TrainingApi:
         else:
             task_type = 'object_detection'
 
-        return {'id': iteration_id,
-                'project_id': project_id,
-                'status': response['status'],
-                'publish_name': response['publishName'],
-                'domain_id': uuid.UUID(response['domainId']) if response['domainId'] else None,
-                'task_type': task_type}
+        iteration = {'id': iteration_id,
+                     'project_id': project_id,
+                     'status': response['status'],
+                     'publish_name': response['publishName'],
+                     'domain_id': uuid.UUID(response['domainId']) if response['domainId'] else None,
+                     'task_type': task_type}
+
+        # The status of a training iteration changes on the server side. Cache only completed ones.
+        if iteration['status'] == 'Completed':
+            self._cache.set(self._get_cache_key('iteration', project_id, iteration_id), iteration, self._cache_ttls['iteration'])
+        return iteration
 
     def get_iterations(self, project_id):
         url = self.ITERATIONS_API.format(project_id=project_id)
@@ -143,15 +181,17 @@ class TrainingApi:
                 'average_precision': response['averagePrecision']}
 
     def get_project(self, project_id):
-        url = self.PROJECT_API.format(project_id=project_id)
+        def get():
+            url = self.PROJECT_API.format(project_id=project_id)
+            response = self._request('GET', url)
+            return {
+                'name': response['name'],
+                'description': response['description'],
+                'domain_id': uuid.UUID(response['settings']['domainId']),
+                'created_at': response['created']
+            }
 
-        response = self._request('GET', url)
-        return {
-            'name': response['name'],
-            'description': response['description'],
-            'domain_id': uuid.UUID(response['settings']['domainId']),
-            'created_at': response['created']
-        }
+        return self._get_cached('project', (project_id,), get)
 
     def get_projects(self):
         response = self._request('GET', self.CREATE_PROJECT_API)
@@ -162,10 +202,13 @@ class TrainingApi:
 
     def get_tags(self, project_id, iteration_id=None):
         """Get a list of pairs of (tag_name, tag_id). The returned list is sorted by tag_name."""
-        url = self.TAG_API.format(project_id=project_id)
-        params = {'iterationId': str(iteration_id)} if iteration_id else {}
-        response = self._request('GET', url, params)
-        return [(t['name'], uuid.UUID(t['id'])) for t in response]
+        def get():
+            url = self.TAG_API.format(project_id=project_id)
+            params = {'iterationId': str(iteration_id)} if iteration_id else {}
+            response = self._request('GET', url, params)
+            return [(t['name'], uuid.UUID(t['id'])) for t in response]
+
+        return self._get_cached('tags', (project_id, iteration_id), get)
 
     def get_images(self, project_id):
         url = self.TAGGED_IMAGES_COUNT_API.format(project_id=project_id)
@@ -216,20 +259,15 @@ class TrainingApi:
         return results
 
     def get_domain(self, domain_id):
-        url = self.DOMAIN_API.format(domain_id=domain_id)
-
-        response = self._request('GET', url)
-        if response['type'] == 'Classification':
-            domain_type = 'image_classification'
-        elif response['type'] == 'ObjectDetection':
-            domain_type = 'object_detection'
-        else:
-            raise RuntimeError(f"Unknown domain type: {response['type']}")
+        def get():
+            url = self.DOMAIN_API.format(domain_id=domain_id)
+            response = self._request('GET', url)
+            return {
+                'name': response['name'],
+                'type': self._map_domain_type(response['type']),
+            }
 
-        return {
-            'name': response['name'],
-            'type': domain_type,
-        }
+        return self._get_cached('domain', (domain_id,), get)
 
     @staticmethod
     def _map_domain_type(domain_type):
@@ -241,8 +279,11 @@ class TrainingApi:
             raise RuntimeError(f"Unknown domain type: {domain_type}")
 
     def get_domains(self):
-        response = self._request('GET', self.DOMAINS_API)
-        return [{'id': r['id'], 'name': r['name'], 'type': self._map_domain_type(r['type'])} for r in response]
+        def get():
+            response = self._request('GET', self.DOMAINS_API)
+            return [{'id': r['id'], 'name': r['name'], 'type': self._map_domain_type(r['type'])} for r in response]
+
+        return self._get_cached('domains', (), get)
 
     def publish_iteration(self, project_id, iteration_id, publish_name):
         url = self.ITERATION_PUBLISH_API.format(project_id=project_id, iteration_id=iteration_id)
@@ -251,15 +292,18 @@ class TrainingApi:
 
         # This API doesn't have response body.
         self._request('POST', url, params=params, raw_response=True)
+        self._invalidate_cache('iteration', project_id, iteration_id)
 
     def unpublish_iteration(self, project_id, iteration_id):
         url = self.ITERATION_PUBLISH_API.format(project_id=project_id, iteration_id=iteration_id)
         # This API doesn't have response body.
         self._request('DELETE', url, raw_response=True)
+        self._invalidate_cache('iteration', project_id, iteration_id)
 
     def remove_iteration(self, project_id, iteration_id):
         url = self.ITERATION_API.format(project_id=project_id, iteration_id=iteration_id)
         self._request('DELETE', url)
+        self._invalidate_cache('iteration', project_id, iteration_id)
 
     def set_image_classification_tags(self, project_id, image_tag_ids):
         assert isinstance(project_id, uuid.UUID)
@@ -302,14 +346,39 @@ class TrainingApi:
     def remove_project(self, project_id):
         raise NotImplementedError
 
-    @tenacity.retry(retry=tenacity.retry_if_exception_type(IOError), stop=tenacity.stop_after_attempt(4), wait=tenacity.wait_exponential())
-    def _request(self, method, api_path, params=None, data=None, files=None, json=None, raw_response=False):
+    def _get_cache_key(self, resource, *args):
+        # The training key is a part of the key since different accounts can share the same endpoint.
+        return '|'.join([self.api_url, self.env.training_key, resource] + [str(a) for a in args])
+
+    def _get_cached(self, resource, args, get_func):
+        key = self._get_cache_key(resource, *args)
+        value = self._cache.get(key)
+        if value is None:
+            value = get_func()
+            self._cache.set(key, value, self._cache_ttls[resource])
+        return value
+
+    def _invalidate_cache(self, resource, *args):
+        self._cache.delete(self._get_cache_key(resource, *args))
+
+    @profiler.profile('TrainingApi._request')
+    @retry_on_io_error(before_sleep=_record_retry)
+    def _request(self, method, api_path, params=None, data=None, files=None, json=None, headers=None, raw_response=False):
         assert method in ['GET', 'POST', 'PATCH', 'DELETE']
 
         url = urllib.parse.urljoin(self.api_url, api_path)
-        response = self._session.request(method, url, params=params, data=data, json=json, files=files, timeout=60)
+        if hasattr(data, 'seek'):
+            data.seek(0)  # A streamed body is read again when the request is retried.
+        start = time.monotonic()
+        try:
+            response = self._session.request(method, url, params=params, data=data, json=json, files=files, headers=headers, timeout=60)
+        except IOError:
+            metrics.record_request('training', method, url, None, time.monotonic() - start)
+            raise
+
+        record_response('training', method, url, response, time.monotonic() - start)
         if not response.ok:
-            print(response.json())
+            logger.error(f"Request failed: {method} {api_path} status={response.status_code} response={response.text}")
 
         response.raise_for_status()
         if raw_response:
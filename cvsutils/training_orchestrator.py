@@ -0,0 +1,129 @@
+import concurrent.futures
+import heapq
+import random
+import threading
+import time
+
+
+class RateLimiter:
+    """Limits the number of calls per second. The limit is shared among threads."""
+    def __init__(self, calls_per_second):
+        assert calls_per_second > 0
+        self._interval = 1.0 / calls_per_second
+        self._next_time = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self._interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+class TrainingOrchestrator:
+    """Trains multiple projects at once and waits for all of them with a single polling scheduler.
+
+    The polling interval of each iteration starts from min_poll_interval and grows by backoff_factor up to max_poll_interval.
+    Some jitter is added to the intervals so that the requests for the projects started together are spread out.
+    Transient polling errors are retried up to max_poll_errors times in a row. Other errors fail the iteration immediately.
+    """
+    def __init__(self, training_api, max_workers=8, calls_per_second=5, min_poll_interval=5, max_poll_interval=60, backoff_factor=1.5, max_poll_errors=5):
+        self.training_api = training_api
+        self.max_workers = max_workers
+        self.max_poll_errors = max_poll_errors
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.backoff_factor = backoff_factor
+        self._rate_limiter = RateLimiter(calls_per_second)
+
+    def train(self, project_ids, force, domain_id=None, classification_type=None, export_capability=None, callback=None):
+        """Start training on the projects and wait for them.
+
+        Returns a list of result dicts in the same order as project_ids. callback is called with each result as soon as it is available.
+        """
+        results = [{'project_id': project_id, 'iteration_id': None, 'status': None, 'training_time': None, 'error': None} for project_id in project_ids]
+
+        def start(result):
+            self._rate_limiter.wait()
+            try:
+                result['iteration_id'] = self.training_api.train(result['project_id'], force, domain_id, classification_type, export_capability)
+                result['start_time'] = time.time()
+            except Exception as e:
+                result['status'] = 'FailedToStart'
+                result['error'] = str(e)
+                if callback:
+                    callback(result)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(start, results))
+
+        self._wait(results, callback)
+        for result in results:
+            result.pop('start_time', None)
+        return results
+
+    def _wait(self, results, callback):
+        num_errors = [0] * len(results)  # Consecutive polling errors for each result.
+        queue = []  # (next_poll_time, result_index, interval)
+        for i, result in enumerate(results):
+            if result['iteration_id']:
+                heapq.heappush(queue, (time.monotonic() + self._jitter(self.min_poll_interval), i, self.min_poll_interval))
+
+        while queue:
+            next_poll_time, i, interval = heapq.heappop(queue)
+            sleep_time = next_poll_time - time.monotonic()
+            if sleep_time > 0:
+                time.sleep(sleep_time)
+
+            result = results[i]
+            self._rate_limiter.wait()
+            try:
+                status = self.training_api.get_iteration(result['project_id'], result['iteration_id'])['status']
+                num_errors[i] = 0
+                error = None
+            except Exception as e:
+                e = self._unwrap_retry_error(e)
+                num_errors[i] += 1
+                error = str(e)
+                # Try again later if the error is transient.
+                status = 'Training' if self._is_transient_error(e) and num_errors[i] < self.max_poll_errors else 'Failed'
+
+            if status == 'Training':
+                interval = min(self.max_poll_interval, interval * self.backoff_factor)
+                heapq.heappush(queue, (time.monotonic() + self._jitter(interval), i, interval))
+                continue
+
+            result['status'] = status
+            result['error'] = error
+            result['training_time'] = time.time() - result['start_time']
+            if status == 'Completed':
+                self._rate_limiter.wait()
+                try:
+                    result.update(self.training_api.get_iteration_eval(result['project_id'], result['iteration_id']))
+                except Exception as e:
+                    result['error'] = f"Failed to get the evaluation result: {e}"
+
+            if callback:
+                callback(result)
+
+    @staticmethod
+    def _unwrap_retry_error(error):
+        """The API clients raise tenacity.RetryError after their own retries. Returns the error of the last attempt."""
+        last_attempt = getattr(error, 'last_attempt', None)
+        if last_attempt is not None and last_attempt.failed:
+            return last_attempt.exception()
+        return error
+
+    @staticmethod
+    def _is_transient_error(error):
+        """Connection errors, throttling and server errors are transient. HTTPError is a subclass of IOError."""
+        response = getattr(error, 'response', None)
+        if response is not None:
+            return response.status_code == 429 or response.status_code >= 500
+        return isinstance(error, IOError)
+
+    @staticmethod
+    def _jitter(interval):
+        return interval * random.uniform(0.8, 1.2)
@@ -0,0 +1,44 @@
+import os
+import threading
+
+DEFAULT_POOL_SIZE = 32  # Connections kept alive per host. Larger than the default concurrency of the commands.
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_pool_sizes():
+    """Returns the default pool size and a dict {host: pool size}.
+
+    CVS_POOL_SIZE sets the default size. CVS_POOL_SIZES overrides it per host, e.g. "southcentralus.api.cognitive.microsoft.com=64,example.blob.core.windows.net=128".
+    """
+    default_size = int(os.getenv('CVS_POOL_SIZE', DEFAULT_POOL_SIZE))
+    host_sizes = {}
+    for entry in os.getenv('CVS_POOL_SIZES', '').split(','):
+        if entry.strip():
+            host, size = entry.rsplit('=', 1)
+            host_sizes[host.strip()] = int(size)
+    return default_size, host_sizes
+
+
+def get_session(headers=None):
+    """Returns a requests.Session shared in the process for the given default headers.
+
+    API clients created one after another reuse the same session, so that the connections are kept alive between them.
+    The connection pools are sized by get_pool_sizes() and report their usage to the request metrics.
+    """
+    key = tuple(sorted((headers or {}).items()))
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            import requests
+            from .connection_pool import TrackedHTTPAdapter
+            session = requests.Session()
+            session.headers.update(headers or {})
+            default_size, host_sizes = get_pool_sizes()
+            for scheme in ('http://', 'https://'):
+                session.mount(scheme, TrackedHTTPAdapter(pool_maxsize=default_size))
+                for host, size in host_sizes.items():
+                    session.mount(f'{scheme}{host}/', TrackedHTTPAdapter(pool_maxsize=size))
+            _sessions[key] = session
+    return session
@@ -10,7 +10,8 @@ setuptools.setup(name='cvsutils',
                  long_description_content_type='text/markdown',
                  packages=setuptools.find_packages(),
                  license='MIT',
-                 install_requires=['tqdm', 'Pillow', 'requests', 'tenacity'],
+                 install_requires=['numpy', 'tqdm', 'Pillow', 'requests', 'tenacity'],
+                 extras_require={'onnx': ['onnxruntime']},
                  url='https://github.com/shonohs/cvsutils',
                  classifiers=[
                      'Intended Audience :: Developers',
@@ -18,14 +19,18 @@ setuptools.setup(name='cvsutils',
                  ],
                  entry_points={
                      'console_scripts': [
+                         'cvs=cvsutils.cli:main',
                          'cvs_add_images=cvsutils.commands.add_images:main',
                          'cvs_create_project=cvsutils.commands.create_project:main',
+                         'cvs_daemon=cvsutils.commands.daemon:main',
+                         'cvs_convert_dataset=cvsutils.commands.convert_dataset:main',
                          'cvs_download_predictions=cvsutils.commands.download_predictions:main',
                          'cvs_download_project=cvsutils.commands.download_project:main',
                          'cvs_evaluate_project=cvsutils.commands.evaluate_project:main',
                          'cvs_export_model=cvsutils.commands.export_model:main',
                          'cvs_get_domains=cvsutils.commands.get_domains:main',
                          'cvs_list_projects=cvsutils.commands.list_projects:main',
+                         'cvs_merge_datasets=cvsutils.commands.merge_datasets:main',
                          'cvs_predict_dataset=cvsutils.commands.predict_dataset:main',
                          'cvs_predict_image=cvsutils.commands.predict_image:main',
                          'cvs_show_project=cvsutils.commands.show_project:main',